@@ -0,0 +1 @@
+"""Бенчмарки клиента. Запуск из корня проекта: python -m benchmarks.<имя>"""
@@ -0,0 +1,39 @@
+"""
+Время добавления одной записи в зависимости от размера файла.
+Каждое добавление выполняется с холодным кэшем, как в новом процессе
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import generate
+from main import BudgetTracker
+
+
+SIZES = [10, 1_000, 100_000, 1_000_000]
+REPEAT = 200
+
+
+def bench(rows: int) -> float:
+    """Среднее время добавления записи в микросекундах"""
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        BudgetTracker._storage().invalidate()
+        BudgetTracker._append_transaction(
+            '01.01.2024', 'расход', 1000, 'Бенчмарк')
+    return (time.perf_counter() - started) / REPEAT * 1e6
+
+
+def main() -> None:
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    with tempfile.TemporaryDirectory() as tmp:
+        BudgetTracker.DATABASE = os.path.join(tmp, 'database.csv')
+        print(f"{'rows':>12} | {'add, мкс':>10}")
+        for rows in sizes:
+            generate(BudgetTracker.DATABASE, rows)
+            print(f'{rows:>12} | {bench(rows):>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
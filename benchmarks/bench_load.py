@@ -0,0 +1,46 @@
+"""
+Скорость первой загрузки csv-файла (холодный balance) в зависимости от
+числа процессов чтения. Результат - записей в секунду
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import generate
+from storage import CsvStorage
+
+
+ROWS = 1_000_000
+WORKERS = [1, 2, 4, 8]
+
+
+def bench(path: str, workers: int) -> float:
+    """Время полного чтения файла в секундах"""
+    storage = CsvStorage(path)
+    storage.workers = workers
+    # Порог отключаем, чтобы и небольшой файл читался параллельно
+    storage.PARALLEL_MIN_SIZE = 0
+    started = time.perf_counter()
+    storage.read()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'database.csv')
+        generate(path, rows)
+        size = os.path.getsize(path)
+        print(f'rows: {rows}, {size / 2**20:.0f} МиБ, '
+              f'ядер: {os.cpu_count()}')
+        single = None
+        for workers in WORKERS:
+            seconds = bench(path, workers)
+            single = single or seconds
+            print(f'workers {workers}: {rows / seconds:12,.0f} записей/с, '
+                  f'{seconds:6.2f} с, x{single / seconds:.1f}')
+
+
+if __name__ == '__main__':
+    main()
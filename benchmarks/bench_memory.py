@@ -0,0 +1,61 @@
+"""
+Память под записи ledger в прежнем виде (словари с Decimal и date) и в
+колоночном Ledger. Измеряется через tracemalloc после загрузки файла
+"""
+from decimal import Decimal
+import datetime
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.generator import generate
+from main import BudgetTracker
+
+
+ROWS = 1_000_000
+
+
+def load_dicts(path: str) -> list:
+    """Загрузка в словари, как это делал прежний _get_all_data"""
+    with open(path, 'r', encoding='UTF-8') as f:
+        data = f.read().splitlines()
+    data_list = []
+    for param in map(lambda x: x.split(','), data[1:]):
+        day, month, year = map(int, param[1].split('.'))
+        data_list.append(
+            {'id': int(param[0]), 'date': datetime.date(year, month, day),
+             'category': param[2], 'amount': Decimal(param[3]),
+             'description': param[4], 'balance': Decimal(param[5])})
+    return data_list
+
+
+def measure(load) -> int:
+    """Объём памяти, занятой результатом load(), в байтах"""
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    with tempfile.TemporaryDirectory() as tmp:
+        BudgetTracker.DATABASE = os.path.join(tmp, 'database.csv')
+        generate(BudgetTracker.DATABASE, rows)
+
+        dicts = measure(lambda: load_dicts(BudgetTracker.DATABASE))
+        ledger = measure(BudgetTracker._storage().read)
+
+    print(f'rows: {rows}')
+    print(f'dict:   {dicts / 2**20:8.1f} МиБ, {dicts / rows:6.1f} Б/запись')
+    print(f'Ledger: {ledger / 2**20:8.1f} МиБ, {ledger / rows:6.1f} Б/запись')
+    print(f'x{dicts / ledger:.1f}')
+
+
+if __name__ == '__main__':
+    main()
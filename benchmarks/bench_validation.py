@@ -0,0 +1,98 @@
+"""
+Время проверки и разбора одного значения: прежняя проверка (re.match
+с шаблоном-строкой и datetime на каждое значение, затем разбор
+parse_date/parse_cents), скомпилированные check_* по одному значению и
+check_dates/check_amounts/check_categories по столбцу целиком.
+Запуск: python -m benchmarks.bench_validation [значений]
+"""
+from typing import Callable, List
+import datetime
+import random
+import re
+import sys
+import time
+
+from ledger import Category, format_cents, format_date, parse_cents, parse_date
+from validation import (
+    check_amount, check_amounts, check_categories, check_category,
+    check_date, check_dates)
+
+
+ROWS = 100_000
+REPEAT = 5
+
+
+def validate_date(date: str) -> bool:
+    """Прежняя проверка даты из BudgetTracker"""
+    date_regex = r'^(0[1-9]|[12][0-9]|3[01])\.(0[1-9]|1[012])\.\d{4}$'
+    if not re.match(date_regex, date):
+        return False
+    day, month, year = map(int, date.split('.'))
+    try:
+        datetime.datetime(year, month, day)
+    except ValueError:
+        return False
+    return True
+
+
+def validate_amount(amount: str) -> bool:
+    """Прежняя проверка суммы из BudgetTracker"""
+    amount_regex = r'^\d+(\.\d+)?$'
+    return bool(re.match(amount_regex, amount))
+
+
+def columns(rows: int) -> tuple:
+    """Столбцы дат, сумм и категорий, как в файле импорта"""
+    rng = random.Random(0)
+    start: int = datetime.date(2020, 1, 1).toordinal()
+    dates: List[str] = [format_date(start + i * 1000 // rows)
+                        for i in range(rows)]
+    amounts: List[str] = [format_cents(rng.randrange(1, 10**7))
+                          for _ in range(rows)]
+    categories: List[str] = [rng.choice(('доход', 'расход'))
+                             for _ in range(rows)]
+    return dates, amounts, categories
+
+
+def best(run: Callable[[], object]) -> float:
+    """Лучшее время из REPEAT повторов, секунд"""
+    times: List[float] = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def main() -> None:
+    rows: int = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    dates, amounts, categories = columns(rows)
+
+    cases = {
+        'date': (
+            lambda: [parse_date(value) for value in dates
+                     if validate_date(value)],
+            lambda: [check_date(value) for value in dates],
+            lambda: check_dates(dates)),
+        'amount': (
+            lambda: [parse_cents(value) for value in amounts
+                     if validate_amount(value)],
+            lambda: [check_amount(value) for value in amounts],
+            lambda: check_amounts(amounts)),
+        'category': (
+            lambda: [Category.parse(value) for value in categories
+                     if value == 'доход' or value == 'расход'],
+            lambda: [check_category(value) for value in categories],
+            lambda: check_categories(categories)),
+    }
+    print(f"{'поле':>10} | {'было, нс':>10} | {'check_*, нс':>12} | "
+          f"{'столбец, нс':>12} | {'ускорение':>9}")
+    for name, (old, single, column) in cases.items():
+        before, after, batch = (
+            best(run) / rows * 1e9 for run in (old, single, column))
+        print(f'{name:>10} | {before:>10.0f} | {after:>12.0f} | '
+              f'{batch:>12.0f} | {before / batch:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Детерминированный генератор файлов database.csv заданного размера.
+Запуск: python -m benchmarks.generator <записей> <файл> [seed]
+"""
+import csv
+import datetime
+import random
+import sys
+
+from ledger import format_cents
+
+
+DESCRIPTIONS = [
+    'Зарплата', 'Продукты', 'Билет в театр', 'Кофе', 'Такси',
+    'Аренда', 'Подарок', 'Кино', 'Лотерейный билет', 'Из воздуха',
+]
+
+
+def generate(path: str, rows: int, seed: int = 0) -> None:
+    """
+    Записывает в path ledger из rows записей в формате database.csv.
+    Суммы считаются в копейках, чтобы файлы до 1e7 записей
+    создавались за разумное время
+    """
+    rnd = random.Random(seed)
+    date = datetime.date(2000, 1, 1)
+    day = date.strftime('%d.%m.%Y')
+    balance = 0
+    # Несколько записей в день, но не больше ста лет на весь файл
+    next_day = min(0.3, 36500 / max(rows, 1))
+
+    with open(path, 'w', encoding='UTF-8') as file:
+        writer = csv.writer(file)
+        writer.writerow([
+            'id', 'date', 'category', 'amount', 'description', 'balance'])
+        for id_ in range(1, rows + 1):
+            # Даты не убывают
+            if rnd.random() < next_day:
+                date += datetime.timedelta(days=1)
+                day = date.strftime('%d.%m.%Y')
+            category = 'доход' if rnd.random() < 0.4 else 'расход'
+            amount = rnd.randint(1, 5000000)
+            balance += amount if category == 'доход' else -amount
+            writer.writerow([
+                id_, day, category, format_cents(amount),
+                rnd.choice(DESCRIPTIONS), format_cents(balance)])
+
+
+if __name__ == '__main__':
+    generate(sys.argv[2], int(sys.argv[1]),
+             int(sys.argv[3]) if len(sys.argv) > 3 else 0)
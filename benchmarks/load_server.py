@@ -0,0 +1,121 @@
+"""
+Нагрузка на сервер кошелька: запускает python main.py serve на
+сгенерированном файле, открывает несколько соединений и шлёт запросы
+чтения и записи. Выводит запросы в секунду и задержки, затем проверяет,
+что id и баланс записей согласованы.
+Запуск: python -m benchmarks.load_server [записей] [соединений] [запросов]
+"""
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import generate
+from benchmarks.stress_writers import check
+from storage import open_storage
+
+
+ROWS = 100_000
+CLIENTS = 16
+REQUESTS = 500
+# Доля запросов add, остальные - чтение
+WRITE_SHARE = 0.2
+
+READS = [
+    'balance --tail 1',
+    'balance --at 15.06.2001',
+    'search -c доход --limit 5',
+    'search -d 01.01.2001..31.01.2001 -a 100..500 --limit 5',
+    'report --by year',
+]
+
+
+async def client(port: int, number: int, requests: int,
+                 latencies: dict) -> None:
+    """Одно соединение: requests запросов подряд"""
+    rnd = random.Random(number)
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for i in range(requests):
+        if rnd.random() < WRITE_SHARE:
+            kind = 'add'
+            command = (f'add --date 01.01.2024 --category доход '
+                       f'--amount {rnd.randint(1, 1000)} --desc '
+                       f'"клиент {number}"')
+        else:
+            kind = 'read'
+            command = rnd.choice(READS)
+        started = time.perf_counter()
+        writer.write(json.dumps(
+            {'id': i, 'command': command}).encode('UTF-8') + b'\n')
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies[kind].append(time.perf_counter() - started)
+        if 'error' in response or response['id'] != i:
+            raise RuntimeError(f'{command}: {response}')
+    writer.close()
+    await writer.wait_closed()
+
+
+def percentile(values: list, share: float) -> float:
+    """Значение, меньше которого доля share значений, в миллисекундах"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] * 1000
+
+
+async def load(port: int, clients: int, requests: int) -> dict:
+    latencies = {'read': [], 'add': []}
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client(port, number, requests, latencies)
+        for number in range(clients)))
+    latencies['seconds'] = time.perf_counter() - started
+    return latencies
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else CLIENTS
+    requests = int(sys.argv[3]) if len(sys.argv) > 3 else REQUESTS
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'database.csv')
+        generate(path, rows)
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(root, 'main.py'),
+             '--database', path, 'serve', '--port', '0'],
+            stdout=subprocess.PIPE, text=True, encoding='UTF-8')
+        try:
+            # Сервер печатает адрес, когда записи загружены
+            line = server.stdout.readline()
+            port = int(line.split(',')[0].rsplit(':', 1)[1])
+            result = asyncio.run(load(port, clients, requests))
+        finally:
+            server.terminate()
+            server.wait()
+
+        storage = open_storage(path)
+        errors = check(storage.load())
+        storage.close()
+
+    total = clients * requests
+    print(f'rows: {rows}, соединений: {clients}, запросов: {total}')
+    print(f'{total / result["seconds"]:,.0f} запросов/с')
+    for kind in ('read', 'add'):
+        values = result[kind]
+        if values:
+            print(f'{kind:5}: {len(values):6} шт., '
+                  f'p50 {percentile(values, 0.5):7.3f} мс, '
+                  f'p99 {percentile(values, 0.99):7.3f} мс')
+    print('без ошибок' if not errors else f'ошибок: {len(errors)}')
+    for error in errors[:10]:
+        print(f'  {error}')
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Нагрузочная проверка одновременной записи: N процессов добавляют записи
+в одно хранилище, после чего проверяется, что id идут подряд без повторов,
+а баланс каждой записи равен сумме всех записей до неё включительно.
+Запуск: python -m benchmarks.stress_writers [процессов] [записей]
+[csv|sqlite|partitioned]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from ledger import Category, Ledger, Transaction, parse_date
+from storage import open_storage
+
+
+PROCESSES = 8
+ROWS = 200
+
+
+def write(path: str, kind: str, number: int, rows: int) -> None:
+    """Добавляет rows записей по одной, как отдельные вызовы add"""
+    storage = open_storage(path, kind)
+    date = parse_date('01.01.2024')
+    for i in range(rows):
+        category = Category.INCOME if i % 3 else Category.EXPENSE
+        storage.append(Transaction(
+            0, date, category, 100 + number, f'процесс {number}', 0))
+        # Половина записей - с кэшем в памяти, половина - с холодным
+        if i % 2:
+            storage.invalidate()
+    storage.close()
+
+
+def check(data: Ledger) -> list:
+    """Список нарушений: повторы и пропуски id, неверный баланс"""
+    errors = []
+    balance = 0
+    for position, trans in enumerate(data):
+        balance += trans.signed_amount
+        if trans.id != position + 1:
+            errors.append(f'позиция {position}: id {trans.id}')
+        if trans.balance != balance:
+            errors.append(f'id {trans.id}: баланс {trans.balance}, '
+                          f'ожидался {balance}')
+    return errors
+
+
+def main() -> None:
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else PROCESSES
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else ROWS
+    kinds = sys.argv[3:] or ['csv', 'sqlite']
+    failed = False
+    for kind in kinds:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(
+                tmp, {'sqlite': 'database.db',
+                      'partitioned': 'database.parts'}.get(
+                    kind, 'database.csv'))
+            started = time.perf_counter()
+            workers = [
+                multiprocessing.Process(
+                    target=write, args=(path, kind, number, rows))
+                for number in range(processes)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            seconds = time.perf_counter() - started
+
+            storage = open_storage(path, kind)
+            data = storage.load()
+            errors = check(data)
+            expected = processes * rows
+            if len(data) != expected:
+                errors.insert(0, f'записей {len(data)}, ожидалось {expected}')
+            storage.close()
+
+        print(f'{kind}: {processes} процессов x {rows} записей, '
+              f'{expected / seconds:,.0f} записей/с, '
+              f'{"ошибок: " + str(len(errors)) if errors else "без ошибок"}')
+        for error in errors[:10]:
+            print(f'  {error}')
+        failed = failed or bool(errors)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
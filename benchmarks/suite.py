@@ -0,0 +1,237 @@
+"""
+Набор бенчмарков клиента: время и память основных операций на
+сгенерированных ledger разного размера. Вопросы пользователю (add, patch,
+уточнение фильтра поиска) получают заранее заданные ответы.
+Результат выводится в JSON, чтобы сравнивать версии между собой.
+Запуск: python -m benchmarks.suite [записей ...] [--repeat N]
+[--budget секунд] [--output файл.json] [--compare прошлый.json]
+"""
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+import argparse
+import builtins
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.generator import generate
+from ledger import Ledger, format_date
+from main import BudgetTracker
+
+
+SIZES = [1_000, 100_000, 1_000_000]
+# Повторов одного случая не больше REPEAT и не дольше BUDGET секунд,
+# но хотя бы один
+REPEAT = 20
+BUDGET = 2.0
+
+
+@contextlib.contextmanager
+def scripted_input(answers: Iterable[str]) -> Iterator[None]:
+    """
+    Ответы на вопросы input() по порядку; сообщения клиента, которые он
+    печатает между вопросами, не выводятся
+    """
+    answers = iter(answers)
+    original = builtins.input
+    builtins.input = lambda prompt='': next(answers)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        builtins.input = original
+
+
+def consume(result: str | Iterable[str] | None) -> None:
+    """Формирует вывод команды целиком, как это делает печать"""
+    if result is not None and not isinstance(result, str):
+        for _ in result:
+            pass
+
+
+def cases(data: Ledger) -> List[Tuple[str, Callable[[], None],
+                                      Callable[[], None] | None]]:
+    """
+    Случаи бенчмарка: (имя, выполнение, подготовка). Подготовка
+    выполняется перед каждым повтором и в замер не входит
+    """
+    invalidate = BudgetTracker._storage().invalidate
+    rows = len(data)
+    middle_date = format_date(data[rows // 2].date)
+    last_date = format_date(data[-1].date)
+
+    def run_filter(option: str | None, value: str | None,
+                   answers: Iterable[str] = ()) -> Callable[[], None]:
+        def run() -> None:
+            with scripted_input(answers):
+                BudgetTracker._filter_transactions(
+                    BudgetTracker._get_all_data(), option, value)
+        return run
+
+    def run_add() -> None:
+        with scripted_input(
+                [last_date, 'расход', '10.00', 'Бенчмарк']):
+            BudgetTracker.add_transaction()
+
+    def run_patch(index: int) -> Callable[[], None]:
+        # Сумма меняется при каждом повторе, иначе запись не изменится
+        amounts = itertools.cycle(['1.00', '2.00'])
+
+        def run() -> None:
+            data = BudgetTracker._get_all_data()
+            with scripted_input(
+                    [str(data[index].id), '', '', next(amounts), '']):
+                BudgetTracker.patch_transaction()
+        return run
+
+    return [
+        ('load_cold', BudgetTracker._get_all_data, invalidate),
+        ('load_warm', BudgetTracker._get_all_data, None),
+        ('balance', lambda: consume(BudgetTracker.balance()), None),
+        ('balance_tail',
+         lambda: consume(BudgetTracker.balance(tail=20)), None),
+        ('filter_category', run_filter('-c', 'доход'), None),
+        ('filter_date', run_filter('-d', middle_date), None),
+        ('filter_date_range',
+         run_filter('-d', f'{middle_date}..{last_date}'), None),
+        ('filter_amount', run_filter('-a', '100.00'), None),
+        ('filter_amount_range', run_filter('-a', '100..500'), None),
+        ('filter_text', run_filter('-t', 'театр'), None),
+        ('filter_prompt',
+         run_filter(None, None, ['категория', 'расход']), None),
+        ('add_transaction', run_add, None),
+        ('patch_head', run_patch(0), None),
+        ('patch_middle', run_patch(rows // 2), None),
+        ('patch_tail', run_patch(-1), None),
+    ]
+
+
+def timings(run: Callable[[], None], setup: Callable[[], None] | None,
+            repeat: int, budget: float) -> List[float]:
+    """Время каждого повтора в секундах"""
+    times: List[float] = []
+    deadline = time.perf_counter() + budget
+    while not times or (len(times) < repeat
+                        and time.perf_counter() < deadline):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def peak_memory(run: Callable[[], None],
+                setup: Callable[[], None] | None) -> int:
+    """Пиковый объём памяти, выделенной за одно выполнение, в байтах"""
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def bench(rows: int, repeat: int, budget: float) -> List[Dict]:
+    """Результаты всех случаев на ledger из rows записей"""
+    results: List[Dict] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        BudgetTracker.configure('csv', os.path.join(tmp, 'database.csv'))
+        BudgetTracker.INTERACTIVE = True
+        generate(BudgetTracker.DATABASE, rows)
+        data: Ledger = BudgetTracker._get_all_data()
+        for name, run, setup in cases(data):
+            times = timings(run, setup, repeat, budget)
+            results.append({
+                'rows': rows,
+                'case': name,
+                'repeat': len(times),
+                'min': min(times),
+                'median': statistics.median(times),
+                'mean': statistics.fmean(times),
+                'peak_bytes': peak_memory(run, setup),
+            })
+            print(f'{rows:>10} {name:20} {min(times) * 1000:12.3f} мс',
+                  file=sys.stderr)
+        BudgetTracker._storage().close()
+        BudgetTracker._storages.clear()
+    return results
+
+
+def revision() -> str | None:
+    """Коммит, на котором запущен бенчмарк, если это git-репозиторий"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: Dict, path: str) -> None:
+    """Печатает отношение времени к прошлому отчёту: больше 1 - медленнее"""
+    with open(path, 'r', encoding='UTF-8') as file:
+        previous: Dict[Tuple[int, str], Dict] = {
+            (result['rows'], result['case']): result
+            for result in json.load(file)['results']}
+    for result in report['results']:
+        old = previous.get((result['rows'], result['case']))
+        if old is None:
+            continue
+        memory = result['peak_bytes'] / max(old['peak_bytes'], 1)
+        print(f"{result['rows']:>10} {result['case']:20} "
+              f"время x{result['min'] / old['min']:6.2f}, "
+              f"память x{memory:6.2f}", file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Бенчмарки кошелька, результат - JSON')
+    parser.add_argument('sizes', nargs='*', type=int, default=SIZES,
+                        help='размеры ledger, записей')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--budget', type=float, default=BUDGET,
+                        help='секунд на повторы одного случая')
+    parser.add_argument('--output', help='файл для JSON, иначе stdout')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='прошлый отчёт для сравнения')
+    args = parser.parse_args()
+
+    report: Dict = {
+        'meta': {
+            'revision': revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'started': datetime.datetime.now().isoformat(
+                timespec='seconds'),
+        },
+        'results': [
+            result for rows in args.sizes
+            for result in bench(rows, args.repeat, args.budget)],
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
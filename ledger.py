@@ -0,0 +1,228 @@
+"""Компактное представление записей в памяти"""
+from typing import Callable, Dict, Iterator, List
+from array import array
+from decimal import Decimal
+from enum import IntEnum
+import datetime
+
+
+class Category(IntEnum):
+    """Категория записи, в колонке хранится одним байтом"""
+    INCOME = 0
+    EXPENSE = 1
+
+    @property
+    def label(self) -> str:
+        """Название категории, как оно записано в файле"""
+        return CATEGORY_LABELS[self]
+
+    @classmethod
+    def parse(cls, label: str) -> 'Category':
+        """Категория по названию: доход/расход"""
+        return _CATEGORY_BY_LABEL[label]
+
+
+CATEGORY_LABELS = ('доход', 'расход')
+_CATEGORY_BY_LABEL: Dict[str, Category] = {
+    label: Category(code) for code, label in enumerate(CATEGORY_LABELS)}
+_CATEGORIES = tuple(Category)
+
+
+def parse_cents(value: str) -> int:
+    """Сумма из строки вида 123.45 в копейках"""
+    whole, _, fraction = value.partition('.')
+    if len(fraction) <= 2:
+        sign = -1 if whole.startswith('-') else 1
+        return sign * (abs(int(whole or 0)) * 100
+                       + int(fraction.ljust(2, '0')))
+    # Больше двух знаков после точки - округляем как round(Decimal, 2)
+    return int(round(Decimal(value), 2) * 100)
+
+
+def format_cents(cents: int) -> str:
+    """Сумма в копейках в виде строки 123.45"""
+    sign = '-' if cents < 0 else ''
+    whole, fraction = divmod(abs(cents), 100)
+    return f'{sign}{whole}.{fraction:02d}'
+
+
+def parse_date(value: str) -> int:
+    """
+    Дата дд.мм.гггг в виде порядкового номера дня. Формат фиксированный,
+    поэтому поля берутся срезами по известным позициям
+    """
+    if len(value) != 10 or value[2] != '.' or value[5] != '.':
+        raise ValueError(f'Дата не в формате дд.мм.гггг: {value!r}')
+    return datetime.date(
+        int(value[6:]), int(value[3:5]), int(value[:2])).toordinal()
+
+
+def date_parser() -> Callable[[str], int]:
+    """
+    parse_date с запоминанием результатов: в файле одна и та же дата
+    повторяется во многих записях подряд
+    """
+    dates: Dict[str, int] = {}
+
+    def parse(value: str) -> int:
+        date: int | None = dates.get(value)
+        if date is None:
+            date = dates[value] = parse_date(value)
+        return date
+    return parse
+
+
+def format_date(ordinal: int) -> str:
+    """Порядковый номер дня в виде даты дд.мм.гггг"""
+    return datetime.date.fromordinal(ordinal).strftime('%d.%m.%Y')
+
+
+def month_of(ordinal: int) -> int:
+    """Номер месяца для сводок: год * 12 + (месяц - 1)"""
+    date = datetime.date.fromordinal(ordinal)
+    return date.year * 12 + date.month - 1
+
+
+def format_month(key: int) -> str:
+    """Номер месяца в виде мм.гггг"""
+    year, month = divmod(key, 12)
+    return f'{month + 1:02d}.{year:04d}'
+
+
+class Transaction:
+    """
+    Запись о транзакции. Сумма и баланс хранятся в копейках, дата - в виде
+    порядкового номера дня (date.toordinal())
+    """
+    __slots__ = (
+        'id', 'date', 'category', 'amount', 'description', 'balance')
+
+    def __init__(self, id: int, date: int, category: Category, amount: int,
+                 description: str, balance: int) -> None:
+        self.id = id
+        self.date = date
+        self.category = category
+        self.amount = amount
+        self.description = description
+        self.balance = balance
+
+    @property
+    def signed_amount(self) -> int:
+        """Изменение баланса: доход прибавляется, расход вычитается"""
+        return (self.amount if self.category == Category.INCOME
+                else -self.amount)
+
+    def _fields(self) -> tuple:
+        return (self.id, self.date, self.category, self.amount,
+                self.description, self.balance)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Transaction):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __repr__(self) -> str:
+        return (f'Transaction(id={self.id}, date={format_date(self.date)}, '
+                f'category={self.category.label}, '
+                f'amount={format_cents(self.amount)}, '
+                f'description={self.description!r}, '
+                f'balance={format_cents(self.balance)})')
+
+
+class Ledger:
+    """
+    Все записи файла в виде колонок: числа в массивах array, категории в
+    bytearray, описания в списке строк (повторяющиеся описания хранятся
+    одной строкой). Объект Transaction создаётся только при обращении к
+    конкретной записи
+    """
+
+    def __init__(self) -> None:
+        self.ids = array('q')
+        self.dates = array('i')
+        self.categories = bytearray()
+        self.amounts = array('q')
+        self.descriptions: List[str] = []
+        self.balances = array('q')
+        self._strings: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: int) -> Transaction:
+        return Transaction(
+            self.ids[index], self.dates[index],
+            _CATEGORIES[self.categories[index]], self.amounts[index],
+            self.descriptions[index], self.balances[index])
+
+    def __setitem__(self, index: int, trans: Transaction) -> None:
+        self.ids[index] = trans.id
+        self.dates[index] = trans.date
+        self.categories[index] = trans.category
+        self.amounts[index] = trans.amount
+        self.descriptions[index] = self._strings.setdefault(
+            trans.description, trans.description)
+        self.balances[index] = trans.balance
+
+    def __iter__(self) -> Iterator[Transaction]:
+        return self.rows()
+
+    def rows(self, start: int = 0) -> Iterator[Transaction]:
+        """Записи начиная с позиции start"""
+        for index in range(start, len(self)):
+            yield self[index]
+
+    def append_row(self, id: int, date: int, category: int, amount: int,
+                   description: str, balance: int) -> None:
+        """Добавляет запись по значениям полей"""
+        self.ids.append(id)
+        self.dates.append(date)
+        self.categories.append(category)
+        self.amounts.append(amount)
+        self.descriptions.append(
+            self._strings.setdefault(description, description))
+        self.balances.append(balance)
+
+    def extend(self, other: 'Ledger') -> None:
+        """Добавляет в конец все записи другого Ledger"""
+        self.ids.extend(other.ids)
+        self.dates.extend(other.dates)
+        self.categories.extend(other.categories)
+        self.amounts.extend(other.amounts)
+        strings = self._strings
+        self.descriptions.extend(
+            strings.setdefault(description, description)
+            for description in other.descriptions)
+        self.balances.extend(other.balances)
+
+    def __getstate__(self) -> dict:
+        # Словарь для повторяющихся описаний не передаём между процессами:
+        # pickle и так сохраняет одинаковые строки один раз
+        state = self.__dict__.copy()
+        del state['_strings']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._strings = {
+            description: description for description in self.descriptions}
+
+    def append(self, trans: Transaction) -> None:
+        self.append_row(trans.id, trans.date, trans.category, trans.amount,
+                        trans.description, trans.balance)
+
+    def shift_balances(self, start: int, delta: int) -> None:
+        """Сдвигает баланс всех записей начиная с позиции start"""
+        balances = self.balances
+        for index in range(start, len(balances)):
+            balances[index] += delta
+
+    def find(self, id_: int) -> int | None:
+        """Позиция записи с данным id или None"""
+        # id выдаются подряд, поэтому запись обычно лежит на месте id - 1
+        if 0 < id_ <= len(self.ids) and self.ids[id_ - 1] == id_:
+            return id_ - 1
+        try:
+            return self.ids.index(id_)
+        except ValueError:
+            return None
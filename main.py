@@ -1,25 +1,153 @@
-from typing import List, Dict, Any, Literal
-import datetime
-from decimal import Decimal
-import re
+from typing import (
+    List, Dict, Any, Callable, Iterable, Iterator, Literal, NoReturn,
+    Sequence, TextIO, Tuple)
+import argparse
+import concurrent.futures
 import csv
+import itertools
+import json
+import re
+import os
+import shlex
+import sqlite3
 import sys
 
+from ledger import (
+    Category, Ledger, Transaction, format_cents, format_date, format_month,
+    month_of, parse_date)
+from storage import (
+    STORAGES, PartitionedStorage, Storage, open_storage, storage_kind,
+    summarize)
+from validation import (
+    check_amount, check_amounts, check_categories, check_category,
+    check_date, check_dates, check_month, check_year)
+
+
+class CommandError(Exception):
+    """Ошибка в параметрах команды"""
+
+
+class CommandParser(argparse.ArgumentParser):
+    """
+    Разбор параметров команды клиента. Об ошибке сообщает исключением
+    CommandError, а не завершением программы
+    """
+
+    def error(self, message: str) -> NoReturn:
+        raise CommandError(message)
+
+    def command_names(self) -> List[str]:
+        """Имена всех команд"""
+        return list(self._subparsers._group_actions[0].choices)
+
 
 class BudgetTracker:
     """Основной класс клиента"""
 
     COMMANDS = [
         ('help', 'Показать список всех команд и их описания'),
-        ('balance', 'Показать ваш баланс и список транзакций'),
-        ('add', 'Добавить транзакцию'),
-        ('patch', 'Изменить транзакцию'),
+        ('balance',
+         'Показать ваш баланс и список транзакций\n'
+         '"--limit N", "--offset N" - страница вывода, '
+         '"--tail N" - последние N строк\n'
+         '"--at дд.мм.гггг" - баланс на конец указанного дня\n'
+         '"--all" - записи, доходы, расходы и баланс всех кошельков'),
+        ('add',
+         'Добавить транзакцию\n'
+         'значения можно передать сразу: --date, --category, --amount, '
+         '--desc'),
+        ('patch',
+         'Изменить транзакцию\n'
+         'или без вопросов: --id и изменяемые поля, как у add'),
         ('search',
-         '"-c" - категория, "-d" - дата, "-a" - сумма\n'
-         'поиск транзакции по категории, дате или сумме'),
+         '"-c" - категория, "-d" - дата, "-a" - сумма, "-t" - текст\n'
+         'поиск транзакции по категории, дате, сумме или части описания\n'
+         'дата и сумма принимают диапазон: -d 01.01.2024..31.03.2024\n'
+         'фильтры можно сочетать: -c расход -a 100..500\n'
+         '"--limit", "--offset", "--tail" - как у balance'),
+        ('report',
+         'Сводка доходов и расходов по периодам\n'
+         '"--by day|month|year" - период (по умолчанию month), '
+         '"--from", "--to" - границы: дд.мм.гггг, мм.гггг или гггг\n'
+         '"--all" - сводка по всем кошелькам вместе'),
+        ('use [кошелёк]',
+         'Перейти в кошелёк (создаётся при первой записи), без имени - '
+         'список кошельков\n'
+         '"-" - вернуться к хранилищу без кошелька'),
+        ('import <файл>',
+         'Добавить записи из файла csv, JSONL (.jsonl), SQLite (.db) или '
+         'каталога секций (.parts)\n'
+         'некорректные строки пропускаются и выводятся списком'),
+        ('export <файл>',
+         'Сохранить все записи в новый файл csv, SQLite (.db) или каталог '
+         'секций (.parts)\n'
+         '"--by year|month" - период секций (по умолчанию year)'),
+        ('compress',
+         'Сжать gzip старые секции каталога (.parts)\n'
+         '"--keep N" - сколько последних секций не сжимать (по умолчанию 1)'),
+        ('verify',
+         'Проверить записи: поля, порядок id и баланс каждой записи\n'
+         '"--repair" - пересчитать id и баланс, если найдены ошибки'),
+        ('stats',
+         'Время, чтения и запись по выполненным командам (с --profile)\n'
+         '"--cprofile [файл]" - профиль cProfile последней команды '
+         '(с --profile cprofile)'),
         ('exit', 'выйти из клиента')
     ]
 
+    DATABASE: str = 'database.csv'
+
+    # Можно ли задавать вопросы пользователю. В пакетном режиме и при
+    # запуске одной команды недостающие значения - ошибка
+    INTERACTIVE: bool = True
+
+    # Сколько ошибок импорта показывать в ответе команды import
+    IMPORT_ERRORS_SHOWN: int = 20
+
+    # По сколько строк импорта проверяется за один раз
+    IMPORT_BATCH: int = 10_000
+
+    # Сколько ошибок показывать в ответе команды verify
+    VERIFY_ERRORS_SHOWN: int = 20
+
+    # Вид хранилища: 'csv', 'sqlite' или None - по расширению DATABASE
+    STORAGE: str | None = None
+
+    # Каталог кошельков: кошелёк <имя> - хранилище <имя>.csv, <имя>.db
+    # или <имя>.parts в нём
+    WALLETS: str = 'wallets'
+
+    # Текущий кошелёк, None - хранилище DATABASE без кошелька
+    WALLET: str | None = None
+
+    # Число процессов для сводок по всем кошелькам, None - по числу ядер
+    WALLET_WORKERS: int | None = None
+
+    # Допустимые имена кошельков и расширения их хранилищ
+    WALLET_NAME = re.compile(r'[\w-]{1,64}')
+    WALLET_EXTENSIONS = ('.csv', '.db', '.sqlite', '.sqlite3', '.parts')
+
+    # Фильтры поиска, которые можно выбрать в диалоге: название ->
+    # параметр, и вопрос о значении для каждого параметра
+    FILTERS: Dict[str, str] = {
+        'категория': '-c', 'дата': '-d', 'сумма': '-a', 'описание': '-t'}
+    FILTER_PROMPTS: Dict[str, str] = {
+        '-c': 'Введите категорию. доход/расход: ',
+        '-d': 'Введите дату. Формат - дд.мм.гггг: ',
+        '-a': 'Введите сумму. Только положительные числа.\n'
+              '(. для плавающей запятой): ',
+        '-t': 'Введите текст из описания: ',
+    }
+
+    # Хранилище без кошелька, выбранное configure: (вид, путь)
+    _home: Tuple[str | None, str] = (None, 'database.csv')
+
+    # Открытые хранилища: (вид, путь) -> Storage. Хранилище держит
+    # разобранные записи в памяти, пока данные не изменены извне
+    _storages: Dict[Tuple[str | None, str], Storage] = {}
+
+    _parser: 'CommandParser | None' = None
+
     def help() -> str:
         """Выводит все доступные комманды"""
         text = "Доступные комманды:\n"
@@ -28,207 +156,378 @@ class BudgetTracker:
 
         return text
 
-    def _get_all_data() -> List[Dict] | None:
-        """Считывает все данные из файла"""
-        try:
-            with open('database.csv', 'r', encoding='UTF-8') as f:
-                data: List[List, Any] = f.read().splitlines()
-        # Если файла нет - создаём его
-        except FileNotFoundError:
-            with open('database.csv', 'w', encoding='UTF-8') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    'id', 'date', 'category', 'amount',
-                    'description', 'balance'])
-            return
+    def _storage() -> Storage:
+        """Хранилище, выбранное в настройках"""
+        key = (BudgetTracker.STORAGE, BudgetTracker.DATABASE)
+        storage: Storage | None = BudgetTracker._storages.get(key)
+        if storage is None:
+            storage = BudgetTracker._storages[key] = open_storage(
+                BudgetTracker.DATABASE, BudgetTracker.STORAGE)
+        return storage
 
-        if len(data) < 2:
-            return
+    def _get_all_data() -> Ledger | None:
+        """
+        Возвращает все записи из хранилища.
+        Данные читаются только если они изменились с момента прошлого
+        чтения, иначе возвращаются общие для всех команд записи из памяти
+        """
+        return BudgetTracker._storage().load() or None
 
-        # Записываем все данные в список в виде словарей
-        data_list = []
-        for param in list(map(lambda x: x.split(','), data[1:])):
-            id: int = int(param[0])
-            date: datetime.date = datetime.date(int(param[1].split('.')[2]),
-                                                int(param[1].split('.')[1]),
-                                                int(param[1].split('.')[0]),)
-            category: Literal['доход', 'расход'] = param[2]
-            amount: Decimal = Decimal(param[3])
-            description: str = param[4]
-            balance: Decimal = Decimal(param[5])
-
-            data_list.append(
-                {'id': id, 'date': date, 'category': category,
-                 'amount': amount, 'description': description,
-                 'balance': balance}
-            )
-        return data_list
-
-    def balance() -> str:
-        """
-        Получая данные из файла выводит баланс и записи
-        """
-        data: List[Dict] = BudgetTracker._get_all_data()
+    def balance(limit: int | None = None, offset: int = 0,
+                tail: int | None = None, at: str | None = None,
+                all_: bool = False) -> str | Iterator[str]:
+        """
+        Получая данные из файла выводит баланс и записи.
+        Записи выводятся построчно по мере формирования; limit и offset
+        задают страницу строк таблицы, tail - последние tail строк.
+        С датой at выводится только баланс на конец этого дня, с all_ -
+        итоги всех кошельков, страница - по строкам кошельков
+        """
+        if all_:
+            if at is not None:
+                return '--at не сочетается с --all'
+            return BudgetTracker._balance_all(limit, offset, tail)
+        if at is not None:
+            date: int | None = check_date(at)
+            if date is None:
+                return f'Параметр не введен или введён неверно: --at {at}'
+            balance: int = BudgetTracker._storage().balance_at(date)
+            return f'Баланс на {at} — {format_cents(balance)}'
+
+        data: Ledger = BudgetTracker._get_all_data()
         if not data:
             return 'Записей не найдено'
 
-        text: str = f"\n\nБаланс — {data[-1].get('balance', None)}\n\n"
-
-        # Разбиваем записи на доходы и расходы для корректного отображения
-        income: List[Dict] | None = list(
-            filter(lambda x: x['category'] == 'доход', data))
-        expenses: List[Dict] | None = list(
-            filter(lambda x: x['category'] == 'расход', data))
-
-        # Добавляем все записи циклом в переменную "text"
-        for i in range(max(len(income), len(expenses))):
-            income_value = income[i] if i < len(income) else ''
-            expense_value = expenses[i] if i < len(expenses) else ''
-
-            text += (
-                f"{'ID: '+str(income_value['id'])
-                    if income_value else '':<64}| "
-                f"{'ID: '+str(expense_value['id'])
-                    if expense_value else '':<64}\n"
-
-                f"{'Дата: '+income_value['date'].strftime("%d.%m.%Y")
-                    if income_value else '':<64}| "
-                f"{'Дата: '+expense_value['date'].strftime("%d.%m.%Y")
-                    if expense_value else '':<64}\n"
-
-                f"{'Категория: '+income_value['category']
-                    if income_value else '':<64}| "
-                f"{'Категория: '+expense_value['category']
-                    if expense_value else '':<64}\n"
-
-                f"{'Сумма: '+str(income_value['amount'])
-                    if income_value else '':<64}| "
-                f"{'Сумма: '+str(expense_value['amount'])
-                    if expense_value else '':<64}\n"
-
-                f"{'Описание: '+income_value['description']
-                    if income_value else '':<64}| "
-                f"{'Описание: '+expense_value['description']
-                    if expense_value else '':<64}\n\n"
-            )
+        return BudgetTracker._render_balance(data, limit, offset, tail)
+
+    def _render_balance(data: Ledger, limit: int | None, offset: int,
+                        tail: int | None) -> Iterator[str]:
+        """Генератор отчёта о балансе: доходы слева, расходы справа"""
+        yield f"\n\nБаланс — {format_cents(data.balances[-1])}\n\n"
+
+        # Разбиваем записи на доходы и расходы для корректного отображения.
+        # Позиции берутся из индекса, поэтому копии записей не создаются
+        storage: Storage = BudgetTracker._storage()
+        income: Sequence[int] = storage.positions(
+            'category', Category.INCOME, Category.INCOME)
+        expenses: Sequence[int] = storage.positions(
+            'category', Category.EXPENSE, Category.EXPENSE)
+
+        for i in BudgetTracker._page(
+                max(len(income), len(expenses)), limit, offset, tail):
+            yield BudgetTracker._render_pair(
+                data[income[i]] if i < len(income) else None,
+                data[expenses[i]] if i < len(expenses) else None)
+
+    def _balance_all(limit: int | None, offset: int,
+                     tail: int | None) -> str:
+        """Число записей, доходы, расходы и баланс каждого кошелька"""
+        summaries: Dict[str, Tuple[int, int, List[Tuple[int, int, int]]]] = \
+            BudgetTracker._summaries('year', None, None)
+        if not summaries:
+            return f'Кошельков не найдено в "{BudgetTracker.WALLETS}"'
+
+        names: List[str] = list(summaries)
+        lines: List[str] = [
+            f"\n{'Кошелёк':<24}{'Записей':>10}{'Доход':>16}{'Расход':>16}"
+            f"{'Баланс':>16}"]
+        for i in BudgetTracker._page(len(names), limit, offset, tail):
+            rows, balance, years = summaries[names[i]]
+            lines.append(
+                f'{names[i]:<24}{rows:>10}'
+                f'{format_cents(sum(year[1] for year in years)):>16}'
+                f'{format_cents(sum(year[2] for year in years)):>16}'
+                f'{format_cents(balance):>16}')
+        totals: List[int] = [0, 0, 0, 0]
+        for rows, balance, years in summaries.values():
+            totals[0] += rows
+            totals[1] += sum(year[1] for year in years)
+            totals[2] += sum(year[2] for year in years)
+            totals[3] += balance
+        lines.append(
+            f"{'Всего':<24}{totals[0]:>10}{format_cents(totals[1]):>16}"
+            f"{format_cents(totals[2]):>16}{format_cents(totals[3]):>16}\n")
+        return '\n'.join(lines)
+
+    def _summaries(by: str, low: int | None, high: int | None
+                   ) -> Dict[str, Tuple[int, int, List[Tuple[int, int, int]]]]:
+        """
+        Число записей, баланс и сводка rollup каждого кошелька. Кошельки
+        читаются одновременно в пуле из WALLET_WORKERS процессов
+        """
+        wallets: Dict[str, str] = BudgetTracker._wallets()
+        count: int = len(wallets)
+        workers: int = min(
+            BudgetTracker.WALLET_WORKERS or os.cpu_count() or 1, count)
+        arguments = (
+            list(wallets.values()), [by] * count, [low] * count,
+            [high] * count)
+        if workers <= 1:
+            return dict(zip(wallets, map(summarize, *arguments)))
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            # Кошельков сотни, а каждый обычно мал: отдаём их процессам
+            # пачками, а не по одному
+            return dict(zip(wallets, pool.map(
+                summarize, *arguments,
+                chunksize=max(count // (workers * 4), 1))))
+
+    def report(by: str = 'month', start: str | None = None,
+               end: str | None = None, all_: bool = False) -> str:
+        """
+        Сводка доходов и расходов по дням, месяцам или годам. Считается по
+        готовым сводкам хранилища, поэтому время зависит от числа
+        периодов, а не записей.
+        start и end - границы: дата дд.мм.гггг, для месяцев также мм.гггг,
+        для лет - гггг. С all_ суммируются сводки всех кошельков
+        """
+        bounds: List[int | None] = []
+        for option, value in (('--from', start), ('--to', end)):
+            try:
+                bounds.append(None if value is None
+                              else BudgetTracker._period(by, value))
+            except ValueError:
+                return f'Параметр не введен или введён неверно: ' \
+                       f'{option} {value}'
+
+        if all_:
+            totals: Dict[int, List[int]] = {}
+            for _, _, wallet in BudgetTracker._summaries(
+                    by, *bounds).values():
+                for key, income, expense in wallet:
+                    period_totals: List[int] = totals.setdefault(key, [0, 0])
+                    period_totals[0] += income
+                    period_totals[1] += expense
+            rows: List[Tuple[int, int, int]] = [
+                (key, *totals[key]) for key in sorted(totals)]
+        else:
+            rows = BudgetTracker._storage().rollup(by, *bounds)
+        if not rows:
+            return 'Записей не найдено'
 
-        return text
+        period: Callable[[int], str] = {
+            'day': format_date, 'month': format_month, 'year': str}[by]
+        lines: List[str] = [
+            f"\n{'Период':<12}{'Доход':>16}{'Расход':>16}{'Итого':>16}"]
+        total_income = total_expense = 0
+        for key, income, expense in rows:
+            lines.append(
+                f'{period(key):<12}{format_cents(income):>16}'
+                f'{format_cents(expense):>16}'
+                f'{format_cents(income - expense):>16}')
+            total_income += income
+            total_expense += expense
+        lines.append(
+            f"{'Всего':<12}{format_cents(total_income):>16}"
+            f"{format_cents(total_expense):>16}"
+            f"{format_cents(total_income - total_expense):>16}\n")
+        return '\n'.join(lines)
+
+    def _period(by: str, value: str) -> int:
+        """Период сводки ('day', 'month', 'year') по значению --from/--to"""
+        if by == 'month' and len(value) == 7:
+            month: int | None = check_month(value)
+            if month is None:
+                raise ValueError(f'Месяц не в формате мм.гггг: {value!r}')
+            return month
+        if by == 'year' and len(value) == 4:
+            year: int | None = check_year(value)
+            if year is None:
+                raise ValueError(f'Год не в формате гггг: {value!r}')
+            return year
+        date: int | None = check_date(value)
+        if date is None:
+            raise ValueError(f'Дата не в формате дд.мм.гггг: {value!r}')
+        if by == 'day':
+            return date
+        return month_of(date) if by == 'month' else month_of(date) // 12
+
+    def _page(total: int, limit: int | None, offset: int,
+              tail: int | None) -> range:
+        """Номера строк, попадающих на страницу вывода"""
+        if tail is not None:
+            start: int = max(total - tail, 0)
+        else:
+            start = min(offset, total)
+        stop: int = total if limit is None else min(start + limit, total)
+        return range(start, stop)
+
+    def _render_fields(trans: Transaction | None) -> List[str]:
+        """Поля записи для вывода, пустые строки если записи нет"""
+        if not trans:
+            return [''] * 5
+        return [
+            f"ID: {trans.id}",
+            f"Дата: {format_date(trans.date)}",
+            f"Категория: {trans.category.label}",
+            f"Сумма: {format_cents(trans.amount)}",
+            f"Описание: {trans.description}",
+        ]
+
+    def _render_pair(income: Transaction | None,
+                     expense: Transaction | None) -> str:
+        """Строка таблицы баланса из двух колонок"""
+        lines: List[str] = [
+            f'{left:<64}| {right:<64}\n' for left, right in zip(
+                BudgetTracker._render_fields(income),
+                BudgetTracker._render_fields(expense))
+        ]
+        return ''.join(lines) + '\n'
 
     def _validate_date(date: str) -> bool:
         """
-        Проверка даты на корректный формат с помощью регулярного выражения и
-        модуля datetime
+        Проверка даты: формат дд.мм.гггг и существование такого дня
+        (см. validation.check_date)
         """
-        date_regex = r'^(0[1-9]|[12][0-9]|3[01])\.(0[1-9]|1[012])\.\d{4}$'
-
-        if not re.match(date_regex, date):
-            return False
-
-        # Проверка для того, чтобы нельзя было ввести 30 февраля, например
-        day, month, year = map(int, date.split('.'))
-        try:
-            datetime.datetime(year, month, day)
-        except ValueError:
-            return False
-
-        return True
+        return check_date(date) is not None
 
     def _validate_amount(amount: str) -> bool:
         """Проверка суммы на корректный формат"""
-        amount_regex = r'^\d+(\.\d+)?$'
+        return check_amount(amount) is not None
 
-        if re.match(amount_regex, amount):
-            return True
-        else:
-            return False
+    def add_transaction(date: str | None = None,
+                        category: str | None = None,
+                        amount: str | None = None,
+                        description: str | None = None
+                        ) -> str | Iterator[str]:
+        """
+        Adds a transaction.
+        Значения можно передать параметрами, недостающие запрашиваются у
+        пользователя (в неинтерактивном режиме их отсутствие - ошибка)
+        """
+        error: str | None = BudgetTracker._check_fields(
+            date, category, amount, description)
+        if not error and not BudgetTracker.INTERACTIVE:
+            error = BudgetTracker._check_complete(
+                date, category, amount, description)
+        if error:
+            return error
 
-    def add_transaction() -> str:
-        """Adds a transaction"""
         # Цикл для получения и валидации даты
-        while True:
-            date: str = input('Введите дату в данном формате - дд.мм.гггг: ')
-            if BudgetTracker._validate_date(date):
-                break
-            else:
+        while date is None:
+            date = input('Введите дату в данном формате - дд.мм.гггг: ')
+            if not BudgetTracker._validate_date(date):
                 print("Некорректный формат или дата не существует.")
+                date = None
 
         # Цикл для получения и валидации категории
-        while True:
-            category: str = input("Введите категорию - доход/расход: ").lower()
-            if BudgetTracker._validate_category(category):
-                break
-            else:
+        while category is None:
+            category = input("Введите категорию - доход/расход: ")
+            if not BudgetTracker._validate_category(category.lower()):
                 print('Некорректный формат категории.')
+                category = None
 
         # Цикл для получения и валидации суммы
-        while True:
-            amount_str: str = input(
+        while amount is None:
+            amount = input(
                 'Введите сумму. Только положительные числа.\n'
                 '(. для плавающей запятой): ')
-            if BudgetTracker._validate_amount(amount_str):
-                amount: Decimal = round(Decimal(amount_str), 2)
-                break
-            else:
+            if not BudgetTracker._validate_amount(amount):
                 print("Некорректный формат суммы.")
+                amount = None
 
         # Цикл для получения описания
-        while True:
-            description: str = input('Введите описание '
-                                     'не более 64 символов: ')
+        while description is None:
+            description = input('Введите описание '
+                                'не более 64 символов: ')
             if len(description) > 64:
                 print('Превышен лимит символов.')
-            else:
-                break
-
-        transactions: List[Dict] | None = BudgetTracker._get_all_data()
-
-        if transactions:
-            latest_transaction: Dict = BudgetTracker._get_all_data()[-1]
-            # Рассчитываем баланс исходя из последней записи
-            balance: Decimal = (
-                BudgetTracker._get_all_data()[-1]['balance'] + amount
-                if category == 'доход'
-                else BudgetTracker._get_all_data()[-1]['balance'] - amount)
+                description = None
 
-            id_: int = latest_transaction['id'] + 1
-
-            data_list = [
-                id_, date, category, amount, description, round(balance, 2)
-                ]
+        row: Transaction = BudgetTracker._append_transaction(
+            date, category.lower(), check_amount(amount), description)
+        if not BudgetTracker.INTERACTIVE:
+            return BudgetTracker._added(row)
+        return BudgetTracker.balance()
 
-            with open(
-                    'database.csv', 'a', encoding='UTF-8'
-                    ) as file:
-                writer = csv.writer(file)
-                writer.writerow(data_list)
-            return BudgetTracker.balance()
+    def _added(row: Transaction) -> str:
+        """Ответ команды add без вопросов пользователю"""
+        return (f'Добавлена запись ID: {row.id}. '
+                f'Баланс — {format_cents(row.balance)}')
 
-        # В случае если нет записей в файле
-        else:
-            id_ = 1
-            balance: Decimal = (
-                round(Decimal(amount), 2)
-                if category == 'доход'
-                else round(Decimal(-amount), 2)
-                )
-
-            data_list = [
-                id_, date, category, amount, description, balance
-                ]
+    def _check_fields(date: str | None, category: str | None,
+                      amount: str | None,
+                      description: str | None) -> str | None:
+        """
+        Проверяет переданные параметрами значения полей записи.
+        Возвращает описание первой ошибки или None
+        """
+        if date is not None and not BudgetTracker._validate_date(date):
+            return "Некорректный формат или дата не существует."
+        if category is not None \
+                and not BudgetTracker._validate_category(category.lower()):
+            return 'Некорректный формат категории.'
+        if amount is not None and not BudgetTracker._validate_amount(amount):
+            return "Некорректный формат суммы."
+        if description is not None and len(description) > 64:
+            return 'Превышен лимит символов.'
+        if description is not None and BudgetTracker._has_newline(
+                description):
+            return 'Описание не должно содержать переводов строки.'
+        return None
+
+    def _has_newline(text: str) -> bool:
+        """
+        Есть ли в тексте перевод строки. В описании он запрещён: запись
+        csv-файла должна занимать одну строку
+        """
+        return '\n' in text or '\r' in text
 
-            with open(
-                    'database.csv', 'a', encoding='UTF-8'
-                    ) as file:
-                writer = csv.writer(file)
-                writer.writerow(data_list)
-            return BudgetTracker.balance()
+    def _is_utf8(text: str) -> bool:
+        """
+        Можно ли записать текст в UTF-8. Байты, которые не удалось
+        прочитать как UTF-8 (errors='surrogateescape'), и одиночные
+        суррогаты из JSON - нельзя
+        """
+        try:
+            text.encode('UTF-8')
+        except UnicodeEncodeError:
+            return False
+        return True
 
-    def patch_transaction() -> str | None:
-        """Изменение записи (много копипасты)"""
-        all_transactions: List[Dict] = BudgetTracker._get_all_data()
+    def _check_complete(date: str | None, category: str | None,
+                        amount: str | None,
+                        description: str | None) -> str | None:
+        """Сообщение о полях новой записи, которые не переданы, или None"""
+        missing: List[str] = [
+            name for name, value in (
+                ('--date', date), ('--category', category),
+                ('--amount', amount), ('--desc', description))
+            if value is None]
+        if missing:
+            return f'Не указаны параметры: {", ".join(missing)}'
+        return None
+
+    def _append_transaction(date: str, category: str, amount: int,
+                            description: str) -> Transaction:
+        """
+        Дописывает транзакцию в конец хранилища.
+        Для расчёта id и баланса нужна только последняя запись, поэтому
+        при холодном кэше читается лишь она
+        """
+        return BudgetTracker._storage().append(Transaction(
+            0, parse_date(date), Category.parse(category), amount,
+            description, 0))
+
+    def patch_transaction(id_: int | None = None, date: str | None = None,
+                          category: str | None = None,
+                          amount: str | None = None,
+                          description: str | None = None
+                          ) -> str | Iterator[str]:
+        """
+        Изменение записи (много копипасты).
+        Если id передан параметром, значения не запрашиваются: не
+        переданные поля остаются прежними
+        """
+        all_transactions: Ledger = BudgetTracker._get_all_data()
         if not all_transactions:
             return 'Отсутствуют записи для редактирования.'
 
+        if id_ is not None:
+            return BudgetTracker._patch_fields(
+                all_transactions, id_, date, category, amount, description)
+        if not BudgetTracker.INTERACTIVE:
+            return 'Не указан параметр --id'
+
         # Получаем id
         while True:
             try:
@@ -237,13 +536,9 @@ class BudgetTracker:
                 print('Недопустимое значение. Введите число.')
                 continue
 
-            id_found = False
-            for trans in all_transactions:
-                if trans['id'] == id_:
-                    id_found = True
-                    selected_trans: Dict = trans
-                    break
-            if id_found:
+            index: int | None = all_transactions.find(id_)
+            if index is not None:
+                selected_trans: Transaction = all_transactions[index]
                 break
             else:
                 print('ID not found. Try again')
@@ -253,15 +548,12 @@ class BudgetTracker:
             date: str = input("Введите дату в данном формате - дд.мм.гггг: "
                               "\nОставьте пустым чтобы пропустить: ")
             if date == '':
-                date: str = selected_trans['date'].strftime("%d.%m.%Y")
+                date: str = format_date(selected_trans.date)
                 break
             elif BudgetTracker._validate_date(date):
                 break
             else:
                 print("Некорректный формат или дата не существует.")
-        date: datetime.date = datetime.date(int(date.split('.')[2]),
-                                            int(date.split('.')[1]),
-                                            int(date.split('.')[0]),)
 
         # Получаем категорию
         while True:
@@ -271,7 +563,7 @@ class BudgetTracker:
             if BudgetTracker._validate_category(category):
                 break
             elif category == '':
-                category: str = selected_trans['category']
+                category: str = selected_trans.category.label
                 break
             else:
                 print('Некорректный формат категории.')
@@ -283,10 +575,9 @@ class BudgetTracker:
                 '(. для плавающей запятой)\n'
                 'Оставьте пустым чтобы пропустить: ')
             if amount_str == '':
-                amount: Decimal = selected_trans['amount']
+                amount: int = selected_trans.amount
                 break
-            elif BudgetTracker._validate_amount(amount_str):
-                amount: Decimal = round(Decimal(amount_str), 2)
+            elif (amount := check_amount(amount_str)) is not None:
                 break
             else:
                 print("Некорректный формат суммы.")
@@ -297,209 +588,673 @@ class BudgetTracker:
                                      'не более 64 символов\n'
                                      'Оставьте пустым чтобы пропустить: ')
             if description == '':
-                description: str = selected_trans['description']
+                description: str = selected_trans.description
                 break
             elif len(description) > 64:
                 print('Превышен лимит символов..')
             else:
                 break
 
-        patched_transaction: Dict = {
-            'id': id_, 'date': date, 'category': category,
-            'amount': amount, 'description': description,
-            'balance': 0
-        }
+        BudgetTracker._replace_transaction(
+            all_transactions, index, Transaction(
+                id_, parse_date(date), Category.parse(category), amount,
+                description, 0))
+        return BudgetTracker.balance()
 
+    def _patch_fields(all_transactions: Ledger, id_: int, date: str | None,
+                      category: str | None, amount: str | None,
+                      description: str | None) -> str:
+        """Изменение записи по параметрам, без вопросов пользователю"""
+        error: str | None = BudgetTracker._check_fields(
+            date, category, amount, description)
+        if error:
+            return error
+        index: int | None = all_transactions.find(id_)
+        if index is None:
+            return f'Запись с ID {id_} не найдена.'
+
+        # Не переданные поля остаются прежними
+        selected_trans: Transaction = all_transactions[index]
+        BudgetTracker._replace_transaction(
+            all_transactions, index, Transaction(
+                id_,
+                selected_trans.date if date is None else parse_date(date),
+                selected_trans.category if category is None
+                else Category.parse(category.lower()),
+                selected_trans.amount if amount is None
+                else check_amount(amount),
+                selected_trans.description if description is None
+                else description,
+                0))
+        return (f'Запись ID: {id_} изменена. '
+                f'Баланс — {format_cents(all_transactions.balances[-1])}')
+
+    def _replace_transaction(all_transactions: Ledger, index: int,
+                             patched_transaction: Transaction) -> None:
+        """
+        Рассчитывает баланс изменённой записи и сохраняет её, если она
+        отличается от прежней
+        """
         # Рассчитываем баланс исходя из предыдущей записи
-        index = all_transactions.index(selected_trans)
-        if index == 0:
-            balance = amount if category == 'доход' else -amount
-        else:
-            balance = all_transactions[index - 1]['balance'] + \
-                      (amount if category == 'доход' else -amount)
-
-        patched_transaction['balance'] = round(balance, 2)
+        patched_transaction.balance = patched_transaction.signed_amount
+        if index > 0:
+            patched_transaction.balance += all_transactions.balances[index - 1]
 
         # Проверяем наличие изменений
-        if patched_transaction == selected_trans:
-            return BudgetTracker.balance()
-
-        # Заменяем старую запись на новую
-        all_transactions.pop(index)
-        all_transactions.insert(index, patched_transaction)
-
-        # Расчитываем баланс для всех последующих записей
-        if len(all_transactions) > 1:
-            for i in range(index + 1, len(all_transactions)):
-                all_transactions[i]['balance'] = \
-                    all_transactions[i - 1]['balance'] + (
-                        all_transactions[i]['amount']
-                        if all_transactions[i]['category'] == 'доход'
-                        else -all_transactions[i]['amount'])
-        else:
-            all_transactions = [patched_transaction]
+        if patched_transaction == all_transactions[index]:
+            return
 
-        # Записываем данные заново в файл
-        with open('database.csv', 'w', encoding='UTF-8') as file:
-            writer = csv.writer(file)
-            head = [
-                'id', 'date', 'category', 'amount', 'description', 'balance'
-                ]
-            writer.writerow(head)
-            for index, trans in enumerate(all_transactions):
-                data = [
-                    all_transactions[index]['id'],
-                    all_transactions[index]['date'].strftime("%d.%m.%Y"),
-                    all_transactions[index]['category'],
-                    all_transactions[index]['amount'],
-                    all_transactions[index]['description'],
-                    all_transactions[index]['balance'],
-                ]
-                writer.writerow(data)
-        return BudgetTracker.balance()
+        BudgetTracker._storage().replace(index, patched_transaction)
 
     def _validate_category(category: str) -> bool:
         """Валидатор параметра 'категория'"""
-        if category == 'доход' or category == 'расход':
-            return True
-        return False
+        return check_category(category) is not None
+
+    def _parse_range(value: str,
+                     parser: Callable[[str], Any | None]) -> tuple | None:
+        """
+        Разбирает значение фильтра: одно значение или диапазон "от..до",
+        одна из границ диапазона может быть пропущена. parser возвращает
+        разобранное значение или None, если оно некорректно.
+        Возвращает (от, до), где None - открытая граница, или None, если
+        значение некорректно
+        """
+        if '..' not in value:
+            bound = parser(value)
+            return None if bound is None else (bound, bound)
+
+        start, end = value.split('..', 1)
+        if not (start or end):
+            return None
+        low = parser(start) if start else None
+        high = parser(end) if end else None
+        if start and low is None or end and high is None:
+            return None
+        return low, high
+
+    def _filter_positions(option: Literal['-c', '-d', '-a', '-t'] | None,
+                          value: str | None) -> Sequence[int] | None:
+        """
+        Позиции записей, подходящих под фильтр, в порядке id.
+        Для даты и суммы принимается и диапазон "от..до", текст ищется
+        как часть описания без учёта регистра.
+        None - если параметр или значение некорректны
+        """
+        if value is None:
+            return None
+        storage: Storage = BudgetTracker._storage()
+
+        match option:
+            case '-c':
+                category: Category | None = check_category(value.lower())
+                if category is None:
+                    return None
+                return storage.positions('category', category, category)
+
+            case '-d':
+                bounds = BudgetTracker._parse_range(value, check_date)
+                if bounds is None:
+                    return None
+                return storage.positions('date', *bounds)
+
+            case '-a':
+                bounds = BudgetTracker._parse_range(value, check_amount)
+                if bounds is None:
+                    return None
+                return storage.positions('amount', *bounds)
+
+            case '-t':
+                if not value:
+                    return None
+                return storage.text_positions(value)
+
+        return None
 
     def _filter_transactions(
-                            all_trans: List[Dict[int, Any]],
-                            option: Literal['-c', '-d', '-a'] | None = None,
+                            all_trans: Ledger,
+                            option: (Literal['-c', '-d', '-a', '-t']
+                                     | None) = None,
                             value: str | None = None) -> list:
-        """Основной метод для фильтрации по запросу"""
-
-        try:
-            match option:
-                # Проверка на параметр "категория"
-                case '-c':
-                    # Валидация значения
-                    if BudgetTracker._validate_category(value.lower()):
-                        filtered_transactions: List[Dict[int, Any]] | list = [
-                            trans for trans in all_trans
-                            if trans['category'] == value.lower()
-                        ]
-                        # Возврат отфильтрованных данных или [] при успехе
-                        return filtered_transactions
-                    else:
-                        print('Неверное значение для параметра "-c".')
-                        raise ValueError
-
-                # Проверка на параметр "дата"
-                case '-d':
-                    # Валидация значения
-                    if BudgetTracker._validate_date(value):
-                        filtered_transactions: List[Dict[int, Any]] | list = [
-                            trans for trans in all_trans
-                            if trans['date'].strftime("%d.%m.%Y") == value
-                        ]
-                        # Возврат отфильтрованных данных или [] при успехе
-                        return filtered_transactions
-                    else:
-                        print('Неверное значение для параметра "-d".')
-                        raise ValueError
-
-                # Проверка на параметр "сумма"
-                case '-a':
-                    # Валидация значения
-                    if BudgetTracker._validate_amount(value.lower()):
-                        filtered_transactions: List[Dict[int, Any]] | list = [
-                            trans for trans in all_trans
-                            if trans['amount'] == Decimal(value)
-                        ]
-                        # Возврат отфильтрованных данных или [] при успехе
-                        return filtered_transactions
-                    else:
-                        print('Неверное значение для параметра "-a".')
-                        raise ValueError
-
-                # Возврат ошибки, если ничего не сошлось
-                case _:
-                    print('Параметр не введен или введён неверно.')
-                    raise ValueError
-        # Отлавливаем ошибку, которую вызвали при неверно введенных данных
-        except ValueError:
-            while True:
-                filter_: str = input('Введите фильтр для поиска.\n'
-                                     'категория/дата/сумма: ').lower()
-                match filter_:
-                    # Проверка на параметр "категория"
-                    case 'категория':
-                        filter_option = '-c'
-                        filter_value: str = input(
-                            'Введите категорию. доход/расход: ')
-                        if BudgetTracker._validate_category(filter_value):
-                            # Снова вызываем эту же функцию подставив значнеиия
-                            return BudgetTracker._filter_transactions(
-                                all_trans,
-                                filter_option,
-                                filter_value)
-                        else:
-                            print('Неверное значение для фильтра "категория"')
-                            continue
-
-                    # Проверка на параметр "дата"
-                    case 'дата':
-                        filter_option = '-d'
-                        filter_value: str = input(
-                            'Введите дату. Формат - дд.мм.гггг: ')
-                        if BudgetTracker._validate_date(filter_value):
-                            # Снова вызываем эту же функцию подставив значнеиия
-                            return BudgetTracker._filter_transactions(
-                                all_trans,
-                                filter_option,
-                                filter_value)
-                        else:
-                            print('Неверное значение для фильтра "дата"')
-                            continue
-
-                    # Проверка на параметр "сумма"
-                    case 'сумма':
-                        filter_option = '-a'
-                        filter_value: str = input(
-                            'Введите сумму. Только положительные числа.\n'
-                            '(. для плавающей запятой): ')
-                        if BudgetTracker._validate_amount(filter_value):
-                            # Снова вызываем эту же функцию подставив значнеиия
-                            return BudgetTracker._filter_transactions(
-                                all_trans,
-                                filter_option,
-                                filter_value)
-                        else:
-                            print('Неверное значение для фильтра "сумма"')
-                            continue
-
-                    case _:
-                        print('Параметр не введен или введён неверно.')
-
-    def search_transactions(option: Literal['-c', '-d', '-a'] | None = None,
-                            value: str | None = None) -> str:
-        """Поиск записей по параметру или без него"""
-        all_transactions: List[Dict] = BudgetTracker._get_all_data()
+        """
+        Основной метод для фильтрации по запросу. Если параметр или
+        значение некорректны, фильтр спрашивается у пользователя
+        """
+        positions: Sequence[int] | None = (
+            BudgetTracker._filter_positions(option, value))
+        if positions is None:
+            if option in BudgetTracker.FILTERS.values():
+                print(f'Неверное значение для параметра "{option}".')
+            else:
+                print('Параметр не введен или введён неверно.')
+        while positions is None:
+            filter_: str = input('Введите фильтр для поиска.\n'
+                                 'категория/дата/сумма/описание: '
+                                 ).lower()
+            option = BudgetTracker.FILTERS.get(filter_)
+            if option is None:
+                print('Параметр не введен или введён неверно.')
+                continue
+            value = input(BudgetTracker.FILTER_PROMPTS[option])
+            positions = BudgetTracker._filter_positions(option, value)
+            if positions is None:
+                print(f'Неверное значение для фильтра "{filter_}"')
+        # Возврат отфильтрованных данных или [] при успехе
+        return [all_trans[position] for position in positions]
+
+    def search_transactions(
+            filters: List[Tuple[str, str]] | None = None,
+            limit: int | None = None, offset: int = 0,
+            tail: int | None = None) -> str | Iterator[str]:
+        """
+        Поиск записей по параметрам или без них.
+        filters - пары (параметр, значение), при нескольких парах
+        возвращаются записи, подходящие под все фильтры сразу.
+        limit, offset и tail - как у balance
+        """
+        all_transactions: Ledger = BudgetTracker._get_all_data()
         if not all_transactions:
             return "Нет данных для поиска."
 
-        # Вызываем функцию для возврата отфильтрованных значений
-        filtered_transactions: List[Dict, Any] | List = (
-            BudgetTracker._filter_transactions(
-                all_transactions, option, value
-            )
-        )
+        # Фильтры дают позиции записей; объекты записей создаются только
+        # для выводимой страницы
+        positions: Sequence[int] | None = None
+        for option, value in filters or [(None, None)]:
+            found: Sequence[int] | None = BudgetTracker._filter_positions(
+                option, value)
+            if found is None:
+                # Без пользователя некорректный фильтр уточнить не у кого
+                if not BudgetTracker.INTERACTIVE:
+                    return ('Параметр не введен или введён неверно: '
+                            f'{option or ""} {value or ""}')
+                found = [
+                    all_transactions.find(trans.id)
+                    for trans in BudgetTracker._filter_transactions(
+                        all_transactions, option, value)
+                ]
+            if positions is None:
+                positions = found
+            else:
+                keep: set = set(found)
+                positions = [
+                    position for position in positions if position in keep
+                ]
 
-        if not filtered_transactions:
+        if not positions:
             return 'Не найдено записей по заданному фильтру'
 
-        text = '\n\nОтфильтрованные записи:\n\n'
-        for trans in filtered_transactions:
-            text += (f"ID: {trans['id']}\n"
-                     f"Дата: {trans['date'].strftime('%d.%m.%Y')}\n"
-                     f"Категория: {trans['category']}\n"
-                     f"Сумма: {trans['amount']}\n"
-                     f"Описание: {trans['description']}\n\n")
+        return BudgetTracker._render_search(
+            all_transactions, positions, limit, offset, tail)
+
+    def _render_search(data: Ledger, positions: Sequence[int],
+                       limit: int | None, offset: int,
+                       tail: int | None) -> Iterator[str]:
+        """Генератор вывода найденных записей"""
+        yield '\n\nОтфильтрованные записи:\n\n'
+        for i in BudgetTracker._page(len(positions), limit, offset, tail):
+            yield '\n'.join(
+                BudgetTracker._render_fields(data[positions[i]])) + '\n\n'
 
+    def _output(result: str | Iterable[str] | None) -> None:
+        """
+        Выводит результат команды. Результат-генератор печатается по
+        частям, не собираясь в одну строку
+        """
+        if result is None or isinstance(result, str):
+            print(result)
+            return
+        for chunk in result:
+            sys.stdout.write(chunk)
+        sys.stdout.write('\n')
+        sys.stdout.flush()
+
+    def import_transactions(path: str | None = None) -> str:
+        """
+        Дописывает записи из файла: csv в формате database.csv, JSONL
+        (.jsonl, .json) с полями date, category, amount, description или
+        базы SQLite (.db). id и баланс назначаются заново, продолжая текущие
+        записи, за один проход; все записи дописываются одной записью в
+        хранилище. Некорректные строки пропускаются и перечисляются в ответе
+        """
+        if not path:
+            return 'Укажите файл: import <файл>'
+        if not os.path.exists(path):
+            return f'Файл "{path}" не найден.'
+        if os.path.abspath(path) == os.path.abspath(BudgetTracker.DATABASE):
+            return 'Нельзя импортировать записи из текущего хранилища.'
+
+        errors: List[str] = []
+        if storage_kind(path) in ('sqlite', 'partitioned'):
+            # Записи хранилища уже проверены при добавлении. Источник
+            # только читается: открытие не должно его изменить
+            try:
+                source: Storage = open_storage(path, readonly=True)
+                try:
+                    rows: List[Transaction] = list(source.load())
+                finally:
+                    source.close()
+            # Например, файл .db - не база записей, испорчен манифест
+            # секций или нет прав на чтение
+            except (sqlite3.Error, ValueError, OSError) as error:
+                return f'Не удалось прочитать "{path}": {error}'
+        else:
+            rows = []
+            records: Iterator[Tuple[int, Dict | str]] = \
+                BudgetTracker._read_import_file(path)
+            while batch := list(itertools.islice(
+                    records, BudgetTracker.IMPORT_BATCH)):
+                valid, invalid = BudgetTracker._validate_records(batch)
+                rows += valid
+                errors += invalid
+
+        added: List[Transaction] = BudgetTracker._storage().extend(rows)
+
+        text: str = f'Импортировано записей: {len(added)}'
+        if errors:
+            text += f'\nПропущено строк с ошибками: {len(errors)}\n'
+            text += '\n'.join(errors[:BudgetTracker.IMPORT_ERRORS_SHOWN])
+            if len(errors) > BudgetTracker.IMPORT_ERRORS_SHOWN:
+                text += '\n...'
         return text
 
+    def _read_import_file(path: str) -> Iterator[Tuple[int, Dict | str]]:
+        """
+        Построчно читает файл для импорта.
+        Возвращает пары (номер строки, поля записи) или (номер строки,
+        описание ошибки), если строку не удалось разобрать, в том числе
+        из-за байтов не в UTF-8 или некорректного csv
+        """
+        encoding_error: str = 'текст не в кодировке UTF-8'
+        extension: str = os.path.splitext(path)[1].lower()
+        # Байты не в UTF-8 не прерывают чтение, а попадают в текст
+        # суррогатами и дают ошибку своей строки
+        with open(path, 'r', encoding='UTF-8', errors='surrogateescape',
+                  newline='') as file:
+            if extension in ('.jsonl', '.json'):
+                for line, text in enumerate(file, 1):
+                    if not text.strip():
+                        continue
+                    if not BudgetTracker._is_utf8(text):
+                        yield line, encoding_error
+                        continue
+                    try:
+                        record = json.loads(text)
+                    except ValueError:
+                        yield line, 'некорректный JSON'
+                        continue
+                    if not isinstance(record, dict):
+                        yield line, 'ожидается объект JSON'
+                        continue
+                    yield line, record
+            else:
+                reader = csv.DictReader(file)
+                while True:
+                    try:
+                        record = next(reader)
+                    except StopIteration:
+                        return
+                    except csv.Error as error:
+                        # DictReader обновляет line_num только после
+                        # разобранной записи, csv.reader - при чтении строки
+                        yield (reader.reader.line_num,
+                               f'некорректный csv: {error}')
+                        continue
+                    if not all(BudgetTracker._is_utf8(value)
+                               for value in record.values()
+                               if isinstance(value, str)):
+                        yield reader.line_num, encoding_error
+                        continue
+                    yield reader.line_num, record
+
+    def _validate_records(records: List[Tuple[int, Dict | str]]
+                          ) -> Tuple[List[Transaction], List[str]]:
+        """
+        Проверяет поля импортируемых записей теми же валидаторами, что и
+        ввод пользователя, по столбцам: каждый столбец разбирается одним
+        вызовом, и разобранные значения сразу идут в записи.
+        records - пары (номер строки, поля или описание ошибки чтения).
+        Возвращает записи и ошибки по строкам; у строки - первая ошибка
+        """
+        lines: List[int] = []
+        fields: List[Dict] = []
+        failed: Dict[int, str] = {}
+        for line, record in records:
+            if isinstance(record, str):
+                failed[line] = record
+            else:
+                lines.append(line)
+                fields.append(record)
+
+        def column(name: str) -> List[str]:
+            # Ноль в JSON - значение, а не пропущенное поле
+            return ['' if record.get(name) is None else str(record[name])
+                    for record in fields]
+
+        dates, date_errors = check_dates(column('date'))
+        categories, category_errors = check_categories(
+            [category.lower() for category in column('category')])
+        amounts, amount_errors = check_amounts(column('amount'))
+        descriptions: List[str] = column('description')
+        description_errors = [
+            (index, error) for index, error in enumerate(
+                map(BudgetTracker._description_error, descriptions))
+            if error is not None]
+        for index, error in itertools.chain(
+                date_errors, category_errors, amount_errors,
+                description_errors):
+            failed.setdefault(lines[index], error)
+
+        rows: List[Transaction] = [
+            Transaction(0, dates[index], categories[index], amounts[index],
+                        descriptions[index], 0)
+            for index, line in enumerate(lines) if line not in failed]
+        return rows, [f'строка {line}: {failed[line]}'
+                      for line in sorted(failed)]
+
+    def _description_error(description: str) -> str | None:
+        """Ошибка в описании импортируемой записи или None"""
+        if len(description) > 64:
+            return 'описание длиннее 64 символов'
+        if BudgetTracker._has_newline(description):
+            return 'описание содержит перевод строки'
+        if not BudgetTracker._is_utf8(description):
+            return 'описание содержит символы не в UTF-8'
+        return None
+
+    def export_transactions(path: str | None = None,
+                            by: str | None = None) -> str:
+        """
+        Сохраняет все записи в новый файл (csv, SQLite или каталог секций -
+        по расширению) с теми же id и балансом. Так же выполняется переход
+        между одним файлом и секциями. by - период секций: year или month
+        """
+        if not path:
+            return 'Укажите файл: export <файл>'
+        if os.path.isdir(path) and os.listdir(path) \
+                or os.path.isfile(path) and os.path.getsize(path) > 0:
+            return f'Файл "{path}" уже существует.'
+
+        # Проверяется до открытия: открытая база SQLite уже создана
+        if by is not None and storage_kind(path) != 'partitioned':
+            return '--by задаётся только для каталога секций (.parts)'
+
+        data: Ledger = BudgetTracker._storage().load()
+        try:
+            target: Storage = open_storage(path)
+            try:
+                if by is not None:
+                    target.period = by
+                target.write_all(data)
+            finally:
+                target.close()
+        # Например, каталога для файла нет или нет прав на запись
+        except (OSError, sqlite3.Error) as error:
+            return f'Не удалось сохранить "{path}": {error}'
+        return f'Экспортировано записей: {len(data)}'
+
+    def compress_partitions(keep: int = 1) -> str:
+        """Сжимает gzip старые секции, кроме последних keep"""
+        storage: Storage = BudgetTracker._storage()
+        if not isinstance(storage, PartitionedStorage):
+            return 'Сжатие доступно только для каталога секций (.parts)'
+        return f'Сжато секций: {storage.compress(max(keep, 1))}'
+
+    def verify_transactions(repair: bool = False) -> str:
+        """
+        Проверяет записи хранилища. С repair пересчитывает id и баланс,
+        если проверка нашла ошибки; некорректные поля так не исправить
+        """
+        storage: Storage = BudgetTracker._storage()
+        try:
+            errors: List[str] = storage.verify()
+        except ValueError as error:
+            return f'Записи не прочитать: {error}'
+        if not errors:
+            return 'Ошибок не найдено'
+
+        shown: int = BudgetTracker.VERIFY_ERRORS_SHOWN
+        lines: List[str] = [f'Найдено ошибок: {len(errors)}']
+        lines += [f'  {error}' for error in errors[:shown]]
+        if len(errors) > shown:
+            lines.append(f'  ... и ещё {len(errors) - shown}')
+        if repair:
+            try:
+                lines.append(f'Исправлено записей: {storage.repair()}')
+            except (ValueError, KeyError, IndexError):
+                lines.append('Некорректные записи нужно исправить вручную, '
+                             'после этого повторите verify --repair')
+        return '\n'.join(lines)
+
+    def use_wallet(name: str | None = None) -> str:
+        """
+        Переходит в кошелёк name, без имени - список кошельков.
+        "-" - возврат к хранилищу, выбранному без кошелька
+        """
+        if name is None:
+            wallets: Dict[str, str] = BudgetTracker._wallets()
+            if not wallets:
+                return f'Кошельков не найдено в "{BudgetTracker.WALLETS}"'
+            return '\n'.join(
+                f"{'*' if wallet == BudgetTracker.WALLET else ' '} "
+                f"{wallet:<24}{path}" for wallet, path in wallets.items())
+        if name == '-':
+            BudgetTracker.STORAGE, BudgetTracker.DATABASE = \
+                BudgetTracker._home
+            BudgetTracker.WALLET = None
+            return f'Хранилище без кошелька: {BudgetTracker.DATABASE}'
+        try:
+            BudgetTracker._select_wallet(name)
+        except ValueError as error:
+            return str(error)
+        return f'Кошелёк "{name}": {BudgetTracker.DATABASE}'
+
+    def _select_wallet(name: str) -> None:
+        """
+        Делает кошелёк name текущим. Новый кошелёк получает хранилище
+        того вида, что выбран без кошелька
+        """
+        if not BudgetTracker.WALLET_NAME.fullmatch(name):
+            raise ValueError(
+                f'Недопустимое имя кошелька "{name}": разрешены буквы, '
+                f'цифры, "_" и "-", не длиннее 64 символов')
+        path: str | None = BudgetTracker._wallets().get(name)
+        if path is None:
+            extension: str = {'sqlite': '.db', 'partitioned': '.parts'}.get(
+                storage_kind(BudgetTracker._home[1])
+                if BudgetTracker._home[0] is None else BudgetTracker._home[0],
+                '.csv')
+            path = os.path.join(BudgetTracker.WALLETS, name + extension)
+        os.makedirs(BudgetTracker.WALLETS, exist_ok=True)
+        # Вид хранилища кошелька - по расширению его файла
+        BudgetTracker.STORAGE = None
+        BudgetTracker.DATABASE = path
+        BudgetTracker.WALLET = name
+
+    def _wallets() -> Dict[str, str]:
+        """Кошельки из каталога WALLETS: имя -> путь к хранилищу"""
+        try:
+            entries: List[str] = sorted(os.listdir(BudgetTracker.WALLETS))
+        except FileNotFoundError:
+            return {}
+        wallets: Dict[str, str] = {}
+        for entry in entries:
+            # Служебные файлы (.lock, .fts, .journal) не подходят по
+            # расширению
+            name, extension = os.path.splitext(entry)
+            if extension.lower() in BudgetTracker.WALLET_EXTENSIONS \
+                    and BudgetTracker.WALLET_NAME.fullmatch(name):
+                wallets.setdefault(
+                    name, os.path.join(BudgetTracker.WALLETS, entry))
+        return wallets
+
+    def configure(storage: str | None = None, database: str | None = None,
+                  wallet: str | None = None) -> None:
+        """
+        Выбирает хранилище. Без пути используется database.csv, для
+        SQLite - database.db, для секций - каталог database.parts.
+        С wallet выбирается кошелёк из каталога WALLETS
+        """
+        BudgetTracker.STORAGE = storage
+        if database is None:
+            database = {'sqlite': 'database.db',
+                        'partitioned': 'database.parts'}.get(
+                storage, 'database.csv')
+        BudgetTracker.DATABASE = database
+        BudgetTracker._home = (storage, database)
+        BudgetTracker.WALLET = None
+        if wallet is not None:
+            BudgetTracker._select_wallet(wallet)
+
+    def _non_negative(value: str) -> int:
+        """Тип для argparse: целое число не меньше нуля"""
+        if not value.isdigit():
+            raise argparse.ArgumentTypeError(
+                f'ожидается целое неотрицательное число, получено "{value}"')
+        return int(value)
+
+    def _command_parser() -> 'CommandParser':
+        """
+        Парсер команд клиента, общий для интерактивного режима, пакетного
+        режима и командной строки
+        """
+        if BudgetTracker._parser is not None:
+            return BudgetTracker._parser
+
+        parser = CommandParser(prog='', add_help=False)
+        commands = parser.add_subparsers(dest='command')
+
+        paging = CommandParser(add_help=False)
+        paging.add_argument('--limit', type=BudgetTracker._non_negative)
+        paging.add_argument(
+            '--offset', type=BudgetTracker._non_negative, default=0)
+        paging.add_argument('--tail', type=BudgetTracker._non_negative)
+
+        fields = CommandParser(add_help=False)
+        fields.add_argument('--date')
+        fields.add_argument('--category')
+        fields.add_argument('--amount')
+        fields.add_argument('--desc', '--description', dest='description')
+
+        commands.add_parser('help', add_help=False)
+        balance = commands.add_parser(
+            'balance', parents=[paging], add_help=False)
+        balance.add_argument('--at')
+        balance.add_argument('--all', dest='all_', action='store_true')
+        commands.add_parser('add', parents=[fields], add_help=False)
+        patch = commands.add_parser('patch', parents=[fields], add_help=False)
+        patch.add_argument('--id', dest='id_', type=int)
+        search = commands.add_parser(
+            'search', parents=[paging], add_help=False)
+        search.add_argument('-c', dest='categories', action='append',
+                            default=[])
+        search.add_argument('-d', dest='dates', action='append', default=[])
+        search.add_argument('-a', dest='amounts', action='append',
+                            default=[])
+        search.add_argument('-t', dest='texts', action='append', default=[])
+        report = commands.add_parser('report', add_help=False)
+        report.add_argument(
+            '--by', choices=('day', 'month', 'year'), default='month')
+        report.add_argument('--from', dest='start')
+        report.add_argument('--to', dest='end')
+        report.add_argument('--all', dest='all_', action='store_true')
+        commands.add_parser('use', add_help=False).add_argument(
+            'wallet', nargs='?')
+        commands.add_parser('import', add_help=False).add_argument(
+            'file', nargs='?')
+        export = commands.add_parser('export', add_help=False)
+        export.add_argument('file', nargs='?')
+        export.add_argument('--by', choices=('year', 'month'))
+        commands.add_parser('compress', add_help=False).add_argument(
+            '--keep', type=BudgetTracker._non_negative, default=1)
+        commands.add_parser('verify', add_help=False).add_argument(
+            '--repair', action='store_true')
+        commands.add_parser('stats', add_help=False).add_argument(
+            '--cprofile', metavar='FILE', nargs='?', const='')
+        commands.add_parser('exit', add_help=False)
+
+        BudgetTracker._parser = parser
+        return parser
+
+    def execute(argv: List[str]) -> str | Iterator[str] | None:
+        """
+        Выполняет одну команду: argv - имя команды и её параметры, как в
+        командной строке. Ошибка в параметрах возвращается текстом
+        """
+        parser: CommandParser = BudgetTracker._command_parser()
+        if not argv or argv[0] not in parser.command_names():
+            return f'Неизвестная команда "{shlex.join(argv)}"'
+        try:
+            args = parser.parse_args(argv)
+        except CommandError as error:
+            return f'Ошибка в параметрах команды "{argv[0]}": {error}'
+
+        match args.command:
+            case 'help':
+                return BudgetTracker.help()
+            case 'balance':
+                return BudgetTracker.balance(
+                    args.limit, args.offset, args.tail, args.at, args.all_)
+            case 'add':
+                return BudgetTracker.add_transaction(
+                    args.date, args.category, args.amount, args.description)
+            case 'patch':
+                return BudgetTracker.patch_transaction(
+                    args.id_, args.date, args.category, args.amount,
+                    args.description)
+            case 'search':
+                filters: List[Tuple[str, str]] = (
+                    [('-c', value) for value in args.categories]
+                    + [('-d', value) for value in args.dates]
+                    + [('-a', value) for value in args.amounts]
+                    + [('-t', value) for value in args.texts])
+                return BudgetTracker.search_transactions(
+                    filters, args.limit, args.offset, args.tail)
+            case 'report':
+                return BudgetTracker.report(
+                    args.by, args.start, args.end, args.all_)
+            case 'use':
+                return BudgetTracker.use_wallet(args.wallet)
+            case 'import':
+                return BudgetTracker.import_transactions(args.file)
+            case 'export':
+                return BudgetTracker.export_transactions(args.file, args.by)
+            case 'compress':
+                return BudgetTracker.compress_partitions(args.keep)
+            case 'verify':
+                return BudgetTracker.verify_transactions(args.repair)
+            case 'stats':
+                return BudgetTracker.stats(args.cprofile)
+            case 'exit':
+                BudgetTracker.exit()
+
+    def run_batch(file: TextIO) -> None:
+        """
+        Выполняет команды из файла, по одной на строку, в одном процессе.
+        Пустые строки и строки, начинающиеся с #, пропускаются
+        """
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                argv: List[str] = shlex.split(line)
+            except ValueError:
+                print(f'Строка {number}: не закрыта кавычка.')
+                continue
+            BudgetTracker._output(BudgetTracker.execute(argv))
+
+    def stats(cprofile: str | None = None) -> str:
+        """
+        Сводка профилирования по выполненным командам. cprofile - файл
+        для профиля cProfile последней команды, '' - вывести его текстом
+        """
+        profiling = sys.modules.get('profiling')
+        if profiling is None or profiling.PROFILER is None:
+            return ('Профилирование выключено: запустите с --profile '
+                    'или BUDGET_PROFILE=1')
+        if cprofile is not None:
+            return profiling.PROFILER.dump(cprofile)
+        return profiling.PROFILER.summary()
+
     def exit():
         """Выход из программы"""
         print('\nОстановка программы...')
@@ -508,36 +1263,87 @@ class BudgetTracker:
     @classmethod
     def main(cls) -> None:
         """Основная функция для работы с клиентом"""
+        parser = argparse.ArgumentParser(
+            description='Личный финансовый кошелек')
+        parser.add_argument(
+            '--storage', choices=sorted(STORAGES),
+            default=os.environ.get('BUDGET_STORAGE'),
+            help='вид хранилища, по умолчанию - по расширению файла '
+                 '(переменная окружения BUDGET_STORAGE)')
+        parser.add_argument(
+            '--database', default=os.environ.get('BUDGET_DATABASE'),
+            help='путь к файлу с записями (переменная окружения '
+                 'BUDGET_DATABASE)')
+        parser.add_argument(
+            '--wallet', default=os.environ.get('BUDGET_WALLET'),
+            help='кошелёк из каталога кошельков вместо --database '
+                 '(переменная окружения BUDGET_WALLET)')
+        parser.add_argument(
+            '--wallets', metavar='DIR',
+            default=os.environ.get('BUDGET_WALLETS', BudgetTracker.WALLETS),
+            help='каталог кошельков, по умолчанию wallets (переменная '
+                 'окружения BUDGET_WALLETS)')
+        parser.add_argument(
+            '--batch', metavar='FILE',
+            help='выполнить команды из файла, по одной на строку; '
+                 '"-" - из стандартного ввода')
+        parser.add_argument(
+            '--profile', nargs='?', const='1',
+            default=os.environ.get('BUDGET_PROFILE'),
+            choices=('0', '1', 'cprofile'),
+            help='считать время и ввод-вывод команд (см. команду stats); '
+                 'cprofile - ещё и профиль cProfile (переменная окружения '
+                 'BUDGET_PROFILE)')
+        parser.add_argument(
+            'command', nargs=argparse.REMAINDER,
+            help='выполнить одну команду и выйти, например: add --date '
+                 '01.01.2024 --category доход --amount 100 --desc "..."; '
+                 '"serve" запускает сервер (см. serve --help); '
+                 'без команды запускается интерактивный режим')
+        arguments = parser.parse_args()
+        BudgetTracker.WALLETS = arguments.wallets
+        try:
+            BudgetTracker.configure(
+                arguments.storage, arguments.database, arguments.wallet)
+        except ValueError as error:
+            parser.error(str(error))
+        if arguments.profile not in (None, '', '0'):
+            # Без профилирования модуль не загружается вовсе
+            import profiling
+            profiling.enable(cprofile=arguments.profile == 'cprofile')
+
+        if arguments.batch is not None:
+            BudgetTracker.INTERACTIVE = False
+            if arguments.batch == '-':
+                BudgetTracker.run_batch(sys.stdin)
+            else:
+                with open(arguments.batch, 'r', encoding='UTF-8') as file:
+                    BudgetTracker.run_batch(file)
+            return
+        if arguments.command[:1] == ['serve']:
+            # Сервер импортирует клиент, поэтому импорт здесь, а не наверху
+            import server
+            BudgetTracker.INTERACTIVE = False
+            server.main(arguments.command[1:])
+            return
+        if arguments.command:
+            BudgetTracker.INTERACTIVE = False
+            BudgetTracker._output(BudgetTracker.execute(arguments.command))
+            return
+
         print('Добрый день! Введите "help" для просмотра всех комманд')
         while True:
             input_: str = input('Введите комманду: ')
             try:
-                command: str = input_.split(' ')[0]
-                option: str = input_.split(' ')[1]
-                value: str = input_.split(' ')[2]
-            except IndexError:
-                command: str = input_
-            match command:
-                case 'help':
-                    print(BudgetTracker.help())
-                case 'balance':
-                    print(BudgetTracker.balance())
-                case 'add':
-                    print(BudgetTracker.add_transaction())
-                case 'patch':
-                    print(BudgetTracker.patch_transaction())
-                case 'search':
-                    try:
-                        print(BudgetTracker.search_transactions(
-                            option, value
-                        ))
-                    except UnboundLocalError:
-                        print(BudgetTracker.search_transactions())
-                case 'exit':
-                    BudgetTracker.exit()
-                case _:
-                    print(f'Неизвестная команда "{input_}"')
+                argv: List[str] = shlex.split(input_)
+            except ValueError:
+                print('В команде не закрыта кавычка.')
+                continue
+            BudgetTracker._output(BudgetTracker.execute(argv))
 
 
 if __name__ == "__main__":
-    print(BudgetTracker.main())
+    # server и profiling импортируют main: им нужен этот же класс, а не
+    # вторая копия модуля со своими настройками
+    sys.modules['main'] = sys.modules[__name__]
+    BudgetTracker.main()
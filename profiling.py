@@ -0,0 +1,320 @@
+"""
+Профилирование команд клиента. Для каждой команды считаются время
+выполнения, вызовы _get_all_data, полные чтения хранилища, прочитанные и
+записанные байты, разобранные записи и время разбора, фильтрации и
+вывода. Включается флагом --profile или переменной окружения
+BUDGET_PROFILE; значение cprofile дополнительно выполняет каждую команду
+под cProfile.
+Счётчики подключаются обёртками при включении, поэтому без него код
+клиента и хранилища не меняется и ничего не стоит.
+bytes_read - байты, прочитанные с диска: файлы хранилища и импорта,
+открытые через open, и целиком (по размеру файла) файл csv при полном
+чтении через mmap, сжатая секция каталога и база SQLite при полном
+чтении. Чтения SQLite по индексу (поиск, последняя запись) не считаются
+"""
+from typing import Any, Callable, Dict, Iterator, List
+import builtins
+import contextlib
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import time
+
+import storage
+from main import BudgetTracker
+
+
+COUNTERS = ('get_all_data', 'full_reads', 'bytes_read', 'bytes_written',
+            'rows_parsed')
+PHASES = ('parse', 'filter', 'render')
+
+# Сколько функций показывать из профиля cProfile
+PROFILE_LINES: int = 25
+
+
+class CommandStats:
+    """Счётчики одной команды или сумма по всем командам с одним именем"""
+
+    def __init__(self, command: str) -> None:
+        self.command = command
+        self.calls: int = 0
+        self.wall: float = 0.0
+        self.counters: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.phases: Dict[str, float] = dict.fromkeys(PHASES, 0.0)
+
+    def add(self, other: 'CommandStats') -> None:
+        """Прибавляет счётчики другой команды"""
+        self.calls += other.calls
+        self.wall += other.wall
+        for name in COUNTERS:
+            self.counters[name] += other.counters[name]
+        for name in PHASES:
+            self.phases[name] += other.phases[name]
+
+    def render(self) -> str:
+        """Строка сводки"""
+        counters: str = ', '.join(
+            f'{name} {value}' for name, value in self.counters.items())
+        phases: str = ', '.join(
+            f'{name} {value * 1000:.3f} мс'
+            for name, value in self.phases.items())
+        return (f'{self.command}: {self.calls} раз, '
+                f'{self.wall * 1000:.3f} мс; {counters}; {phases}')
+
+
+class Profiler:
+    """Счётчики текущей команды и сводка по выполненным"""
+
+    def __init__(self, cprofile: bool = False) -> None:
+        self.cprofile = cprofile
+        self.current: CommandStats | None = None
+        self.last: CommandStats | None = None
+        self.totals: Dict[str, CommandStats] = {}
+        self.profile: cProfile.Profile | None = None
+        self._started: float = 0.0
+        # Фазы, время которых уже идёт: вложенные вызовы не считаются
+        self._phases: set = set()
+
+    def start(self, command: str) -> None:
+        """Начало команды; незавершённая предыдущая завершается"""
+        if self.current is not None:
+            self.finish()
+        self.current = CommandStats(command)
+        self.current.calls = 1
+        if self.cprofile:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self._started = time.perf_counter()
+
+    def finish(self) -> None:
+        """Конец команды: её счётчики добавляются в сводку"""
+        stats: CommandStats | None = self.current
+        if stats is None:
+            return
+        stats.wall = time.perf_counter() - self._started
+        if self.profile is not None:
+            self.profile.disable()
+        self.current = None
+        self.last = stats
+        name: str = stats.command.split(' ', 1)[0]
+        self.totals.setdefault(name, CommandStats(name)).add(stats)
+
+    def count(self, name: str, value: int) -> None:
+        """Увеличивает счётчик текущей команды"""
+        if self.current is not None:
+            self.current.counters[name] += value
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Блок, время которого относится к фазе name"""
+        if self.current is None or name in self._phases:
+            yield
+            return
+        self._phases.add(name)
+        started: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._phases.discard(name)
+            if self.current is not None:
+                self.current.phases[name] += time.perf_counter() - started
+
+    def follow(self, result: Iterator[str]) -> Iterator[str]:
+        """Вывод команды; команда завершается, когда он выведен"""
+        try:
+            yield from result
+        finally:
+            self.finish()
+
+    def summary(self) -> str:
+        """Сводка по командам и последняя команда"""
+        if not self.totals:
+            return 'Команды ещё не выполнялись'
+        lines: List[str] = ['Всего по командам:']
+        lines += [f'  {stats.render()}' for stats in self.totals.values()]
+        lines.append(f'Последняя команда:\n  {self.last.render()}')
+        return '\n'.join(lines)
+
+    def dump(self, path: str | None = None) -> str:
+        """
+        Профиль cProfile последней команды: в файл path (формат pstats)
+        или самые долгие функции текстом
+        """
+        if not self.cprofile:
+            return ('cProfile не включён: запустите с --profile cprofile '
+                    'или BUDGET_PROFILE=cprofile')
+        if self.profile is None or self.last is None:
+            return 'Команды ещё не выполнялись'
+        if path:
+            self.profile.dump_stats(path)
+            return f'Профиль команды "{self.last.command}" сохранён в {path}'
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats(
+            'cumulative').print_stats(PROFILE_LINES)
+        return f'Профиль команды "{self.last.command}":\n{stream.getvalue()}'
+
+
+class CountingFile:
+    """Файл, считающий прочитанные и записанные байты"""
+
+    def __init__(self, file: Any, profiler: Profiler) -> None:
+        self._file = file
+        self._profiler = profiler
+
+    def _size(self, data: bytes | str) -> int:
+        return len(data.encode('UTF-8', 'surrogateescape')
+                   if isinstance(data, str) else data)
+
+    def read(self, *args: Any) -> bytes | str:
+        data = self._file.read(*args)
+        self._profiler.count('bytes_read', self._size(data))
+        return data
+
+    def readline(self, *args: Any) -> bytes | str:
+        data = self._file.readline(*args)
+        self._profiler.count('bytes_read', self._size(data))
+        return data
+
+    def __iter__(self) -> Iterator[bytes | str]:
+        for line in self._file:
+            self._profiler.count('bytes_read', self._size(line))
+            yield line
+
+    def write(self, data: bytes | str) -> int:
+        self._profiler.count('bytes_written', self._size(data))
+        return self._file.write(data)
+
+    def __enter__(self) -> 'CountingFile':
+        self._file.__enter__()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> Any:
+        return self._file.__exit__(*exc_info)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._file, name)
+
+
+# Включённый профилировщик или None
+PROFILER: Profiler | None = None
+
+
+def enable(cprofile: bool = False) -> Profiler:
+    """Подключает счётчики к клиенту и хранилищам"""
+    global PROFILER
+    if PROFILER is not None:
+        PROFILER.cprofile = PROFILER.cprofile or cprofile
+        return PROFILER
+    profiler = PROFILER = Profiler(cprofile)
+
+    def timed(phase: str, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profiler.phase(phase):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def timed_iter(phase: str, func: Callable) -> Callable:
+        # Генератор работает, когда из него берут строки, а не при вызове
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            iterator: Iterator[str] = func(*args, **kwargs)
+            while True:
+                with profiler.phase(phase):
+                    try:
+                        chunk: str = next(iterator)
+                    except StopIteration:
+                        return
+                yield chunk
+        return wrapper
+
+    def counted(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler.count('get_all_data', 1)
+            return func(*args, **kwargs)
+        return wrapper
+
+    def full_read(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with profiler.phase('parse'):
+                data = func(self, *args, **kwargs)
+            profiler.count('full_reads', 1)
+            profiler.count('rows_parsed', len(data))
+            # Файл csv разбирается через mmap, а базу SQLite читает сама
+            # sqlite3 - мимо open, поэтому считается размер файла
+            with contextlib.suppress(OSError):
+                profiler.count('bytes_read', os.path.getsize(self.path))
+            return data
+        return wrapper
+
+    def last_read(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with profiler.phase('parse'):
+                row = func(self, *args, **kwargs)
+            profiler.count('rows_parsed', row is not None)
+            return row
+        return wrapper
+
+    def partition_read(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self, entry: Dict[str, Any]):
+            with profiler.phase('parse'):
+                data = func(self, entry)
+            profiler.count('rows_parsed', len(data))
+            # Сжатую секцию открывает gzip, мимо open хранилища
+            if entry['compressed']:
+                with contextlib.suppress(OSError):
+                    profiler.count('bytes_read', os.path.getsize(
+                        os.path.join(self.path, entry['file'])))
+            return data
+        return wrapper
+
+    def execute(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(argv: List[str]):
+            # Сама сводка не заменяет последнюю команду
+            if argv[:1] == ['stats']:
+                return func(argv)
+            profiler.start(' '.join(argv))
+            try:
+                result = func(argv)
+            except BaseException:
+                profiler.finish()
+                raise
+            if result is None or isinstance(result, str):
+                profiler.finish()
+                return result
+            return profiler.follow(result)
+        return wrapper
+
+    def counting_open(*args, **kwargs) -> CountingFile:
+        return CountingFile(builtins.open(*args, **kwargs), profiler)
+
+    # Хранилища и чтение файла импорта в клиенте
+    storage.open = counting_open
+    sys.modules[BudgetTracker.__module__].open = counting_open
+    for cls in (storage.CsvStorage, storage.SqliteStorage):
+        cls.read = full_read(cls.read)
+        cls.read_last = last_read(cls.read_last)
+    # Каталог секций читает записи по секциям при обращении
+    storage.PartitionedStorage.read_last = last_read(
+        storage.PartitionedStorage.read_last)
+    storage.PartitionedStorage._read_partition = partition_read(
+        storage.PartitionedStorage._read_partition)
+
+    BudgetTracker.execute = execute(BudgetTracker.execute)
+    BudgetTracker._get_all_data = counted(BudgetTracker._get_all_data)
+    for name in ('_filter_positions', '_filter_transactions'):
+        setattr(BudgetTracker, name,
+                timed('filter', getattr(BudgetTracker, name)))
+    for name in ('_render_balance', '_render_search'):
+        setattr(BudgetTracker, name,
+                timed_iter('render', getattr(BudgetTracker, name)))
+    BudgetTracker.report = timed('render', BudgetTracker.report)
+    return profiler
@@ -0,0 +1,241 @@
+"""
+Сервер кошелька: держит записи в памяти и выполняет команды клиентов,
+присланные по сокету. Протокол - JSON по одному объекту на строку:
+запрос {"id": ..., "command": "add --date 01.01.2024 ..."} (или "argv" -
+список слов команды), ответ {"id": ..., "output": "..."} либо
+{"id": ..., "error": "..."}
+"""
+from typing import Any, Dict, List, Tuple
+import argparse
+import asyncio
+import json
+import shlex
+
+from ledger import Category, Transaction, parse_cents, parse_date
+from main import BudgetTracker
+
+
+# Команды, меняющие записи (verify - с --repair). Выполняются по очереди
+# одной задачей записи, остальные - сразу по данным в памяти
+WRITE_COMMANDS = ('add', 'patch', 'import', 'compress', 'verify')
+# Команды, которые не имеют смысла без терминала или сменили бы кошелёк
+# всем клиентам сразу: кошелёк сервера задаётся при запуске (--wallet)
+FORBIDDEN_COMMANDS = ('exit', 'use')
+
+# Наибольшая длина строки запроса
+LINE_LIMIT: int = 2**20
+
+# Наибольшее число команд записи в одной пачке: между пачками
+# выполняются ждущие чтения
+WRITE_BATCH_LIMIT: int = 1000
+
+# Результат команды записи: (future клиента, вывод или исключение)
+Outcome = Tuple[asyncio.Future, str | BaseException]
+
+
+class Server:
+    """
+    Обработка запросов. Чтение выполняется в цикле событий по данным в
+    памяти, запись - через очередь единственной задачей writer, которая
+    объединяет подряд идущие add в одну запись в хранилище.
+    Пачка записи выполняется в отдельном потоке, поэтому долгие import,
+    verify и compress не останавливают цикл событий: соединения
+    принимаются, запросы разбираются и ставятся в очередь. Чтения на
+    это время ждут конца пачки - записи в памяти в это время меняются
+    """
+
+    def __init__(self) -> None:
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # Установлено, когда пачка записи не выполняется
+        self.idle: asyncio.Event = asyncio.Event()
+        self.idle.set()
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        """Обслуживает одно соединение: запросы по одному на строку"""
+        try:
+            while line := await reader.readline():
+                response: Dict[str, Any] = await self.respond(line)
+                writer.write(json.dumps(
+                    response, ensure_ascii=False).encode('UTF-8') + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, line: bytes) -> Dict[str, Any]:
+        """Ответ на одну строку запроса"""
+        response: Dict[str, Any] = {'id': None}
+        try:
+            request: Any = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('запрос должен быть объектом JSON')
+            # id возвращается и с ошибкой: по нему клиент, отправивший
+            # несколько запросов подряд, находит, к какому она относится
+            response['id'] = request.get('id')
+            if 'argv' in request:
+                argv: List[str] = request['argv']
+            else:
+                # shlex.split(None) читал бы команду из stdin сервера
+                if not isinstance(request.get('command'), str):
+                    raise ValueError('"command" должен быть строкой')
+                argv = shlex.split(request['command'])
+            if not isinstance(argv, list) or not all(
+                    isinstance(word, str) for word in argv):
+                raise ValueError('"argv" должен быть списком строк')
+        except Exception as error:
+            response['error'] = f'Некорректный запрос: {error}'
+            return response
+
+        if argv[:1] and argv[0] in FORBIDDEN_COMMANDS:
+            response['error'] = f'Команда "{argv[0]}" недоступна на сервере'
+            return response
+        try:
+            if argv[:1] and argv[0] in WRITE_COMMANDS:
+                future: asyncio.Future = \
+                    asyncio.get_running_loop().create_future()
+                await self.queue.put((argv, future))
+                response['output'] = await future
+            else:
+                await self.idle.wait()
+                response['output'] = run(argv)
+        except Exception as error:
+            response['error'] = f'{type(error).__name__}: {error}'
+        return response
+
+    async def writer(self) -> None:
+        """Единственная задача, которая меняет записи"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: List[Tuple[List[str], asyncio.Future]] = [
+                await self.queue.get()]
+            while not self.queue.empty() \
+                    and len(batch) < WRITE_BATCH_LIMIT:
+                batch.append(self.queue.get_nowait())
+            self.idle.clear()
+            try:
+                outcomes: List[Outcome] = await loop.run_in_executor(
+                    None, write, batch)
+            except Exception as error:
+                outcomes = [(future, error) for _, future in batch]
+            finally:
+                self.idle.set()
+            # future можно завершать только в потоке цикла событий
+            for future, result in outcomes:
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+def run(argv: List[str]) -> str:
+    """Выполняет команду клиента и возвращает её вывод целиком"""
+    result = BudgetTracker.execute(argv)
+    if result is None or isinstance(result, str):
+        return result or ''
+    return ''.join(result)
+
+
+def write(batch: List[Tuple[List[str], asyncio.Future]]) -> List[Outcome]:
+    """
+    Выполняет пачку команд записи по порядку и возвращает их результаты.
+    Подряд идущие add дописываются одним вызовом extend: одна блокировка
+    и один fsync. Выполняется вне цикла событий
+    """
+    outcomes: List[Outcome] = []
+    added: List[Tuple[Transaction, asyncio.Future]] = []
+    for argv, future in batch:
+        if argv[0] == 'add':
+            row: Transaction | str = prepare_add(argv)
+            if isinstance(row, str):
+                outcomes.append((future, row))
+            else:
+                added.append((row, future))
+            continue
+        outcomes += flush(added)
+        try:
+            outcomes.append((future, run(argv)))
+        except Exception as error:
+            outcomes.append((future, error))
+    outcomes += flush(added)
+    return outcomes
+
+
+def prepare_add(argv: List[str]) -> Transaction | str:
+    """Новая запись по команде add или текст ошибки"""
+    try:
+        args = BudgetTracker._command_parser().parse_args(argv)
+    except Exception as error:
+        return f'Ошибка в параметрах команды "add": {error}'
+    error: str | None = BudgetTracker._check_fields(
+        args.date, args.category, args.amount, args.description) \
+        or BudgetTracker._check_complete(
+            args.date, args.category, args.amount, args.description)
+    if error:
+        return error
+    return Transaction(
+        0, parse_date(args.date), Category.parse(args.category.lower()),
+        parse_cents(args.amount), args.description, 0)
+
+
+def flush(added: List[Tuple[Transaction, asyncio.Future]]
+          ) -> List[Outcome]:
+    """Дописывает накопленные записи add; результаты для их клиентов"""
+    if not added:
+        return []
+    try:
+        BudgetTracker._storage().extend([row for row, _ in added])
+    except Exception as error:
+        outcomes: List[Outcome] = [(future, error) for _, future in added]
+    else:
+        outcomes = [(future, BudgetTracker._added(row))
+                    for row, future in added]
+    added.clear()
+    return outcomes
+
+
+async def serve(host: str, port: int, unix: str | None = None) -> None:
+    """Загружает записи и принимает соединения до остановки"""
+    storage = BudgetTracker._storage()
+    # Первое чтение и индексы - до приёма запросов
+    storage.load()
+    storage.indexes()
+
+    server = Server()
+    writer: asyncio.Task = asyncio.create_task(server.writer())
+    if unix is not None:
+        listener = await asyncio.start_unix_server(
+            server.handle, unix, limit=LINE_LIMIT)
+        address: str = unix
+    else:
+        listener = await asyncio.start_server(
+            server.handle, host, port, limit=LINE_LIMIT)
+        address = ', '.join(
+            f'{sock.getsockname()[0]}:{sock.getsockname()[1]}'
+            for sock in listener.sockets)
+    print(f'Сервер слушает {address}, записей: {len(storage.load())}',
+          flush=True)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        writer.cancel()
+
+
+def main(argv: List[str] | None = None) -> None:
+    """Разбор параметров serve и запуск сервера"""
+    parser = argparse.ArgumentParser(
+        prog='main.py serve', description='Сервер кошелька')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='порт, 0 - любой свободный')
+    parser.add_argument('--unix', metavar='PATH',
+                        help='слушать unix-сокет вместо TCP')
+    arguments = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(arguments.host, arguments.port, arguments.unix))
+    except KeyboardInterrupt:
+        print('\nОстановка сервера...')
@@ -0,0 +1,2158 @@
+"""Хранилища записей: csv-файл, каталог csv-файлов по периодам и база SQLite"""
+from typing import (
+    Any, BinaryIO, Callable, ContextManager, Dict, Iterable, Iterator, List,
+    Sequence, Tuple)
+from array import array
+import bisect
+import concurrent.futures
+import contextlib
+import csv
+import datetime
+import gzip
+import io
+import itertools
+import json
+import mmap
+import os
+import pathlib
+import re
+import sqlite3
+import zlib
+
+try:
+    import fcntl
+# Windows: блокировок между процессами нет
+except ImportError:
+    fcntl = None
+
+from ledger import (
+    Category, Ledger, Transaction, date_parser, format_cents, format_date,
+    month_of, parse_cents, parse_date)
+
+
+HEADER = ['id', 'date', 'category', 'amount', 'description', 'balance']
+
+# Версия формата сохранённого индекса описаний
+TEXT_INDEX_VERSION: int = 2
+
+# Версия формата сохранённых контрольных сумм проверки
+VERIFY_VERSION: int = 1
+
+
+def fold_text(text: str) -> str:
+    """Текст для поиска без учёта регистра; ё не отличается от е"""
+    return text.casefold().replace('ё', 'е')
+
+
+def trigrams(text: str) -> set:
+    """Все подстроки длиной 3 символа"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def format_rows(rows: Iterable[Transaction]) -> bytes:
+    """Строки csv-файла для записей"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # Одна и та же дата встречается во многих записях
+    dates: Dict[int, str] = {}
+    for trans in rows:
+        date: str | None = dates.get(trans.date)
+        if date is None:
+            date = dates[trans.date] = format_date(trans.date)
+        writer.writerow([
+            trans.id, date, trans.category.label,
+            format_cents(trans.amount), trans.description,
+            format_cents(trans.balance)])
+    return buffer.getvalue().encode('UTF-8')
+
+
+# Начало строки с записью: id и дата. Перевод строки внутри описания в
+# кавычках так не выглядит
+_ROW_START = re.compile(rb'\d+,\d\d\.\d\d\.\d{4},')
+
+
+def read_chunk(path: str, start: int, end: int) -> Ledger:
+    """
+    Разбирает записи в байтах [start, end) файла path. Функция верхнего
+    уровня, чтобы её можно было выполнять в пуле процессов
+    """
+    with open(path, 'rb') as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        text: str = view[start:end].decode('UTF-8')
+    return parse_rows(text)
+
+
+def parse_rows(text: str) -> Ledger:
+    """Разбирает строки записей csv-файла (без заголовка)"""
+    data = Ledger()
+    parse_date: Callable[[str], int] = date_parser()
+    append_row = data.append_row
+    for param in csv.reader(io.StringIO(text, newline='')):
+        if not param:
+            continue
+        append_row(
+            int(param[0]), parse_date(param[1]), Category.parse(param[2]),
+            parse_cents(param[3]), param[4], parse_cents(param[5]))
+    return data
+
+
+def _last_record_start(tail: bytes, whole: bool) -> int | None:
+    """
+    Начало последней записи в tail - конце файла без перевода строки
+    после последней записи. None - начало раньше tail; whole - tail
+    начинается с начала файла. Перевод строки внутри описания в кавычках
+    не начинает запись: после него до конца файла нечётное число кавычек
+    """
+    end: int = len(tail)
+    quotes: int = 0
+    while True:
+        newline: int = tail.rfind(b'\n', 0, end)
+        quotes += tail.count(b'"', newline + 1, end)
+        if quotes % 2 == 0 and (newline >= 0 or whole):
+            return newline + 1
+        if newline < 0:
+            return None
+        end = newline
+
+
+def read_last_row(path: str, size: int | None = None) -> Transaction | None:
+    """
+    Последняя запись csv-файла без разбора всего файла: файл читается с
+    конца блоками до начала последней записи. size - сколько байт файла
+    считать, по умолчанию весь файл. None - только если записей нет; если
+    конец файла не разобрать, читается весь файл
+    """
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+
+    with file:
+        position: int = file.seek(0, os.SEEK_END)
+        if size is not None:
+            position = min(position, size)
+        end: int = position
+        tail: bytes = b''
+        start: int | None = None
+        while position > 0:
+            step = min(4096, position)
+            position -= step
+            file.seek(position)
+            tail = file.read(step) + tail
+            start = _last_record_start(tail.rstrip(b'\r\n'), position == 0)
+            if start is not None:
+                break
+
+    if start is None:
+        return None
+    rows: List[List[str]] = list(csv.reader(io.StringIO(
+        tail.rstrip(b'\r\n')[start:].decode('UTF-8', errors='replace'),
+        newline='')))
+    # Пустой файл или только заголовок
+    if not rows or position == 0 and start == 0 and rows[0][:1] == ['id']:
+        return None
+    try:
+        row: List[str] = rows[0]
+        if len(rows) != 1 or len(row) != len(HEADER):
+            raise ValueError(f'в последней записи {len(row)} полей')
+        return Transaction(
+            int(row[0]), parse_date(row[1]), Category.parse(row[2]),
+            parse_cents(row[3]), row[4], parse_cents(row[5]))
+    except (ValueError, KeyError):
+        pass
+    # Конец файла не похож на запись: записи разбираются целиком, а
+    # некорректная запись даёт ошибку, а не пустой файл
+    with open(path, 'rb') as file:
+        header: int = len(file.readline())
+    data: Ledger = read_chunk(path, header, end)
+    if not len(data):
+        raise ValueError(f'В файле "{path}" не разобрать последнюю запись')
+    return data[-1]
+
+
+def link_errors(previous: Sequence[int],
+                row: Sequence[int]) -> List[str]:
+    """
+    Ошибки связи записи row (id, сумма со знаком, баланс) с предыдущей
+    previous (id, баланс): id должен быть следующим по порядку, баланс -
+    балансом предыдущей плюс сумма
+    """
+    errors: List[str] = []
+    if row[0] != previous[0] + 1:
+        errors.append(f'id {row[0]} после id {previous[0]}')
+    if row[2] != previous[1] + row[1]:
+        errors.append(
+            f'id {row[0]}: баланс {format_cents(row[2])}, ожидается '
+            f'{format_cents(previous[1] + row[1])}')
+    return errors
+
+
+def check_sequence(rows: Iterable[Tuple[int, int, int] | str]
+                   ) -> Dict[str, Any]:
+    """
+    Проверяет подряд идущие записи: (id, сумма со знаком, баланс) или
+    текст ошибки разбора записи. Первая запись сверяется с предыдущими
+    позже, при склейке (merge_checks), поэтому возвращаются число записей,
+    первая запись, последняя (id, баланс) и ошибки (номер записи, текст)
+    """
+    count: int = 0
+    first: List[int] | None = None
+    previous: List[int] | None = None
+    errors: List[List[Any]] = []
+    for count, row in enumerate(rows, 1):
+        if isinstance(row, str):
+            errors.append([count - 1, row])
+            previous = None
+            continue
+        if count == 1:
+            first = list(row)
+        elif previous is not None:
+            errors += [[count - 1, error]
+                       for error in link_errors(previous, row)]
+        previous = [row[0], row[2]]
+    return {'rows': count, 'first': first, 'last': previous,
+            'errors': errors}
+
+
+def merge_checks(checks: Iterable[Dict[str, Any]]) -> List[str]:
+    """
+    Склеивает результаты check_sequence подряд идущих кусков записей:
+    сверяет первую запись каждого куска с последней предыдущего и
+    нумерует ошибки по всему хранилищу
+    """
+    errors: List[str] = []
+    offset: int = 0
+    # Перед первой записью: id 0 и нулевой баланс
+    previous: List[int] | None = [0, 0]
+    for check in checks:
+        if not check['rows']:
+            continue
+        if check['first'] is not None and previous is not None:
+            errors += [f'запись {offset + 1}: {error}'
+                       for error in link_errors(previous, check['first'])]
+        errors += [f'запись {offset + index + 1}: {error}'
+                   for index, error in check['errors']]
+        offset += check['rows']
+        previous = check['last']
+    return errors
+
+
+def verify_chunk(path: str, start: int, end: int) -> Dict[str, Any]:
+    """
+    Проверяет записи в байтах [start, end) файла path: поля каждой записи,
+    порядок id и баланс (см. check_sequence). Некорректная запись не
+    прерывает проверку. Функция верхнего уровня, чтобы её можно было
+    выполнять в пуле процессов
+    """
+    with open(path, 'rb') as file, mmap.mmap(
+            file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        text: str = view[start:end].decode('UTF-8', errors='replace')
+    parse_date: Callable[[str], int] = date_parser()
+
+    def rows() -> Iterator[Tuple[int, int, int] | str]:
+        for param in csv.reader(io.StringIO(text, newline='')):
+            if not param:
+                continue
+            if len(param) != len(HEADER):
+                yield f'полей {len(param)} вместо {len(HEADER)}'
+                continue
+            try:
+                parse_date(param[1])
+                category: Category = Category.parse(param[2])
+                amount: int = parse_cents(param[3])
+                yield (int(param[0]),
+                       -amount if category else amount,
+                       parse_cents(param[5]))
+            except KeyError:
+                yield f'неизвестная категория {param[2]!r}'
+            except (ValueError, ArithmeticError) as error:
+                yield f'некорректная запись: {error}'
+    return check_sequence(rows())
+
+
+class Storage:
+    """
+    Базовое хранилище. Держит в памяти разобранные записи (Ledger) и
+    индексы к ним, пока данные не изменены извне; собственные изменения
+    сразу вносятся и в память.
+    Наследники реализуют чтение и запись: signature, read, read_last,
+    write_rows, write_replace, write_all и, при необходимости, transaction
+    """
+
+    # Через сколько записей в порядке дат хранится баланс для balance_at
+    CHECKPOINT_EVERY: int = 1024
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._signature: Any = None
+        self._data: Ledger | None = None
+        self._indexes: Dict[str, Any] | None = None
+        self._rollups: Dict[str, Dict[int, List[int]]] | None = None
+        self._text: Dict[str, Any] | None = None
+        # Изменений, дописанных в файл индекса описаний после его снимка
+        self._text_log: int = 0
+
+    # Операции конкретного хранилища
+
+    def signature(self) -> Any:
+        """Значение, которое меняется при изменении данных извне"""
+        raise NotImplementedError
+
+    def read(self) -> Ledger:
+        """Считывает все записи"""
+        raise NotImplementedError
+
+    def read_last(self) -> Transaction | None:
+        """Считывает только последнюю запись"""
+        raise NotImplementedError
+
+    def write_rows(self, rows: List[Transaction]) -> None:
+        """Дописывает записи в конец"""
+        raise NotImplementedError
+
+    def write_replace(self, data: Ledger, index: int, old: Transaction,
+                      delta: int) -> None:
+        """
+        Сохраняет запись data[index], заменившую old; баланс всех
+        последующих записей в data уже сдвинут на delta
+        """
+        raise NotImplementedError
+
+    def write_all(self, data: Ledger) -> None:
+        """Заменяет все записи хранилища на data"""
+        raise NotImplementedError
+
+    def transaction(self) -> ContextManager:
+        """Блок, в котором чтение и запись выполняются как одно целое"""
+        return contextlib.nullcontext()
+
+    def close(self) -> None:
+        """Освобождает ресурсы хранилища"""
+
+    # Общая логика
+
+    def load(self) -> Ledger:
+        """
+        Все записи. Данные читаются заново, только если они изменились
+        с момента прошлого чтения
+        """
+        signature = self.signature()
+        if self._data is None or self._signature != signature:
+            self._data = self.read()
+            self._indexes = None
+            self._rollups = None
+            self._text = None
+            self._signature = signature
+        return self._data
+
+    def invalidate(self) -> None:
+        """Сбрасывает записи в памяти, следующее чтение загрузит их заново"""
+        self._data = None
+        self._indexes = None
+        self._rollups = None
+        self._text = None
+        self._signature = None
+
+    def is_loaded(self) -> bool:
+        """Совпадают ли записи в памяти с хранилищем"""
+        return (self._data is not None
+                and self._signature == self.signature())
+
+    def extend(self, rows: Iterable[Transaction]) -> List[Transaction]:
+        """
+        Дописывает записи в конец, назначая им id и баланс по порядку.
+        Для расчёта нужна только последняя запись, поэтому если записи
+        не загружены в память, читается лишь она
+        """
+        with self.transaction():
+            loaded: bool = self.is_loaded()
+            if loaded:
+                last: Transaction | None = (
+                    self._data[-1] if self._data else None)
+            else:
+                last = self.read_last()
+
+            added: List[Transaction] = []
+            for row in rows:
+                row.id = last.id + 1 if last else 1
+                row.balance = (last.balance if last else 0) \
+                    + row.signed_amount
+                added.append(row)
+                last = row
+            self.write_rows(added)
+
+            if not loaded:
+                self.invalidate()
+                return added
+            # Подпись берётся до снятия блокировки, иначе в неё попадут
+            # чужие изменения, которых нет в памяти
+            for row in added:
+                self._data.append(row)
+            # Секционированные записи узнают о новых строках из манифеста
+            # уже при write_rows, поэтому позиции считаются от длины после
+            # добавления, а не по одной
+            start: int = len(self._data) - len(added)
+            for i, row in enumerate(added):
+                if self._indexes is not None:
+                    self._index_insert(start + i, row)
+                if self._rollups is not None:
+                    self._rollup_add(row, 1)
+                if self._text is not None:
+                    self._text_insert(start + i, row.description)
+            previous, self._signature = self._signature, self.signature()
+            if self._text is not None:
+                self._log_text_index(previous, [], [
+                    (start + i, row.description)
+                    for i, row in enumerate(added)])
+        return added
+
+    def append(self, row: Transaction) -> Transaction:
+        """Дописывает одну запись, см. extend"""
+        return self.extend([row])[0]
+
+    def replace(self, index: int, patched: Transaction) -> None:
+        """
+        Заменяет запись на позиции index и сдвигает баланс последующих.
+        Баланс каждой следующей записи меняется на одну и ту же разницу,
+        поэтому он не пересчитывается суммированием
+        """
+        with self.transaction():
+            data: Ledger = self.load()
+            old: Transaction = data[index]
+            # Баланс считается заново: до блокировки записи могли
+            # измениться в другом процессе
+            patched.balance = patched.signed_amount + (
+                data.balances[index - 1] if index > 0 else 0)
+            delta: int = patched.balance - old.balance
+            try:
+                data[index] = patched
+                if delta:
+                    data.shift_balances(index + 1, delta)
+                self.write_replace(data, index, old, delta)
+            except BaseException:
+                # Записи в памяти уже изменены, а хранилище могло остаться
+                # прежним
+                self.invalidate()
+                raise
+            if self._indexes is not None:
+                self._index_remove(index, old)
+                self._index_insert(index, patched)
+            if self._rollups is not None:
+                self._rollup_add(old, -1)
+                self._rollup_add(patched, 1)
+            changed: bool = old.description != patched.description
+            if self._text is not None and changed:
+                self._text_remove(index, old.description)
+                self._text_insert(index, patched.description)
+            previous, self._signature = self._signature, self.signature()
+            if self._text is not None:
+                self._log_text_index(
+                    previous, [(index, old.description)] if changed else [],
+                    [(index, patched.description)] if changed else [])
+
+    # Поиск
+
+    def indexes(self) -> Dict[str, Any]:
+        """
+        Индексы для поиска по записям в памяти, строятся при первом
+        обращении и обновляются при добавлении и изменении записей:
+        'dates', 'date_positions' - отсортированные даты и позиции записей;
+        'amounts' - сумма -> позиции, 'amount_keys' - отсортированные суммы;
+        'categories' - категория -> позиции;
+        'checkpoints' - баланс по первым i * CHECKPOINT_EVERY записям в
+        порядке дат
+        """
+        data: Ledger = self.load()
+        if self._indexes is not None:
+            return self._indexes
+
+        # Сортировка устойчивая - записи с одной датой идут в порядке id
+        by_date: List[int] = sorted(
+            range(len(data)), key=data.dates.__getitem__)
+        indexes: Dict[str, Any] = {
+            'dates': array('i', (data.dates[i] for i in by_date)),
+            'date_positions': array('q', by_date),
+            'amounts': {},
+            'categories': {category: array('q') for category in Category},
+            'checkpoints': array('q', [0]),
+        }
+        amounts: Dict[int, List[int]] = indexes['amounts']
+        for position, amount in enumerate(data.amounts):
+            amounts.setdefault(amount, []).append(position)
+        for position, category in enumerate(data.categories):
+            indexes['categories'][category].append(position)
+        indexes['amount_keys'] = sorted(amounts)
+
+        self._indexes = indexes
+        checkpoints: array = indexes['checkpoints']
+        balance: int = 0
+        for sorted_index in range(len(by_date)):
+            balance += self._signed_at(sorted_index)
+            if (sorted_index + 1) % self.CHECKPOINT_EVERY == 0:
+                checkpoints.append(balance)
+        return indexes
+
+    def _signed_at(self, sorted_index: int) -> int:
+        """Изменение баланса записью с номером sorted_index в порядке дат"""
+        position: int = self._indexes['date_positions'][sorted_index]
+        amount: int = self._data.amounts[position]
+        return (amount if self._data.categories[position] == Category.INCOME
+                else -amount)
+
+    def _date_index(self, date: int, position: int) -> int:
+        """Номер записи в порядке дат по её дате и позиции"""
+        indexes: Dict[str, Any] = self._indexes
+        low: int = bisect.bisect_left(indexes['dates'], date)
+        high: int = bisect.bisect_right(indexes['dates'], date, low)
+        # Записи с одной датой идут по возрастанию позиции
+        return bisect.bisect_left(
+            indexes['date_positions'], position, low, high)
+
+    def _index_insert(self, position: int, row: Transaction) -> None:
+        """Добавляет в индексы запись row, стоящую на позиции position"""
+        indexes: Dict[str, Any] = self._indexes
+        insertion: int = self._date_index(row.date, position)
+        indexes['dates'].insert(insertion, row.date)
+        indexes['date_positions'].insert(insertion, position)
+
+        # Первые i * N записей по дате получили новую запись и потеряли ту,
+        # что сдвинулась на место i * N
+        every: int = self.CHECKPOINT_EVERY
+        checkpoints: array = indexes['checkpoints']
+        for i in range(insertion // every + 1, len(checkpoints)):
+            checkpoints[i] += row.signed_amount - self._signed_at(i * every)
+        total: int = len(indexes['dates'])
+        if total % every == 0:
+            checkpoints.append(checkpoints[-1] + sum(
+                map(self._signed_at, range(total - every, total))))
+
+        positions: List[int] = indexes['amounts'].setdefault(row.amount, [])
+        if not positions:
+            bisect.insort(indexes['amount_keys'], row.amount)
+        bisect.insort(positions, position)
+
+        bisect.insort(indexes['categories'][row.category], position)
+
+    def _index_remove(self, position: int, row: Transaction) -> None:
+        """Убирает из индексов запись row, стоявшую на позиции position"""
+        indexes: Dict[str, Any] = self._indexes
+        removal: int = self._date_index(row.date, position)
+        del indexes['dates'][removal]
+        del indexes['date_positions'][removal]
+
+        # Первые i * N записей по дате потеряли запись и получили ту,
+        # что сдвинулась на место i * N - 1
+        every: int = self.CHECKPOINT_EVERY
+        checkpoints: array = indexes['checkpoints']
+        if len(checkpoints) > len(indexes['dates']) // every + 1:
+            checkpoints.pop()
+        for i in range(removal // every + 1, len(checkpoints)):
+            checkpoints[i] += self._signed_at(i * every - 1) \
+                - row.signed_amount
+
+        positions: List[int] = indexes['amounts'][row.amount]
+        del positions[bisect.bisect_left(positions, position)]
+        if not positions:
+            del indexes['amounts'][row.amount]
+            keys: List[int] = indexes['amount_keys']
+            del keys[bisect.bisect_left(keys, row.amount)]
+
+        categories: array = indexes['categories'][row.category]
+        del categories[bisect.bisect_left(categories, position)]
+
+    def balance_at(self, date: int) -> int:
+        """
+        Баланс на конец дня date: сумма всех записей с датой не позже
+        date, независимо от порядка записей в хранилище. Берётся ближайшая
+        контрольная точка и досчитываются не больше CHECKPOINT_EVERY записей
+        """
+        indexes: Dict[str, Any] = self.indexes()
+        count: int = bisect.bisect_right(indexes['dates'], date)
+        checkpoint: int = count // self.CHECKPOINT_EVERY
+        return indexes['checkpoints'][checkpoint] + sum(map(
+            self._signed_at,
+            range(checkpoint * self.CHECKPOINT_EVERY, count)))
+
+    def positions(self, field: str, low: int | None,
+                  high: int | None) -> Sequence[int]:
+        """
+        Позиции записей в порядке id, у которых поле field ('category',
+        'date' или 'amount') лежит в диапазоне [low, high].
+        None - открытая граница
+        """
+        indexes: Dict[str, Any] = self.indexes()
+        match field:
+            case 'category':
+                return indexes['categories'][low]
+
+            case 'date':
+                dates: array = indexes['dates']
+                start: int = (0 if low is None
+                              else bisect.bisect_left(dates, low))
+                end: int = (len(dates) if high is None
+                            else bisect.bisect_right(dates, high))
+                return sorted(indexes['date_positions'][start:end])
+
+            case 'amount':
+                keys: List[int] = indexes['amount_keys']
+                start = 0 if low is None else bisect.bisect_left(keys, low)
+                end = (len(keys) if high is None
+                       else bisect.bisect_right(keys, high))
+                if end - start == 1:
+                    return indexes['amounts'][keys[start]]
+                return sorted(
+                    position for key in keys[start:end]
+                    for position in indexes['amounts'][key])
+
+        raise ValueError(f'Неизвестное поле "{field}"')
+
+    # Поиск по описаниям
+
+    def text_index(self) -> Dict[str, Any]:
+        """
+        Индекс описаний: 'descriptions' - описание -> позиции записей по
+        возрастанию, 'folded' - описание -> fold_text(описание),
+        'trigrams' - триграмма -> описания, в которых она встречается.
+        Индекс строится по различным описаниям, которых обычно намного
+        меньше записей. Строится при первом обращении (или читается из
+        _text_path), затем обновляется при добавлении и изменении записей
+        """
+        data: Ledger = self.load()
+        if self._text is not None:
+            return self._text
+
+        self._text = self._read_text_index()
+        if self._text is None:
+            descriptions: Dict[str, array] = {}
+            for position, description in enumerate(data.descriptions):
+                positions: array | None = descriptions.get(description)
+                if positions is None:
+                    positions = descriptions[description] = array('q')
+                positions.append(position)
+            self._text = {
+                'descriptions': descriptions, 'folded': {}, 'trigrams': {}}
+            for description in descriptions:
+                self._text_add_description(description)
+            self._save_text_index()
+        return self._text
+
+    def text_positions(self, query: str) -> Sequence[int]:
+        """
+        Позиции записей в порядке id, в описании которых есть подстрока
+        query без учёта регистра. Кандидаты - описания со всеми
+        триграммами query, затем подстрока проверяется в каждом из них
+        """
+        text: Dict[str, Any] = self.text_index()
+        folded_query: str = fold_text(query)
+        candidates: Iterable[str] = text['descriptions']
+        if len(folded_query) >= 3:
+            sets: List[set] = sorted(
+                (text['trigrams'].get(trigram, set())
+                 for trigram in trigrams(folded_query)), key=len)
+            candidates = sets[0].intersection(*sets[1:])
+        matched: List[array] = [
+            text['descriptions'][description] for description in candidates
+            if folded_query in text['folded'][description]]
+        if len(matched) == 1:
+            return matched[0]
+        # Списки позиций уже упорядочены, sorted только сливает их
+        return sorted(itertools.chain.from_iterable(matched))
+
+    def _text_add_description(self, description: str) -> None:
+        """Добавляет новое описание в триграммы"""
+        folded: str = self._text['folded'].setdefault(
+            description, fold_text(description))
+        for trigram in trigrams(folded):
+            self._text['trigrams'].setdefault(trigram, set()).add(description)
+
+    def _text_insert(self, position: int, description: str) -> None:
+        """Добавляет в индекс описаний запись на позиции position"""
+        positions: array | None = self._text['descriptions'].get(description)
+        if positions is None:
+            positions = self._text['descriptions'][description] = array('q')
+            self._text_add_description(description)
+        bisect.insort(positions, position)
+
+    def _text_remove(self, position: int, description: str) -> None:
+        """Убирает из индекса описаний запись на позиции position"""
+        positions: array = self._text['descriptions'][description]
+        del positions[bisect.bisect_left(positions, position)]
+        if positions:
+            return
+        del self._text['descriptions'][description]
+        folded: str = self._text['folded'].pop(description)
+        for trigram in trigrams(folded):
+            owners: set = self._text['trigrams'][trigram]
+            owners.discard(description)
+            if not owners:
+                del self._text['trigrams'][trigram]
+
+    # Файл индекса описаний - строки JSON: снимок индекса, затем
+    # изменения [подпись до, удалённые и добавленные [позиция, описание],
+    # подпись после]. Индекс из файла используется, только если цепочка
+    # подписей непрерывна и кончается подписью загруженных данных. Файл
+    # только читается как данные, поэтому подменённый файл не может
+    # выполнить код, как мог бы pickle
+
+    # После скольких изменений файл индекса переписывается снимком
+    TEXT_LOG_LIMIT: int = 1000
+
+    def _text_path(self) -> str | None:
+        """Файл индекса описаний, None - индекс не сохраняется"""
+        return None
+
+    def _read_text_index(self) -> Dict[str, Any] | None:
+        """Индекс описаний из файла или None, если его нет или он устарел"""
+        path: str | None = self._text_path()
+        if path is None:
+            return None
+        try:
+            with open(path, 'r', encoding='UTF-8') as file:
+                snapshot: Dict[str, Any] = json.loads(file.readline())
+                if snapshot.get('version') != TEXT_INDEX_VERSION:
+                    return None
+                # Описания хранятся один раз, триграммы ссылаются на них
+                # по номеру
+                descriptions: List[str] = snapshot['descriptions']
+                text: Dict[str, Any] = {
+                    'descriptions': {
+                        description: array('q', positions)
+                        for description, positions in zip(
+                            descriptions, snapshot['positions'],
+                            strict=True)},
+                    'folded': dict(zip(
+                        descriptions, snapshot['folded'], strict=True)),
+                    'trigrams': {
+                        trigram: {descriptions[owner] for owner in owners}
+                        for trigram, owners in snapshot['trigrams'].items()},
+                }
+                self._text, signature, log = text, snapshot['signature'], 0
+                for line in file:
+                    before, removed, added, after = json.loads(line)
+                    if before != signature:
+                        return None
+                    for position, description in removed:
+                        self._text_remove(position, description)
+                    for position, description in added:
+                        self._text_insert(position, description)
+                    signature, log = after, log + 1
+        # Недописанная строка изменения тоже даёт ValueError
+        except (OSError, AttributeError, KeyError, IndexError, TypeError,
+                ValueError):
+            return None
+        finally:
+            self._text = None
+        # Кортеж подписи возвращается из JSON списком
+        if signature != json.loads(json.dumps(self._signature)):
+            return None
+        self._text_log = log
+        return text
+
+    def _save_text_index(self) -> None:
+        """Сохраняет снимок индекса описаний через временный файл"""
+        path: str | None = self._text_path()
+        if path is None:
+            return
+        descriptions: List[str] = list(self._text['descriptions'])
+        numbers: Dict[str, int] = {
+            description: number
+            for number, description in enumerate(descriptions)}
+        try:
+            with open(path + '.tmp', 'w', encoding='UTF-8') as file:
+                json.dump({
+                    'version': TEXT_INDEX_VERSION,
+                    'signature': self._signature,
+                    'descriptions': descriptions,
+                    'positions': [
+                        positions.tolist()
+                        for positions in self._text['descriptions'].values()],
+                    'folded': [self._text['folded'][description]
+                               for description in descriptions],
+                    'trigrams': {
+                        trigram: [numbers[owner] for owner in owners]
+                        for trigram, owners in self._text['trigrams'].items()},
+                }, file, ensure_ascii=False)
+                file.write('\n')
+            os.replace(path + '.tmp', path)
+        # Индекс можно построить заново, без файла поиск всё равно работает
+        except OSError:
+            return
+        self._text_log = 0
+
+    def _log_text_index(self, before: Any, removed: List[Tuple[int, str]],
+                        added: List[Tuple[int, str]]) -> None:
+        """Дописывает изменение индекса описаний в его файл"""
+        path: str | None = self._text_path()
+        if path is None:
+            return
+        if self._text_log >= self.TEXT_LOG_LIMIT:
+            self._save_text_index()
+            return
+        try:
+            # Переводы строк в описаниях JSON экранирует, изменение
+            # занимает ровно одну строку
+            with open(path, 'a', encoding='UTF-8') as file:
+                file.write(json.dumps(
+                    [before, removed, added, self._signature],
+                    ensure_ascii=False) + '\n')
+        except OSError:
+            return
+        self._text_log += 1
+
+    # Сводки
+
+    def rollups(self) -> Dict[str, Dict[int, List[int]]]:
+        """
+        Суммы доходов и расходов в копейках: 'day' - по дням (порядковый
+        номер дня), 'month' - по месяцам (ledger.month_of) -> [доход,
+        расход]. Строятся при первом обращении, затем обновляются при
+        добавлении и изменении записей
+        """
+        data: Ledger = self.load()
+        if self._rollups is not None:
+            return self._rollups
+
+        days: Dict[int, List[int]] = {}
+        for date, category, amount in zip(
+                data.dates, data.categories, data.amounts):
+            totals: List[int] | None = days.get(date)
+            if totals is None:
+                totals = days[date] = [0, 0]
+            totals[category] += amount
+        months: Dict[int, List[int]] = {}
+        for date, (income, expense) in days.items():
+            totals = months.setdefault(month_of(date), [0, 0])
+            totals[Category.INCOME] += income
+            totals[Category.EXPENSE] += expense
+
+        self._rollups = {'day': days, 'month': months}
+        return self._rollups
+
+    def _rollup_add(self, row: Transaction, sign: int) -> None:
+        """Прибавляет (sign=1) или вычитает (sign=-1) запись из сводок"""
+        for totals in (
+                self._rollups['day'].setdefault(row.date, [0, 0]),
+                self._rollups['month'].setdefault(
+                    month_of(row.date), [0, 0])):
+            totals[row.category] += sign * row.amount
+
+    def rollup(self, by: str, low: int | None,
+               high: int | None) -> List[Tuple[int, int, int]]:
+        """
+        Доходы и расходы по периодам by ('day', 'month' или 'year') в
+        виде (период, доход, расход) по возрастанию периода.
+        Период - порядковый номер дня, номер месяца (ledger.month_of)
+        или год; low и high ограничивают его, None - открытая граница
+        """
+        if by not in ('day', 'month', 'year'):
+            raise ValueError(f'Неизвестный период "{by}"')
+        totals: Dict[int, List[int]] = self.rollups()[
+            'day' if by == 'day' else 'month']
+        if by == 'year':
+            years: Dict[int, List[int]] = {}
+            for month, (income, expense) in totals.items():
+                year: List[int] = years.setdefault(month // 12, [0, 0])
+                year[Category.INCOME] += income
+                year[Category.EXPENSE] += expense
+            totals = years
+
+        return [
+            (key, *totals[key]) for key in sorted(totals)
+            if (low is None or key >= low) and (high is None or key <= high)
+            and any(totals[key])
+        ]
+
+    # Проверка
+
+    def verify(self) -> List[str]:
+        """
+        Проверяет, что id записей идут подряд с 1, а баланс каждой записи -
+        баланс предыдущей плюс её сумма. Возвращает найденные ошибки
+        """
+        data: Ledger = self.load()
+        return merge_checks([check_sequence(
+            (id_, -amount if category else amount, balance)
+            for id_, category, amount, balance in zip(
+                data.ids, data.categories, data.amounts, data.balances))])
+
+    def repair(self) -> int:
+        """
+        Пересчитывает id по порядку с 1 и баланс всех записей и, если
+        что-то изменилось, сохраняет хранилище целиком. Возвращает число
+        исправленных записей
+        """
+        data: Ledger = self.load()
+        fixed = Ledger()
+        balance: int = 0
+        changed: int = 0
+        for id_, row in enumerate(data, 1):
+            balance += row.signed_amount
+            if row.id != id_ or row.balance != balance:
+                changed += 1
+            fixed.append_row(id_, row.date, row.category, row.amount,
+                             row.description, balance)
+        if changed:
+            self.write_all(fixed)
+            self.invalidate()
+        return changed
+
+
+class CsvStorage(Storage):
+    """
+    Записи в csv-файле формата database.csv.
+    Большой файл читается по кускам в нескольких процессах.
+    Изменение записи перезаписывает файл только с её строки; новые данные
+    сначала сохраняются в журнал <файл>.journal, поэтому прерванная
+    перезапись завершается при следующем обращении к файлу.
+    Процессы, работающие с одним файлом, согласуют запись блокировкой
+    flock на <файл>.lock. Дописанные строки сбрасываются на диск
+    групповым fsync: один процесс сбрасывает строки всех, кто успел
+    дописать свои к этому моменту
+    """
+    # Число процессов для чтения файла, None - по числу ядер
+    workers: int | None = None
+    # Файлы меньше этого размера читаются в текущем процессе: запуск
+    # процессов дороже разбора
+    PARALLEL_MIN_SIZE: int = 32 * 2**20
+    # Наибольший размер куска файла, разбираемого за один раз
+    CHUNK_SIZE: int = 16 * 2**20
+    # Размер куска для verify. Не зависит от числа процессов, чтобы
+    # границы кусков и их контрольные суммы совпадали между проверками
+    VERIFY_CHUNK_SIZE: int = 4 * 2**20
+
+    def __init__(self, path: str, readonly: bool = False) -> None:
+        """
+        readonly - файл только читается (например, источник импорта):
+        файл блокировки не создаётся
+        """
+        super().__init__(path)
+        self.readonly = readonly
+        # Открытый файл блокировки, пока она взята этим хранилищем
+        self._lock_file: BinaryIO | None = None
+        # (inode, смещение конца) дописанных, но ещё не сброшенных строк
+        self._unsynced: Tuple[int, int] | None = None
+
+    @contextlib.contextmanager
+    def _lock(self, shared: bool = False) -> Iterator[None]:
+        """
+        Блокировка flock на <файл>.lock: общая для чтения, исключительная
+        для записи. Во вложенном блоке используется уже взятая блокировка
+        """
+        if fcntl is None or self._lock_file is not None:
+            yield
+            return
+        try:
+            lock: BinaryIO = open(self.path + '.lock',
+                                  'rb' if self.readonly else 'ab')
+        # Без файла блокировки никто и не пишет с блокировкой
+        except FileNotFoundError:
+            yield
+            return
+        with lock:
+            fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            self._lock_file = lock
+            try:
+                yield
+            finally:
+                # Блокировка снимается при закрытии файла
+                self._lock_file = None
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        nested: bool = self._lock_file is not None
+        with self._lock():
+            yield
+        if not nested and self._unsynced is not None:
+            self._group_sync()
+
+    def _group_sync(self) -> None:
+        """
+        Сбрасывает дописанные строки на диск. Процессы по очереди берут
+        блокировку <файл>.sync, в которой записано, до какого смещения
+        файл уже сброшен; если туда попали и наши строки, fsync не нужен
+        """
+        inode, end = self._unsynced
+        self._unsynced = None
+        with self._sync_lock() as sync:
+            sync.seek(0)
+            synced: List[int] = [int(value) for value in sync.read().split()]
+            if synced and synced[0] == inode and synced[1] >= end:
+                return
+            try:
+                file = open(self.path, 'rb')
+            except FileNotFoundError:
+                return
+            with file:
+                stat = os.fstat(file.fileno())
+                # Файл заменён целиком, новый уже сброшен при замене
+                if stat.st_ino != inode:
+                    return
+                os.fsync(file.fileno())
+            self._write_synced(sync, inode, stat.st_size)
+
+    @contextlib.contextmanager
+    def _sync_lock(self) -> Iterator[BinaryIO]:
+        """Открытый <файл>.sync под исключительной блокировкой"""
+        with open(self.path + '.sync', 'a+b') as sync:
+            if fcntl is not None:
+                fcntl.flock(sync, fcntl.LOCK_EX)
+            yield sync
+
+    def _write_synced(self, sync: BinaryIO, inode: int, size: int) -> None:
+        """Записывает в <файл>.sync, что файл сброшен до size байт"""
+        sync.truncate(0)
+        sync.write(f'{inode} {size}'.encode('ascii'))
+        sync.flush()
+
+    def signature(self) -> tuple | None:
+        """Подпись файла: inode, размер и время изменения"""
+        self._recover_journal()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _ensure_file(self) -> None:
+        """Создаёт файл с заголовком, если его нет или он пустой"""
+        try:
+            if os.path.getsize(self.path) > 0:
+                return
+        except FileNotFoundError:
+            pass
+        with open(self.path, 'w', encoding='UTF-8') as f:
+            csv.writer(f).writerow(HEADER)
+
+    def read(self) -> Ledger:
+        try:
+            size: int = os.path.getsize(self.path)
+        # Если файла нет - создаём его
+        except FileNotFoundError:
+            size = 0
+        if size == 0:
+            with self._lock():
+                self._ensure_file()
+            return Ledger()
+
+        workers: int = self.workers or os.cpu_count() or 1
+        # Общая блокировка: файл не дописывается и не перезаписывается,
+        # пока его читают
+        with self._lock(shared=True):
+            size = os.path.getsize(self.path)
+            if size < self.PARALLEL_MIN_SIZE:
+                workers = 1
+            # Куски поменьше, чтобы процессы были загружены равномерно и
+            # в памяти не лежал весь файл сразу
+            chunk_size: int = min(
+                self.CHUNK_SIZE, -(-size // (workers * 4)))
+            chunks: List[Tuple[int, int]] = self._chunks(chunk_size)
+
+            try:
+                return self._read_chunks(chunks, workers)
+            except (ValueError, KeyError, IndexError):
+                if len(chunks) <= 1:
+                    raise
+                # Граница попала на перевод строки внутри описания,
+                # похожий на начало записи - читаем файл одним куском
+                return read_chunk(self.path, chunks[0][0], size)
+
+    def _read_chunks(self, chunks: List[Tuple[int, int]],
+                     workers: int) -> Ledger:
+        """Разбирает куски файла в workers процессах и склеивает по id"""
+        data = Ledger()
+        paths: List[str] = [self.path] * len(chunks)
+        starts: List[int] = [start for start, _ in chunks]
+        ends: List[int] = [end for _, end in chunks]
+        if workers == 1 or len(chunks) == 1:
+            for part in map(read_chunk, paths, starts, ends):
+                data.extend(part)
+            return data
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            # map отдаёт результаты в порядке кусков, то есть по id
+            for part in pool.map(read_chunk, paths, starts, ends):
+                data.extend(part)
+        return data
+
+    def _chunks(self, chunk_size: int) -> List[Tuple[int, int]]:
+        """
+        Делит файл после заголовка на диапазоны байт примерно по
+        chunk_size, которые начинаются с начала записи
+        """
+        with open(self.path, 'rb') as file, mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            size: int = len(view)
+            start: int = view.find(b'\n') + 1
+            if start == 0:
+                return []
+            chunks: List[Tuple[int, int]] = []
+            while start < size:
+                end: int = start + chunk_size
+                while end < size:
+                    end = view.find(b'\n', end - 1) + 1
+                    # Перевод строки внутри описания в кавычках - не граница
+                    if end == 0 or _ROW_START.match(view, end):
+                        break
+                    end += 1
+                if end == 0 or end > size:
+                    end = size
+                chunks.append((start, end))
+                start = end
+        return chunks
+
+    def read_last(self) -> Transaction | None:
+        """
+        Последняя запись без разбора всего файла: файл читается с конца
+        блоками до начала последней строки
+        """
+        return read_last_row(self.path)
+
+    def write_rows(self, rows: List[Transaction]) -> None:
+        self._ensure_file()
+        with open(self.path, 'ab') as file:
+            file.write(format_rows(rows))
+            file.flush()
+            self._unsynced = (os.fstat(file.fileno()).st_ino, file.tell())
+
+    def write_replace(self, data: Ledger, index: int, old: Transaction,
+                      delta: int) -> None:
+        offset: int = self._row_offset(index)
+        old_line: bytes = format_rows([old])
+        new_line: bytes = format_rows([data[index]])
+
+        if delta:
+            suffix = new_line + format_rows(data.rows(index + 1))
+            self._rewrite_tail(offset, suffix, truncate=True)
+        elif len(new_line) == len(old_line):
+            # Баланс не сдвинулся, а строка той же длины
+            self._rewrite_tail(offset, new_line, truncate=False)
+        else:
+            with open(self.path, 'rb') as file:
+                file.seek(offset + len(old_line))
+                suffix = new_line + file.read()
+            self._rewrite_tail(offset, suffix, truncate=True)
+
+    def write_all(self, data: Ledger) -> None:
+        """Записывает файл целиком через временный файл и rename"""
+        with open(self.path + '.tmp', 'wb') as file:
+            file.write(','.join(HEADER).encode('UTF-8') + b'\r\n')
+            file.write(format_rows(data))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.path + '.tmp', self.path)
+
+    def _row_offset(self, index: int) -> int:
+        """
+        Байтовое смещение записи с порядковым номером index (с нуля).
+        Считаются концы записей блоками, без разбора записей: перевод
+        строки внутри описания в кавычках - не конец записи. Кавычки
+        внутри поля удваиваются, поэтому перевод строки находится внутри
+        кавычек, если перед ним в записи нечётное число кавычек
+        """
+        # Первая строка файла - заголовок
+        newlines: int = index + 1
+        offset: int = 0
+        quoted: bool = False
+        with open(self.path, 'rb') as file:
+            while chunk := file.read(1 << 20):
+                # Без кавычек каждый перевод строки - конец записи
+                if not quoted and b'"' not in chunk:
+                    count = chunk.count(b'\n')
+                    if count < newlines:
+                        newlines -= count
+                        offset += len(chunk)
+                        continue
+                    position = -1
+                    for _ in range(newlines):
+                        position = chunk.index(b'\n', position + 1)
+                    return offset + position + 1
+
+                start: int = 0
+                while (newline := chunk.find(b'\n', start)) >= 0:
+                    quoted ^= chunk.count(b'"', start, newline) % 2 == 1
+                    start = newline + 1
+                    if not quoted:
+                        newlines -= 1
+                        if newlines == 0:
+                            return offset + start
+                quoted ^= chunk.count(b'"', start) % 2 == 1
+                offset += len(chunk)
+        raise ValueError(f'В файле нет записи с номером {index}')
+
+    def _text_path(self) -> str:
+        return self.path + '.fts'
+
+    def verify(self) -> List[str]:
+        """
+        Проверка файла по кускам: заголовок, поля каждой записи, порядок
+        id и баланс. Контрольные суммы кусков и результаты их проверки
+        сохраняются в <файл>.verify, поэтому повторно разбираются только
+        куски, изменившиеся с прошлой проверки. Большой файл проверяется в
+        нескольких процессах
+        """
+        self._recover_journal()
+        if not os.path.exists(self.path):
+            return []
+        cache: Dict[str, List[Any]] = self._read_verify_cache()
+        with self._lock(shared=True):
+            with open(self.path, 'rb') as file:
+                header: bytes = file.readline().rstrip(b'\r\n')
+            errors: List[str] = []
+            if header and header != ','.join(HEADER).encode('UTF-8'):
+                errors.append(f'заголовок {header[:80]!r} вместо '
+                              f'{",".join(HEADER)!r}')
+            chunks: List[Tuple[int, int]] = []
+            with open(self.path, 'rb') as file, mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ) as view, \
+                    memoryview(view) as buffer:
+                # Граница по _ROW_START может попасть на перевод строки
+                # внутри описания в кавычках: тогда перед ней нечётное
+                # число кавычек, и кусок проверяется вместе с предыдущим
+                quotes: int = 0
+                for start, end in self._chunks(self.VERIFY_CHUNK_SIZE):
+                    if quotes % 2:
+                        chunks[-1] = (chunks[-1][0], end)
+                    else:
+                        chunks.append((start, end))
+                    quotes += bytes(buffer[start:end]).count(b'"')
+                sums: List[int] = [zlib.crc32(buffer[start:end])
+                                   for start, end in chunks]
+            keys: List[str] = [f'{start}-{end}' for start, end in chunks]
+            stale: List[int] = [
+                i for i, key in enumerate(keys)
+                if cache.get(key, [None])[0] != sums[i]]
+
+            workers: int = self.workers or os.cpu_count() or 1
+            if os.path.getsize(self.path) < self.PARALLEL_MIN_SIZE:
+                workers = 1
+            arguments = ([self.path] * len(stale),
+                         [chunks[i][0] for i in stale],
+                         [chunks[i][1] for i in stale])
+            if workers == 1 or len(stale) <= 1:
+                results = list(map(verify_chunk, *arguments))
+            else:
+                with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                    results = list(pool.map(verify_chunk, *arguments))
+        for i, result in zip(stale, results):
+            cache[keys[i]] = [sums[i], result]
+
+        checks: Dict[str, List[Any]] = {
+            key: cache[key] for key in keys}
+        self._save_verify_cache(checks)
+        return errors + merge_checks(check for _, check in checks.values())
+
+    def _verify_path(self) -> str:
+        """Путь к контрольным суммам кусков для verify"""
+        return self.path + '.verify'
+
+    def _read_verify_cache(self) -> Dict[str, List[Any]]:
+        """
+        Сохранённые результаты проверки кусков: 'начало-конец' ->
+        [crc32, результат verify_chunk]. Нет файла или он другого формата -
+        пустой словарь
+        """
+        try:
+            with open(self._verify_path(), 'r', encoding='UTF-8') as file:
+                cache: Any = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(cache, dict) \
+                or cache.get('version') != VERIFY_VERSION:
+            return {}
+        return cache.get('chunks', {})
+
+    def _save_verify_cache(self, chunks: Dict[str, List[Any]]) -> None:
+        """Сохраняет результаты проверки кусков; без них проверка полная"""
+        path: str = self._verify_path()
+        with contextlib.suppress(OSError):
+            with open(path + '.tmp', 'w', encoding='UTF-8') as file:
+                json.dump({'version': VERIFY_VERSION, 'chunks': chunks},
+                          file, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+
+    def repair(self) -> int:
+        # Файл не дописывают и не читают, пока он пересчитывается
+        with self.transaction():
+            return super().repair()
+
+    def _journal_path(self) -> str:
+        """Путь к журналу незавершённой перезаписи файла"""
+        return self.path + '.journal'
+
+    def _rewrite_tail(self, offset: int, data: bytes,
+                      truncate: bool) -> None:
+        """
+        Перезаписывает файл начиная с offset.
+        Сначала новые данные атомарно (через временный файл и rename)
+        сохраняются в журнал, затем переносятся в файл. Если процесс упадёт
+        посередине, журнал будет применён заново при следующем чтении
+        """
+        journal: str = self._journal_path()
+        with open(journal + '.tmp', 'wb') as file:
+            file.write(f'{offset} {int(truncate)}\n'.encode('ascii'))
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(journal + '.tmp', journal)
+        self._recover_journal()
+
+    def _recover_journal(self) -> None:
+        """Применяет журнал незавершённой перезаписи, если он остался"""
+        journal: str = self._journal_path()
+        if not os.path.exists(journal):
+            return
+        # Журнал может принадлежать перезаписи, идущей в другом процессе:
+        # под блокировкой он либо уже удалён, либо брошен
+        with self._lock():
+            self._apply_journal(journal)
+
+    def _apply_journal(self, journal: str) -> None:
+        """Переносит данные журнала в файл и удаляет журнал"""
+        try:
+            with open(journal, 'rb') as file:
+                offset, truncate = map(int, file.readline().split())
+                data: bytes = file.read()
+        except FileNotFoundError:
+            return
+
+        with open(self.path, 'r+b') as file:
+            file.seek(offset)
+            file.write(data)
+            if truncate:
+                file.truncate()
+            file.flush()
+            os.fsync(file.fileno())
+            stat = os.fstat(file.fileno())
+        # Файл сброшен целиком, но мог стать короче: прежняя отметка
+        # .sync была бы больше его размера, и дописанные потом строки,
+        # не дошедшие до неё, остались бы без fsync
+        with self._sync_lock() as sync:
+            self._write_synced(sync, stat.st_ino, stat.st_size)
+        os.remove(journal)
+
+
+class PartitionedLedger(Ledger):
+    """
+    Записи секционированного хранилища. Число записей и границы секций
+    известны из манифеста, записи секции читаются при первом обращении к
+    ним. Баланс записи - баланс из файла секции плюс сдвиг секции
+    """
+
+    def __init__(self, storage: 'PartitionedStorage') -> None:
+        self._storage = storage
+        self.partitions: List[Dict[str, Any]] = \
+            storage.manifest['partitions']
+        # Прочитанные секции: номер -> записи с балансом из файла
+        self.loaded: Dict[int, Ledger] = {}
+        for name in ('ids', 'dates', 'categories', 'amounts',
+                     'descriptions', 'balances'):
+            setattr(self, name, PartitionColumn(self, name))
+        self.recount()
+
+    def recount(self) -> None:
+        """Пересчитывает позиции начала секций после изменения манифеста"""
+        self._starts: List[int] = [0]
+        for entry in self.partitions:
+            self._starts.append(self._starts[-1] + entry['rows'])
+        self._first_ids: List[int] = [
+            entry['first_id'] for entry in self.partitions]
+
+    def __len__(self) -> int:
+        return self._starts[-1]
+
+    def locate(self, index: int) -> Tuple[int, int]:
+        """Номер секции и позиция в ней для позиции записи index"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Нет записи с такой позицией')
+        number: int = bisect.bisect_right(self._starts, index) - 1
+        return number, index - self._starts[number]
+
+    def partition(self, number: int) -> Ledger:
+        """Записи секции number, читаются при первом обращении"""
+        data: Ledger | None = self.loaded.get(number)
+        if data is None:
+            data = self.loaded[number] = self._storage._read_partition(
+                self.partitions[number])
+        return data
+
+    def __getitem__(self, index: int) -> Transaction:
+        number, local = self.locate(index)
+        trans: Transaction = self.partition(number)[local]
+        trans.balance += self.partitions[number]['shift']
+        return trans
+
+    def __setitem__(self, index: int, trans: Transaction) -> None:
+        number, local = self.locate(index)
+        self.partition(number)[local] = Transaction(
+            trans.id, trans.date, trans.category, trans.amount,
+            trans.description,
+            trans.balance - self.partitions[number]['shift'])
+
+    def rows(self, start: int = 0) -> Iterator[Transaction]:
+        if start >= len(self):
+            return
+        number, local = self.locate(start)
+        for number in range(number, len(self.partitions)):
+            shift: int = self.partitions[number]['shift']
+            for trans in self.partition(number).rows(local):
+                trans.balance += shift
+                yield trans
+            local = 0
+
+    def append_row(self, id: int, date: int, category: int, amount: int,
+                   description: str, balance: int) -> None:
+        """
+        Запись уже сохранена и учтена в манифесте, поэтому она
+        добавляется только в прочитанную секцию
+        """
+        self.recount()
+        number: int = bisect.bisect_right(self._first_ids, id) - 1
+        data: Ledger | None = self.loaded.get(number)
+        # Секция могла быть прочитана уже вместе с этой записью
+        if data is not None and (not data or data.ids[-1] < id):
+            data.append_row(id, date, category, amount, description,
+                            balance - self.partitions[number]['shift'])
+
+    def extend(self, other: Ledger) -> None:
+        """
+        Записи уже сохранены и учтены в манифесте, см. append_row:
+        каждая попадает в прочитанную секцию, к которой относится
+        """
+        for row in zip(other.ids, other.dates, other.categories,
+                       other.amounts, other.descriptions, other.balances):
+            self.append_row(*row)
+
+    def shift_balances(self, start: int, delta: int) -> None:
+        """
+        Сдвигает баланс записей с позиции start: в секции этой записи -
+        в памяти, у последующих секций - только сдвиг в манифесте
+        """
+        if start >= len(self):
+            return
+        number, local = self.locate(start)
+        if local > 0:
+            self.partition(number).shift_balances(local, delta)
+            number += 1
+        for entry in self.partitions[number:]:
+            entry['shift'] += delta
+            entry['opening'] += delta
+            entry['closing'] += delta
+
+    def find(self, id_: int) -> int | None:
+        number: int = bisect.bisect_right(self._first_ids, id_) - 1
+        if number < 0 or id_ > self.partitions[number]['last_id']:
+            return None
+        local: int | None = self.partition(number).find(id_)
+        return None if local is None else self._starts[number] + local
+
+
+class PartitionColumn:
+    """
+    Колонка PartitionedLedger. Значения берутся из секций; баланс
+    последней записи непрочитанной секции - из манифеста
+    """
+
+    def __init__(self, ledger: PartitionedLedger, name: str) -> None:
+        self._ledger = ledger
+        self._name = name
+        # (начало, конец, значения) секции последнего обращения
+        self._cached: Tuple[int, int, Any] = (0, 0, None)
+
+    def __len__(self) -> int:
+        return len(self._ledger)
+
+    def __getitem__(self, index: int) -> Any:
+        ledger: PartitionedLedger = self._ledger
+        # Подряд обычно обращаются к записям одной секции
+        start, end, values = self._cached
+        if start <= index < end:
+            return values[index - start]
+        number, local = ledger.locate(index)
+        entry: Dict[str, Any] = ledger.partitions[number]
+        if self._name != 'balances':
+            values = getattr(ledger.partition(number), self._name)
+            start = ledger._starts[number]
+            self._cached = (start, start + len(values), values)
+            return values[local]
+        if local == entry['rows'] - 1 and number not in ledger.loaded:
+            return entry['closing']
+        return ledger.partition(number).balances[local] + entry['shift']
+
+    def __iter__(self) -> Iterator[Any]:
+        ledger: PartitionedLedger = self._ledger
+        for number, entry in enumerate(ledger.partitions):
+            values = getattr(ledger.partition(number), self._name)
+            if self._name == 'balances' and entry['shift']:
+                shift: int = entry['shift']
+                yield from (value + shift for value in values)
+            else:
+                yield from values
+
+
+class PartitionedStorage(CsvStorage):
+    """
+    Записи в каталоге, по csv-файлу на год или месяц (секция). Манифест
+    manifest.json хранит для каждой секции её файл, диапазон id, число
+    записей, баланс на начало и конец, крайние даты и суммы, поэтому
+    поиск по дате и сумме, баланс на дату и изменение записи читают только
+    секции, которых они касаются. Новая секция начинается, когда дата
+    записи позже периода последней секции; записи с более ранней датой
+    дописываются в последнюю секцию.
+    Изменение записи переписывает только её секцию: баланс последующих
+    секций сдвигается полем shift манифеста. Старые секции можно сжать
+    gzip (compress), они читаются так же, при обращении.
+    Манифест заменяется атомарно и определяет, какие файлы и сколько байт
+    в них действительны, поэтому прерванная запись не портит данные
+    """
+
+    MANIFEST: str = 'manifest.json'
+    MANIFEST_VERSION: int = 1
+    # Период секций нового каталога: 'year' или 'month'
+    period: str = 'year'
+
+    def __init__(self, path: str, readonly: bool = False) -> None:
+        super().__init__(path, readonly)
+        self.manifest: Dict[str, Any] | None = None
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, self.MANIFEST)
+
+    def _text_path(self) -> str:
+        return os.path.join(self.path, 'descriptions.fts')
+
+    def verify(self) -> List[str]:
+        # Баланс секции - из её файла плюс сдвиг манифеста, поэтому
+        # проверяются записи, а не файлы
+        return Storage.verify(self)
+
+    def signature(self) -> tuple | None:
+        """Подпись манифеста: он заменяется при каждой записи"""
+        try:
+            stat = os.stat(self._manifest_path())
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self._manifest_path(), 'r', encoding='UTF-8') as file:
+                manifest: Dict[str, Any] = json.load(file)
+        except FileNotFoundError:
+            return {'version': self.MANIFEST_VERSION,
+                    'period': self.period, 'partitions': []}
+        if manifest.get('version') != self.MANIFEST_VERSION:
+            raise ValueError(
+                f'Неизвестная версия манифеста {self._manifest_path()}')
+        return manifest
+
+    def _current_manifest(self) -> Dict[str, Any]:
+        """Манифест загруженных записей или заново прочитанный"""
+        if self.manifest is None or not self.is_loaded():
+            self.manifest = self._read_manifest()
+        return self.manifest
+
+    def _save_manifest(self, manifest: Dict[str, Any]) -> None:
+        """Атомарно заменяет манифест"""
+        path: str = self._manifest_path()
+        with open(path + '.tmp', 'w', encoding='UTF-8') as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=1)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)
+
+    def _period_key(self, date: int, period: str) -> int:
+        """Период секции для даты: год или номер месяца (month_of)"""
+        if period == 'month':
+            return month_of(date)
+        return datetime.date.fromordinal(date).year
+
+    def _partition_name(self, key: int, period: str) -> str:
+        if period == 'month':
+            year, month = divmod(key, 12)
+            return f'{year:04d}-{month + 1:02d}'
+        return f'{key:04d}'
+
+    def _read_partition(self, entry: Dict[str, Any]) -> Ledger:
+        """Записи секции с балансом из её файла"""
+        path: str = os.path.join(self.path, entry['file'])
+        with self._lock(shared=True):
+            if entry['compressed']:
+                with gzip.open(path, 'rb') as file:
+                    raw: bytes = file.read()
+            else:
+                with open(path, 'rb') as file:
+                    raw = file.read(entry['size'])
+        # Первая строка файла - заголовок
+        return parse_rows(raw.decode('UTF-8').partition('\n')[2])
+
+    def _write_partition(self, entry: Dict[str, Any], period: str,
+                         rows: Iterable[Transaction],
+                         compressed: bool) -> str | None:
+        """
+        Записывает секцию целиком в новый файл и указывает его в entry.
+        Возвращает прежний файл, который можно удалить после сохранения
+        манифеста
+        """
+        generation: int = entry.get('generation', -1) + 1
+        name: str = self._partition_name(entry['key'], period)
+        if generation:
+            name += f'.{generation}'
+        name += '.csv.gz' if compressed else '.csv'
+        data: bytes = (','.join(HEADER).encode('UTF-8') + b'\r\n'
+                       + format_rows(rows))
+        with open(os.path.join(self.path, name), 'wb') as file:
+            file.write(gzip.compress(data) if compressed else data)
+            file.flush()
+            os.fsync(file.fileno())
+        previous: str | None = entry.get('file')
+        entry.update(file=name, size=len(data), compressed=compressed,
+                     generation=generation)
+        return previous
+
+    def _remove_files(self, names: Iterable[str | None]) -> None:
+        for name in names:
+            if name:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(self.path, name))
+
+    def _new_entry(self, key: int, row: Transaction) -> Dict[str, Any]:
+        """Описание новой секции, которая начнётся с записи row"""
+        opening: int = row.balance - row.signed_amount
+        return {
+            'key': key, 'file': None, 'size': 0, 'compressed': False,
+            'rows': 0, 'first_id': row.id, 'last_id': row.id,
+            'opening': opening, 'closing': opening, 'shift': 0,
+            'min_date': row.date, 'max_date': row.date,
+            'min_amount': row.amount, 'max_amount': row.amount,
+        }
+
+    def _count_rows(self, entry: Dict[str, Any],
+                    rows: List[Transaction]) -> None:
+        """Учитывает в entry записи, дописанные в конец секции"""
+        entry['rows'] += len(rows)
+        entry['last_id'] = rows[-1].id
+        entry['closing'] = rows[-1].balance
+        entry['min_date'] = min(entry['min_date'],
+                                *(row.date for row in rows))
+        entry['max_date'] = max(entry['max_date'],
+                                *(row.date for row in rows))
+        entry['min_amount'] = min(entry['min_amount'],
+                                  *(row.amount for row in rows))
+        entry['max_amount'] = max(entry['max_amount'],
+                                  *(row.amount for row in rows))
+
+    def _group_rows(self, manifest: Dict[str, Any],
+                    rows: Iterable[Transaction]
+                    ) -> List[Tuple[Dict[str, Any], List[Transaction]]]:
+        """
+        Раскладывает записи, идущие в конец, по секциям; при
+        необходимости добавляет в манифест новые секции
+        """
+        partitions: List[Dict[str, Any]] = manifest['partitions']
+        groups: List[Tuple[Dict[str, Any], List[Transaction]]] = []
+        for row in rows:
+            key: int = self._period_key(row.date, manifest['period'])
+            if not partitions or key > partitions[-1]['key']:
+                partitions.append(self._new_entry(key, row))
+            if not groups or groups[-1][0] is not partitions[-1]:
+                groups.append((partitions[-1], []))
+            groups[-1][1].append(row)
+        return groups
+
+    # Операции хранилища
+
+    def read(self) -> PartitionedLedger:
+        self.manifest = self._read_manifest()
+        return PartitionedLedger(self)
+
+    def read_last(self) -> Transaction | None:
+        """Последняя запись: читается конец файла последней секции"""
+        partitions: List[Dict[str, Any]] = \
+            self._read_manifest()['partitions']
+        if not partitions:
+            return None
+        entry: Dict[str, Any] = partitions[-1]
+        if entry['compressed']:
+            row: Transaction | None = self._read_partition(entry)[-1]
+        else:
+            row = read_last_row(
+                os.path.join(self.path, entry['file']), entry['size'])
+        row.balance += entry['shift']
+        return row
+
+    def write_rows(self, rows: List[Transaction]) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        manifest: Dict[str, Any] = self._current_manifest()
+        removed: List[str | None] = []
+        for entry, group in self._group_rows(manifest, rows):
+            shift: int = entry['shift']
+            raw: List[Transaction] = [
+                Transaction(row.id, row.date, row.category, row.amount,
+                            row.description, row.balance - shift)
+                for row in group]
+            if entry['compressed']:
+                # Сжатая секция переписывается целиком, уже без сжатия
+                removed.append(self._write_partition(
+                    entry, manifest['period'],
+                    itertools.chain(self._read_partition(entry), raw),
+                    compressed=False))
+            elif entry['file'] is None:
+                self._write_partition(
+                    entry, manifest['period'], raw, compressed=False)
+            else:
+                with open(os.path.join(self.path, entry['file']),
+                          'r+b') as file:
+                    # Всё, что за границей из манифеста, - остаток
+                    # прерванной записи
+                    file.truncate(entry['size'])
+                    file.seek(entry['size'])
+                    file.write(format_rows(raw))
+                    file.flush()
+                    os.fsync(file.fileno())
+                    entry['size'] = file.tell()
+            self._count_rows(entry, group)
+        self._save_manifest(manifest)
+        self._remove_files(removed)
+        if self._data is not None:
+            self._data.recount()
+
+    def write_replace(self, data: PartitionedLedger, index: int,
+                      old: Transaction, delta: int) -> None:
+        """
+        Переписывает секцию изменённой записи. Баланс последующих секций
+        уже сдвинут полем shift, их файлы не меняются
+        """
+        number, _ = data.locate(index)
+        entry: Dict[str, Any] = data.partitions[number]
+        part: Ledger = data.partition(number)
+        previous: str | None = self._write_partition(
+            entry, self.manifest['period'], part, entry['compressed'])
+        entry['closing'] = part.balances[-1] + entry['shift']
+        entry['min_date'], entry['max_date'] = \
+            min(part.dates), max(part.dates)
+        entry['min_amount'], entry['max_amount'] = \
+            min(part.amounts), max(part.amounts)
+        self._save_manifest(self.manifest)
+        self._remove_files([previous])
+
+    def write_all(self, data: Ledger) -> None:
+        """
+        Раскладывает записи по секциям в каталоге заново. Период секций
+        остаётся прежним, period - только для нового каталога
+        """
+        os.makedirs(self.path, exist_ok=True)
+        old: Dict[str, Any] = self._read_manifest()
+        manifest: Dict[str, Any] = {
+            'version': self.MANIFEST_VERSION, 'period': old['period'],
+            'partitions': []}
+        for entry, group in self._group_rows(manifest, data):
+            self._write_partition(entry, manifest['period'], group,
+                                  compressed=False)
+            self._count_rows(entry, group)
+        self._save_manifest(manifest)
+        self._remove_files(
+            entry['file'] for entry in old['partitions']
+            if entry['file'] not in {
+                entry['file'] for entry in manifest['partitions']})
+
+    def compress(self, keep: int = 1) -> int:
+        """
+        Сжимает gzip все секции, кроме последних keep. Баланс в сжатых
+        файлах записывается окончательный, без сдвига. Возвращает число
+        сжатых секций
+        """
+        with self.transaction():
+            manifest: Dict[str, Any] = self._read_manifest()
+            partitions: List[Dict[str, Any]] = manifest['partitions']
+            removed: List[str | None] = []
+            for entry in partitions[:max(len(partitions) - keep, 0)]:
+                if entry['compressed']:
+                    continue
+                part: Ledger = self._read_partition(entry)
+                part.shift_balances(0, entry['shift'])
+                entry['shift'] = 0
+                removed.append(self._write_partition(
+                    entry, manifest['period'], part, compressed=True))
+            if removed:
+                self._save_manifest(manifest)
+                self._remove_files(removed)
+                self.invalidate()
+        return len(removed)
+
+    # Поиск с пропуском секций
+
+    def positions(self, field: str, low: int | None,
+                  high: int | None) -> Sequence[int]:
+        """
+        Пока индексы не построены, поиск по дате и сумме читает только
+        секции, чьи крайние значения пересекаются с диапазоном
+        """
+        if field not in ('date', 'amount') or self._indexes is not None:
+            return super().positions(field, low, high)
+        data: PartitionedLedger = self.load()
+        column: str = 'dates' if field == 'date' else 'amounts'
+        found: List[int] = []
+        start: int = 0
+        for number, entry in enumerate(data.partitions):
+            if (low is None or entry[f'max_{field}'] >= low) \
+                    and (high is None or entry[f'min_{field}'] <= high):
+                found.extend(
+                    start + i for i, value in enumerate(
+                        getattr(data.partition(number), column))
+                    if (low is None or value >= low)
+                    and (high is None or value <= high))
+            start += entry['rows']
+        return found
+
+    def balance_at(self, date: int) -> int:
+        """
+        Пока индексы не построены: секции целиком до date берутся из
+        манифеста, читаются только секции, которые date делит
+        """
+        if self._indexes is not None:
+            return super().balance_at(date)
+        data: PartitionedLedger = self.load()
+        balance: int = 0
+        for number, entry in enumerate(data.partitions):
+            if entry['max_date'] <= date:
+                balance += entry['closing'] - entry['opening']
+            elif entry['min_date'] <= date:
+                part: Ledger = data.partition(number)
+                balance += sum(
+                    amount if category == Category.INCOME else -amount
+                    for day, category, amount in zip(
+                        part.dates, part.categories, part.amounts)
+                    if day <= date)
+        return balance
+
+
+class SqliteStorage(Storage):
+    """
+    Записи в базе SQLite (режим WAL). Баланс хранится в каждой строке,
+    по дате, сумме и категории построены индексы, поэтому поиск и
+    изменение одной записи не требуют перезаписи всех данных.
+    Если id идут подряд, positions и replace не читают таблицу целиком.
+    Команды search и patch клиента всё равно загружают все записи
+    (load), чтобы вывести найденные и найти запись по id
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY,
+            date INTEGER NOT NULL,
+            category INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            description TEXT NOT NULL,
+            balance INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS transactions_date
+            ON transactions (date);
+        CREATE INDEX IF NOT EXISTS transactions_amount
+            ON transactions (amount);
+        CREATE INDEX IF NOT EXISTS transactions_category
+            ON transactions (category);
+
+        CREATE TABLE IF NOT EXISTS rollup_day (
+            day INTEGER PRIMARY KEY,
+            income INTEGER NOT NULL,
+            expense INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS rollup_month (
+            month INTEGER PRIMARY KEY,
+            income INTEGER NOT NULL,
+            expense INTEGER NOT NULL
+        );
+        CREATE TRIGGER IF NOT EXISTS transactions_rollup_insert
+            AFTER INSERT ON transactions
+        BEGIN
+            {add_new}
+        END;
+        CREATE TRIGGER IF NOT EXISTS transactions_rollup_delete
+            AFTER DELETE ON transactions
+        BEGIN
+            {remove_old}
+        END;
+        CREATE TRIGGER IF NOT EXISTS transactions_rollup_update
+            AFTER UPDATE OF date, category, amount ON transactions
+        BEGIN
+            {remove_old}
+            {add_new}
+        END;
+    '''
+
+    # Номер месяца (ledger.month_of) для порядкового номера дня: в SQLite
+    # 01.01.0001 - юлианский день 1721425.5
+    MONTH_SQL = (
+        "CAST(strftime('%Y', {0} + 1721424.5) AS INTEGER) * 12"
+        " + CAST(strftime('%m', {0} + 1721424.5) AS INTEGER) - 1")
+
+    # Сводки по дням и месяцам обновляются триггерами при любом изменении
+    # записей. Изменение баланса последующих записей их не затрагивает
+    ROLLUP_ADD = '''
+            INSERT INTO rollup_{table} VALUES (
+                {key}, (NEW.category = 0) * NEW.amount,
+                (NEW.category = 1) * NEW.amount)
+            ON CONFLICT ({table}) DO UPDATE SET
+                income = income + excluded.income,
+                expense = expense + excluded.expense;'''
+    ROLLUP_REMOVE = '''
+            UPDATE rollup_{table} SET
+                income = income - (OLD.category = 0) * OLD.amount,
+                expense = expense - (OLD.category = 1) * OLD.amount
+            WHERE {table} = {key};'''
+
+    COLUMNS = 'id, date, category, amount, description, balance'
+
+    # Сколько секунд ждать, пока другой процесс закончит запись
+    BUSY_TIMEOUT: float = 30.0
+
+    def __init__(self, path: str, readonly: bool = False) -> None:
+        """
+        readonly - база только читается (например, источник импорта):
+        она открывается без права записи, таблицы не создаются
+        """
+        super().__init__(path)
+        if readonly:
+            self.connection = sqlite3.connect(
+                pathlib.Path(os.path.abspath(path)).as_uri() + '?mode=ro',
+                uri=True, isolation_level=None, timeout=self.BUSY_TIMEOUT)
+            return
+        # Транзакциями управляем сами через BEGIN/COMMIT. Сервер
+        # выполняет запись в другом потоке, но никогда одновременно с
+        # чтением, поэтому соединение не привязано к потоку
+        self.connection = sqlite3.connect(
+            path, isolation_level=None, timeout=self.BUSY_TIMEOUT,
+            check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        created: bool = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'rollup_month'"
+        ).fetchone() is None
+        self.connection.executescript(self.SCHEMA.format(
+            add_new=''.join(
+                self.ROLLUP_ADD.format(table=table, key=key)
+                for table, key in (
+                    ('day', 'NEW.date'),
+                    ('month', self.MONTH_SQL.format('NEW.date')))),
+            remove_old=''.join(
+                self.ROLLUP_REMOVE.format(table=table, key=key)
+                for table, key in (
+                    ('day', 'OLD.date'),
+                    ('month', self.MONTH_SQL.format('OLD.date'))))))
+        # База создана до появления сводок - считаем их по всем записям
+        if created:
+            self._build_rollups()
+
+    def _build_rollups(self) -> None:
+        """Заполняет сводки заново по всем записям"""
+        with self.transaction():
+            self.connection.execute('DELETE FROM rollup_day')
+            self.connection.execute('DELETE FROM rollup_month')
+            self.connection.execute(
+                'INSERT INTO rollup_day '
+                'SELECT date, SUM((category = 0) * amount), '
+                'SUM((category = 1) * amount) FROM transactions '
+                'GROUP BY date')
+            self.connection.execute(
+                f"INSERT INTO rollup_month "
+                f"SELECT {self.MONTH_SQL.format('day')} AS month, "
+                f"SUM(income), SUM(expense) FROM rollup_day GROUP BY month")
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def signature(self) -> int:
+        """Номер версии данных, меняется при записи из других соединений"""
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def _row(self, row: tuple) -> Transaction:
+        id_, date, category, amount, description, balance = row
+        return Transaction(
+            id_, date, Category(category), amount, description, balance)
+
+    def read(self) -> Ledger:
+        data = Ledger()
+        for row in self.connection.execute(
+                f'SELECT {self.COLUMNS} FROM transactions ORDER BY id'):
+            data.append_row(*row)
+        return data
+
+    def read_last(self) -> Transaction | None:
+        row = self.connection.execute(
+            f'SELECT {self.COLUMNS} FROM transactions '
+            'ORDER BY id DESC LIMIT 1').fetchone()
+        return self._row(row) if row else None
+
+    def write_rows(self, rows: List[Transaction]) -> None:
+        self.connection.executemany(
+            f'INSERT INTO transactions ({self.COLUMNS}) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(row.id, row.date, int(row.category), row.amount,
+              row.description, row.balance) for row in rows])
+
+    def write_replace(self, data: Ledger, index: int, old: Transaction,
+                      delta: int) -> None:
+        row: Transaction = data[index]
+        self.connection.execute(
+            'UPDATE transactions SET date = ?, category = ?, amount = ?, '
+            'description = ?, balance = ? WHERE id = ?',
+            (row.date, int(row.category), row.amount, row.description,
+             row.balance, row.id))
+        if delta:
+            self.connection.execute(
+                'UPDATE transactions SET balance = balance + ? '
+                'WHERE id > ?', (delta, row.id))
+
+    def write_all(self, data: Ledger) -> None:
+        with self.transaction():
+            self.connection.execute('DELETE FROM transactions')
+            self.write_rows(list(data))
+
+    def positions(self, field: str, low: int | None,
+                  high: int | None) -> Sequence[int]:
+        """Поиск по индексам базы, см. Storage.positions"""
+        if field not in ('category', 'date', 'amount'):
+            raise ValueError(f'Неизвестное поле "{field}"')
+        conditions: List[str] = []
+        params: List[int] = []
+        if low is not None:
+            conditions.append(f'{field} >= ?')
+            params.append(int(low))
+        if high is not None:
+            conditions.append(f'{field} <= ?')
+            params.append(int(high))
+        where: str = ' AND '.join(conditions) or '1'
+        ids: List[int] = [id_ for (id_,) in self.connection.execute(
+            f'SELECT id FROM transactions WHERE {where} ORDER BY id',
+            params)]
+
+        first: int | None = self._first_id()
+        if first is not None:
+            return [id_ - first for id_ in ids]
+        data: Ledger = self.load()
+        return [data.find(id_) for id_ in ids]
+
+    def _first_id(self) -> int | None:
+        """
+        id первой записи, если id идут подряд без пропусков: тогда позиция
+        записи - её id минус этот. None - пропуски есть или записей нет.
+        Границы id берутся из первичного ключа, записи не читаются
+        """
+        first, last, count = self.connection.execute(
+            'SELECT MIN(id), MAX(id), COUNT(*) FROM transactions'
+        ).fetchone()
+        if not count or last - first + 1 != count:
+            return None
+        return first
+
+    def replace(self, index: int, patched: Transaction) -> None:
+        """
+        Если записи не загружены в память, запись и баланс последующих
+        меняются запросами по первичному ключу, без чтения всех записей,
+        см. Storage.replace
+        """
+        first: int | None = self._first_id()
+        if self.is_loaded() or first is None:
+            super().replace(index, patched)
+            return
+        with self.transaction():
+            id_: int = first + index
+            row = self.connection.execute(
+                f'SELECT {self.COLUMNS} FROM transactions WHERE id = ?',
+                (id_,)).fetchone()
+            if row is None:
+                raise IndexError('Нет записи с такой позицией')
+            old: Transaction = self._row(row)
+            previous = self.connection.execute(
+                'SELECT balance FROM transactions WHERE id < ? '
+                'ORDER BY id DESC LIMIT 1', (id_,)).fetchone()
+            patched.balance = patched.signed_amount + (
+                previous[0] if previous else 0)
+            # write_replace берёт из data только изменённую запись
+            data = Ledger()
+            data.append(patched)
+            self.write_replace(data, 0, old, patched.balance - old.balance)
+        self.invalidate()
+
+    def rollup(self, by: str, low: int | None,
+               high: int | None) -> List[Tuple[int, int, int]]:
+        """Сводка из таблиц rollup_day и rollup_month, см. Storage.rollup"""
+        if by not in ('day', 'month', 'year'):
+            raise ValueError(f'Неизвестный период "{by}"')
+        key: str = {'day': 'day', 'month': 'month', 'year': 'month / 12'}[by]
+        conditions: List[str] = ['(income != 0 OR expense != 0)']
+        params: List[int] = []
+        if low is not None:
+            conditions.append(f'{key} >= ?')
+            params.append(low)
+        if high is not None:
+            conditions.append(f'{key} <= ?')
+            params.append(high)
+        return self.connection.execute(
+            f'SELECT {key} AS period, SUM(income), SUM(expense) '
+            f'FROM rollup_{"day" if by == "day" else "month"} '
+            f'WHERE {" AND ".join(conditions)} '
+            f'GROUP BY period ORDER BY period', params).fetchall()
+
+    def balance_at(self, date: int) -> int:
+        """Баланс на конец дня по сводке rollup_day, см. Storage.balance_at"""
+        return self.connection.execute(
+            'SELECT COALESCE(SUM(income - expense), 0) FROM rollup_day '
+            'WHERE day <= ?', (date,)).fetchone()[0]
+
+
+STORAGES: Dict[str, type] = {
+    'csv': CsvStorage, 'sqlite': SqliteStorage,
+    'partitioned': PartitionedStorage}
+
+
+def storage_kind(path: str) -> str:
+    """
+    Вид хранилища по расширению файла: .db, .sqlite и .sqlite3 - SQLite,
+    .parts или каталог - секционированное, иначе csv
+    """
+    extension: str = os.path.splitext(path)[1].lower()
+    if extension == '.parts' or os.path.isdir(path):
+        return 'partitioned'
+    return 'sqlite' if extension in ('.db', '.sqlite', '.sqlite3') else 'csv'
+
+
+def open_storage(path: str, kind: str | None = None,
+                 readonly: bool = False) -> Storage:
+    """
+    Открывает хранилище, без kind вид определяется по расширению.
+    readonly - хранилище только читается: база SQLite открывается без
+    записи в неё, для файлов csv и секций не создаётся файл блокировки
+    """
+    return STORAGES[kind or storage_kind(path)](path, readonly=readonly)
+
+
+def summarize(path: str, by: str, low: int | None = None,
+              high: int | None = None
+              ) -> Tuple[int, int, List[Tuple[int, int, int]]]:
+    """
+    Число записей, баланс и сводка rollup(by, low, high) хранилища path.
+    Функция верхнего уровня, чтобы сводки многих хранилищ считать в пуле
+    процессов
+    """
+    storage: Storage = open_storage(path)
+    # Процессы уже заняты хранилищами целиком: файл читается в одном
+    if isinstance(storage, CsvStorage):
+        storage.workers = 1
+    try:
+        data: Ledger = storage.load()
+        balance: int = data[-1].balance if len(data) else 0
+        return len(data), balance, storage.rollup(by, low, high)
+    finally:
+        storage.close()
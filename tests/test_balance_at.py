@@ -0,0 +1,62 @@
+"""Баланс на дату по контрольным точкам: сверка с прямым подсчётом"""
+import os
+import random
+import tempfile
+import unittest
+
+from ledger import Category, Transaction, parse_date
+from storage import STORAGES, Storage
+
+
+START: int = parse_date('01.01.2024')
+
+
+def expected(storage: Storage, date: int) -> int:
+    """Баланс на конец дня date суммированием всех записей"""
+    return sum(trans.signed_amount for trans in storage.load().rows()
+               if trans.date <= date)
+
+
+class BalanceAtTest(unittest.TestCase):
+
+    def check(self, kind: str, suffix: str) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        storage: Storage = STORAGES[kind](
+            os.path.join(tmp.name, 'database' + suffix))
+        self.addCleanup(storage.close)
+        storage.CHECKPOINT_EVERY = 4
+        rng = random.Random(kind)
+
+        def rows(count: int) -> list:
+            # Даты не по порядку: записи добавляют задним числом
+            return [Transaction(
+                0, START + rng.randrange(60), rng.choice(list(Category)),
+                rng.randrange(1, 10_000), 'x', 0) for _ in range(count)]
+
+        storage.extend(rows(10))
+        storage.indexes()
+        for step in range(20):
+            if step % 3 == 2:
+                index = rng.randrange(len(storage.load()))
+                patched = rows(1)[0]
+                patched.id = storage.load()[index].id
+                storage.replace(index, patched)
+            else:
+                storage.extend(rows(rng.randrange(1, 4)))
+            for date in range(START - 1, START + 61, 7):
+                self.assertEqual(storage.balance_at(date),
+                                 expected(storage, date), (kind, step))
+
+    def test_csv(self) -> None:
+        self.check('csv', '.csv')
+
+    def test_partitioned(self) -> None:
+        self.check('partitioned', '.parts')
+
+    def test_sqlite(self) -> None:
+        self.check('sqlite', '.db')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+"""Генератор файлов для бенчмарков: формат и повторяемость"""
+import os
+import tempfile
+import unittest
+
+from benchmarks.generator import generate
+from storage import CsvStorage
+
+
+class GeneratorTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+    def test_file_is_a_valid_ledger(self) -> None:
+        generate(self.path('a.csv'), 500)
+        storage = CsvStorage(self.path('a.csv'))
+        self.addCleanup(storage.close)
+        data = storage.load()
+        self.assertEqual(list(data.ids), list(range(1, 501)))
+        self.assertEqual(list(data.dates), sorted(data.dates))
+        self.assertEqual(storage.verify(), [])
+
+    def test_same_seed_same_file(self) -> None:
+        for name, seed in (('a.csv', 1), ('b.csv', 1), ('c.csv', 2)):
+            generate(self.path(name), 200, seed)
+        with open(self.path('a.csv'), 'rb') as a, \
+                open(self.path('b.csv'), 'rb') as b, \
+                open(self.path('c.csv'), 'rb') as c:
+            first = a.read()
+            self.assertEqual(first, b.read())
+            self.assertNotEqual(first, c.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""Команда import: файлы csv и JSONL, ошибки строк и другие хранилища"""
+import os
+import tempfile
+import unittest
+
+from ledger import Category, Transaction, parse_date
+from main import BudgetTracker
+from storage import PartitionedStorage, SqliteStorage
+
+
+class ImportTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        interactive = BudgetTracker.INTERACTIVE
+        BudgetTracker.INTERACTIVE = False
+        self.addCleanup(setattr, BudgetTracker, 'INTERACTIVE', interactive)
+        self.database = self.file('database.csv')
+        BudgetTracker.configure('csv', self.database, None)
+        self.addCleanup(BudgetTracker.configure, None, 'database.csv', None)
+        BudgetTracker.execute(['add', '--date', '01.01.2024', '--category',
+                               'доход', '--amount', '100', '--desc', 'a'])
+
+    def file(self, name: str, content: bytes | None = None) -> str:
+        path = os.path.join(self.dir, name)
+        if content is not None:
+            with open(path, 'wb') as file:
+                file.write(content)
+        return path
+
+    def run_import(self, path: str) -> str:
+        return BudgetTracker.execute(['import', path])
+
+    def records(self) -> list:
+        return [(trans.id, trans.amount, trans.description, trans.balance)
+                for trans in BudgetTracker._storage().load()]
+
+    def test_csv_continues_ids_and_balance(self) -> None:
+        path = self.file('in.csv', (
+            'date,category,amount,description\n'
+            '02.01.2024,расход,30,"b, c"\n'
+            '03.01.2024,доход,5.5,"две\nстроки"\n'
+            '04.01.2024,доход,5.5,d\n').encode())
+        text = self.run_import(path)
+        self.assertIn('записей: 2', text)
+        # Номер строки записи в несколько строк - номер её последней строки
+        self.assertIn('строка 4: описание содержит перевод строки', text)
+        self.assertEqual(self.records(), [
+            (1, 10000, 'a', 10000), (2, 3000, 'b, c', 7000),
+            (3, 550, 'd', 7550)])
+
+    def test_jsonl_errors_are_reported_by_line(self) -> None:
+        path = self.file('in.jsonl', '\n'.join((
+            '{"date": "02.01.2024", "category": "доход", "amount": 0,'
+            ' "description": "ноль"}',
+            '{"date": "31.02.2024", "category": "доход", "amount": 1,'
+            ' "description": "x"}',
+            'не json',
+            '[1, 2]',
+            '{"date": "03.01.2024", "category": "расход", "amount": "1",'
+            ' "description": "a\\nb"}',
+            '{"date": "04.01.2024", "category": "расход", "amount": "2",'
+            ' "description": "ok"}',
+        )).encode() + b'\n{"description": "\xff"}\n')
+        text = self.run_import(path)
+        self.assertIn('Импортировано записей: 2', text)
+        for line in (2, 3, 4, 5, 7):
+            self.assertIn(f'строка {line}:', text)
+        self.assertNotIn('строка 1:', text)
+        self.assertNotIn('строка 6:', text)
+        self.assertEqual([record[2] for record in self.records()],
+                         ['a', 'ноль', 'ok'])
+
+    def test_broken_csv_is_reported(self) -> None:
+        path = self.file('in.csv', (
+            'date,category,amount,description\n'
+            '02.01.2024,расход,1,ok\n'
+            # Поле длиннее csv.field_size_limit
+            f'03.01.2024,доход,3,{"x" * 200_000}\n'
+            '04.01.2024,доход,4,после\n').encode())
+        text = self.run_import(path)
+        self.assertIn('Импортировано записей: 2', text)
+        self.assertIn('строка 3: некорректный csv', text)
+        self.assertEqual([record[2] for record in self.records()],
+                         ['a', 'ok', 'после'])
+
+    def test_storage_sources_are_not_modified(self) -> None:
+        for name, kind in (('src.db', SqliteStorage),
+                           ('src.parts', PartitionedStorage)):
+            source = kind(self.file(name))
+            source.extend([Transaction(0, parse_date('05.01.2024'),
+                                       Category.EXPENSE, 500, 'из базы', 0)])
+            source.close()
+        before = sorted(os.listdir(self.dir))
+        os.remove(self.file('src.parts.lock'))
+        before.remove('src.parts.lock')
+
+        self.assertIn('записей: 1', self.run_import(self.file('src.db')))
+        self.assertIn('записей: 1', self.run_import(self.file('src.parts')))
+        self.assertEqual([record[3] for record in self.records()],
+                         [10000, 9500, 9000])
+        self.assertFalse(os.path.exists(self.file('src.parts.lock')))
+
+    def test_unreadable_sources(self) -> None:
+        self.assertIn('Не удалось прочитать',
+                      self.run_import(self.file('bad.db', b'not a db' * 64)))
+        os.mkdir(self.file('bad.parts'))
+        self.file('bad.parts/manifest.json', b'{bad')
+        self.assertIn('Не удалось прочитать',
+                      self.run_import(self.file('bad.parts')))
+        self.assertEqual(len(self.records()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
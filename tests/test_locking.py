@@ -0,0 +1,62 @@
+"""Хранилище csv: запись из нескольких хранилищ и групповой fsync"""
+import os
+import tempfile
+import unittest
+
+from ledger import Category, Transaction, parse_date
+from storage import CsvStorage
+
+
+def row(amount: int, description: str) -> Transaction:
+    return Transaction(0, parse_date('01.01.2024'), Category.EXPENSE,
+                       amount, description, 0)
+
+
+class GroupSyncTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'database.csv')
+        self.storage = CsvStorage(self.path)
+        self.addCleanup(self.storage.close)
+        self.storage.extend([row(100, 'a'), row(500, 'длинное описание'),
+                             row(300, 'c')])
+
+    def synced(self) -> list:
+        with open(self.path + '.sync') as sync:
+            return [int(value) for value in sync.read().split()]
+
+    def test_watermark_follows_appends(self) -> None:
+        self.assertEqual(self.synced(), [os.stat(self.path).st_ino,
+                                         os.path.getsize(self.path)])
+
+    def test_append_after_shrinking_patch_is_synced(self) -> None:
+        patched = row(500, 'д')
+        patched.id = 2
+        self.storage.replace(1, patched)
+        self.assertEqual(self.synced()[1], os.path.getsize(self.path))
+
+        synced = []
+        fsync = os.fsync
+        os.fsync = lambda fd: (synced.append(fd), fsync(fd))
+        try:
+            self.storage.extend([row(1, 'd')])
+        finally:
+            os.fsync = fsync
+        self.assertTrue(synced)
+
+    def test_writers_keep_ids_and_balance(self) -> None:
+        other = CsvStorage(self.path)
+        self.addCleanup(other.close)
+        for i in range(5):
+            (self.storage if i % 2 else other).extend([row(10, str(i))])
+
+        data = CsvStorage(self.path).load()
+        self.assertEqual(list(data.ids), list(range(1, 9)))
+        self.assertEqual(data.balances[-1], -950)
+        self.assertEqual(self.storage.verify(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
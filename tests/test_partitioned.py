@@ -0,0 +1,211 @@
+"""Секционированное хранилище: дописывание, манифест, сжатие и проверка"""
+import json
+import os
+import tempfile
+import unittest
+
+from ledger import Category, Transaction, parse_date
+from storage import PartitionedStorage, open_storage
+
+
+def row(date: str, category: Category, amount: int,
+        description: str) -> Transaction:
+    return Transaction(0, parse_date(date), category, amount, description, 0)
+
+
+class PartitionedExtendTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'database.parts')
+        self.storage = PartitionedStorage(self.path)
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(self.storage.close)
+        self.storage.extend([row('15.01.2024', Category.INCOME, 1000, 'а')])
+        # Индексы строятся до дописывания и дальше обновляются
+        self.storage.indexes()
+        self.storage.text_index()
+        self.storage.rollups()
+
+    def reopen(self) -> PartitionedStorage:
+        storage = PartitionedStorage(self.path)
+        self.addCleanup(storage.close)
+        return storage
+
+    def test_extend_many_rows_updates_indexes(self) -> None:
+        self.storage.extend([
+            row('01.02.2024', Category.INCOME, 500, 'первый'),
+            row('10.03.2024', Category.EXPENSE, 200, 'второй'),
+            row('01.02.2025', Category.INCOME, 2000, 'третий')])
+
+        storage = self.storage
+        self.assertEqual(
+            [storage.load()[i].id
+             for i in storage.positions('category', Category.INCOME,
+                                        Category.INCOME)],
+            [1, 2, 4])
+        self.assertEqual(list(storage.text_positions('первый')), [1])
+        self.assertEqual(storage.balance_at(parse_date('01.02.2024')), 1500)
+        self.assertEqual(storage.balance_at(parse_date('31.12.2024')), 1300)
+
+        fresh = self.reopen()
+        for field, low, high in (
+                ('category', Category.INCOME, Category.INCOME),
+                ('category', Category.EXPENSE, Category.EXPENSE),
+                ('date', None, None), ('amount', 300, None)):
+            self.assertEqual(list(storage.positions(field, low, high)),
+                             list(fresh.positions(field, low, high)))
+        self.assertEqual(storage.rollup('month', None, None),
+                         fresh.rollup('month', None, None))
+
+    def test_extend_across_checkpoints(self) -> None:
+        self.storage.CHECKPOINT_EVERY = 4
+        self.storage._indexes = None
+        self.storage.indexes()
+        dates = ['03.01.2024', '20.02.2023', '05.05.2024', '01.01.2022',
+                 '15.01.2024', '30.12.2025', '02.02.2024']
+        self.storage.extend([
+            row(date, Category.EXPENSE if i % 2 else Category.INCOME,
+                100 * (i + 1), f'запись {i}')
+            for i, date in enumerate(dates)])
+
+        fresh = self.reopen()
+        fresh.CHECKPOINT_EVERY = 4
+        for date in dates + ['31.12.2021', '31.12.2026']:
+            self.assertEqual(self.storage.balance_at(parse_date(date)),
+                             fresh.balance_at(parse_date(date)))
+
+
+class PartitionedManifestTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'database.parts')
+        self.storage = self.reopen()
+        self.storage.extend([
+            row('15.06.2022', Category.INCOME, 1000, 'а'),
+            row('01.02.2023', Category.EXPENSE, 300, 'б'),
+            row('10.03.2023', Category.EXPENSE, 200, 'в'),
+            row('05.01.2024', Category.INCOME, 50, 'г')])
+
+    def reopen(self) -> PartitionedStorage:
+        storage = PartitionedStorage(self.path)
+        self.addCleanup(storage.close)
+        return storage
+
+    def manifest(self) -> dict:
+        with open(os.path.join(self.path, 'manifest.json'),
+                  encoding='UTF-8') as file:
+            return json.load(file)
+
+    def test_partition_per_year(self) -> None:
+        partitions = self.manifest()['partitions']
+        self.assertEqual([entry['file'] for entry in partitions],
+                         ['2022.csv', '2023.csv', '2024.csv'])
+        self.assertEqual([entry['rows'] for entry in partitions], [1, 2, 1])
+        self.assertEqual(
+            [(entry['first_id'], entry['last_id']) for entry in partitions],
+            [(1, 1), (2, 3), (4, 4)])
+        self.assertEqual([entry['closing'] for entry in partitions],
+                         [1000, 500, 550])
+
+    def test_queries_read_only_matching_partitions(self) -> None:
+        storage = self.reopen()
+        data = storage.load()
+        self.assertEqual(
+            storage.positions('date', parse_date('01.01.2023'),
+                              parse_date('31.12.2023')),
+            [1, 2])
+        self.assertEqual(storage.balance_at(parse_date('01.03.2023')), 700)
+        self.assertEqual(sorted(data.loaded), [1])
+        self.assertEqual(storage.read_last().balance, 550)
+
+    def test_patch_shifts_later_partitions(self) -> None:
+        patched = row('15.06.2022', Category.INCOME, 2000, 'а')
+        patched.id = 1
+        self.storage.replace(0, patched)
+
+        data = self.reopen().load()
+        self.assertEqual([trans.balance for trans in data.rows()],
+                         [2000, 1700, 1500, 1550])
+        self.assertEqual(self.reopen().verify(), [])
+
+    def test_compress_keeps_records(self) -> None:
+        before = [(trans.id, trans.balance)
+                  for trans in self.reopen().load().rows()]
+        self.assertEqual(self.storage.compress(keep=1), 2)
+
+        partitions = self.manifest()['partitions']
+        self.assertEqual([entry['compressed'] for entry in partitions],
+                         [True, True, False])
+        self.assertEqual([(trans.id, trans.balance)
+                          for trans in self.reopen().load().rows()], before)
+
+        # Запись в сжатую секцию переписывает её без сжатия
+        self.assertEqual(self.storage.compress(keep=0), 1)
+        self.storage.extend([row('20.12.2024', Category.EXPENSE, 5, 'д')])
+        self.assertEqual(
+            [entry['compressed'] for entry in self.manifest()['partitions']],
+            [True, True, False])
+        self.assertEqual(self.reopen().read_last().balance, 545)
+        self.assertEqual(self.reopen().verify(), [])
+
+
+class PartitionedRepairTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'database.parts')
+        storage = PartitionedStorage(self.path)
+        storage.period = 'month'
+        storage.extend([
+            row('15.01.2024', Category.INCOME, 1000, 'а'),
+            row('01.02.2024', Category.EXPENSE, 300, 'б')])
+        storage.close()
+
+    def test_repair_keeps_monthly_partitions(self) -> None:
+        storage = PartitionedStorage(self.path)
+        self.addCleanup(storage.close)
+        files = sorted(os.listdir(self.path))
+        self.assertEqual(len(files), 3)
+
+        # Испорченный баланс второй записи: repair сохранит всё заново
+        part = os.path.join(self.path, '2024-02.csv')
+        with open(part, encoding='UTF-8') as file:
+            text = file.read()
+        with open(part, 'w', encoding='UTF-8') as file:
+            file.write(text.replace(',7.00\n', ',9.00\n'))
+        self.assertEqual(storage.repair(), 1)
+
+        with open(os.path.join(self.path, 'manifest.json'),
+                  encoding='UTF-8') as file:
+            manifest = json.load(file)
+        self.assertEqual(manifest['period'], 'month')
+        self.assertEqual(len(manifest['partitions']), 2)
+        self.assertEqual(sorted(os.listdir(self.path)), files)
+        self.assertEqual(
+            [trans.balance for trans in PartitionedStorage(self.path).load()],
+            [1000, 700])
+
+
+class PartitionedReadonlyTest(unittest.TestCase):
+
+    def test_readonly_source_leaves_no_lock_file(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'source.parts')
+        storage = PartitionedStorage(path)
+        storage.extend([row('15.01.2024', Category.INCOME, 1000, 'а')])
+        storage.close()
+        os.remove(path + '.lock')
+
+        source = open_storage(path, readonly=True)
+        self.addCleanup(source.close)
+        self.assertEqual([trans.id for trans in source.load()], [1])
+        self.assertFalse(os.path.exists(path + '.lock'))
+
+
+if __name__ == '__main__':
+    unittest.main()
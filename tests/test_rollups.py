@@ -0,0 +1,117 @@
+"""Сводки по дням, месяцам и годам и команда report"""
+import collections
+import os
+import random
+import tempfile
+import unittest
+
+from ledger import Category, Transaction, month_of, parse_date
+from main import BudgetTracker
+from storage import STORAGES, Storage
+
+
+START: int = parse_date('20.12.2023')
+
+
+def expected(storage: Storage, by: str) -> list:
+    """Сводка прямым подсчётом по всем записям"""
+    totals = collections.defaultdict(lambda: [0, 0])
+    for trans in storage.load().rows():
+        key = {'day': trans.date, 'month': month_of(trans.date),
+               'year': month_of(trans.date) // 12}[by]
+        totals[key][trans.category == Category.EXPENSE] += trans.amount
+    return [(key, income, expense)
+            for key, (income, expense) in sorted(totals.items())
+            if income or expense]
+
+
+class RollupTest(unittest.TestCase):
+
+    def check(self, kind: str, suffix: str) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        storage: Storage = STORAGES[kind](
+            os.path.join(tmp.name, 'database' + suffix))
+        self.addCleanup(storage.close)
+        rng = random.Random(kind)
+
+        def rows(count: int) -> list:
+            return [Transaction(
+                0, START + rng.randrange(90), rng.choice(list(Category)),
+                rng.randrange(1, 10_000), 'x', 0) for _ in range(count)]
+
+        storage.extend(rows(20))
+        storage.rollups()
+        for step in range(10):
+            if step % 2:
+                index = rng.randrange(len(storage.load()))
+                patched = rows(1)[0]
+                patched.id = storage.load()[index].id
+                storage.replace(index, patched)
+            else:
+                storage.extend(rows(3))
+            for by in ('day', 'month', 'year'):
+                self.assertEqual(
+                    [tuple(period) for period in
+                     storage.rollup(by, None, None)],
+                    expected(storage, by), (kind, step, by))
+
+        month = month_of(parse_date('15.01.2024'))
+        self.assertEqual(
+            [tuple(period) for period in storage.rollup('month', month,
+                                                        month)],
+            [period for period in expected(storage, 'month')
+             if period[0] == month])
+
+    def test_csv(self) -> None:
+        self.check('csv', '.csv')
+
+    def test_partitioned(self) -> None:
+        self.check('partitioned', '.parts')
+
+    def test_sqlite(self) -> None:
+        self.check('sqlite', '.db')
+
+
+class ReportTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        interactive = BudgetTracker.INTERACTIVE
+        BudgetTracker.INTERACTIVE = False
+        self.addCleanup(setattr, BudgetTracker, 'INTERACTIVE', interactive)
+        BudgetTracker.configure(
+            'csv', os.path.join(tmp.name, 'database.csv'), None)
+        self.addCleanup(BudgetTracker.configure, None, 'database.csv', None)
+        for date, category, amount in (('31.12.2023', 'доход', '100'),
+                                       ('01.01.2024', 'расход', '30'),
+                                       ('15.01.2024', 'доход', '5.50')):
+            BudgetTracker.execute(['add', '--date', date, '--category',
+                                   category, '--amount', amount,
+                                   '--desc', 'x'])
+
+    def report(self, *argv: str) -> str:
+        result = BudgetTracker.execute(['report', *argv])
+        return result if isinstance(result, str) else ''.join(result)
+
+    def test_by_month_with_bounds(self) -> None:
+        lines = self.report('--by', 'month', '--from', '01.2024').split('\n')
+        self.assertEqual([line.split() for line in lines
+                          if line.startswith(('01.', 'Всего'))],
+                         [['01.2024', '5.50', '30.00', '-24.50'],
+                          ['Всего', '5.50', '30.00', '-24.50']])
+
+    def test_by_year(self) -> None:
+        text = self.report('--by', 'year')
+        self.assertIn('2023', text)
+        self.assertIn('2024', text)
+
+    def test_bad_bound(self) -> None:
+        self.assertEqual(
+            self.report('--by', 'month', '--from', '13.2024'),
+            'Параметр не введен или введён неверно: --from 13.2024')
+
+
+if __name__ == '__main__':
+    unittest.main()
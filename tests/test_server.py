@@ -0,0 +1,60 @@
+"""Сервер кошелька: разбор запросов и пачки команд записи"""
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from main import BudgetTracker
+from server import Server
+
+
+class ServerTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        interactive = BudgetTracker.INTERACTIVE
+        BudgetTracker.INTERACTIVE = False
+        self.addCleanup(setattr, BudgetTracker, 'INTERACTIVE', interactive)
+        BudgetTracker.configure(
+            'csv', os.path.join(tmp.name, 'database.csv'), None)
+        self.addCleanup(BudgetTracker.configure, None, 'database.csv', None)
+        self.server = Server()
+
+    async def respond(self, request: object) -> dict:
+        return await self.server.respond(json.dumps(request).encode())
+
+    async def test_malformed_requests_echo_id(self) -> None:
+        for request in ({'id': 7, 'argv': 'add'}, {'id': 8, 'command': None},
+                        {'id': 9, 'command': 5}, {'id': 10}):
+            response = await self.respond(request)
+            self.assertEqual(response['id'], request['id'])
+            self.assertIn('error', response)
+        response = await self.server.respond(b'[1, 2]')
+        self.assertIsNone(response['id'])
+        self.assertIn('error', response)
+
+    async def test_batched_adds_then_read(self) -> None:
+        writer = asyncio.create_task(self.server.writer())
+        self.addAsyncCleanup(self.stop, writer)
+        responses = await asyncio.gather(*(
+            self.respond({'id': i, 'argv': [
+                'add', '--date', '01.01.2024', '--category', 'доход',
+                '--amount', str(i), '--desc', f'запись {i}']})
+            for i in range(1, 6)))
+        self.assertEqual([response['id'] for response in responses],
+                         [1, 2, 3, 4, 5])
+        self.assertTrue(all('output' in response for response in responses))
+
+        response = await self.respond({'id': 6, 'command': 'balance'})
+        self.assertIn('15.00', response['output'])
+
+    async def stop(self, task: asyncio.Task) -> None:
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+
+if __name__ == '__main__':
+    unittest.main()
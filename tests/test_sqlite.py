@@ -0,0 +1,69 @@
+"""Хранилище SQLite: поиск и изменение записи без чтения всех записей"""
+import os
+import tempfile
+import unittest
+
+from ledger import Category, Transaction, parse_date
+from storage import SqliteStorage
+
+
+def row(date: str, category: Category, amount: int,
+        description: str = 'x') -> Transaction:
+    return Transaction(0, parse_date(date), category, amount, description, 0)
+
+
+class SqliteColdTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'database.db')
+        storage = SqliteStorage(self.path)
+        storage.extend([
+            row('01.01.2024', Category.INCOME, 1000),
+            row('02.01.2024', Category.EXPENSE, 300),
+            row('03.01.2024', Category.INCOME, 50),
+            row('04.01.2024', Category.EXPENSE, 20)])
+        storage.close()
+
+    def cold(self) -> SqliteStorage:
+        """Хранилище, которому запрещено читать все записи"""
+        storage = SqliteStorage(self.path)
+        self.addCleanup(storage.close)
+        storage.read = self.fail
+        return storage
+
+    def test_positions_without_load(self) -> None:
+        storage = self.cold()
+        self.assertEqual(
+            storage.positions('category', Category.INCOME, Category.INCOME),
+            [0, 2])
+        self.assertEqual(
+            storage.positions('date', parse_date('02.01.2024'), None),
+            [1, 2, 3])
+
+    def test_replace_without_load(self) -> None:
+        patched = row('02.01.2024', Category.INCOME, 100, 'изменена')
+        patched.id = 2
+        self.cold().replace(1, patched)
+
+        data = SqliteStorage(self.path)
+        self.addCleanup(data.close)
+        self.assertEqual(
+            [(trans.id, trans.balance) for trans in data.load()],
+            [(1, 1000), (2, 1100), (3, 1150), (4, 1130)])
+        self.assertEqual(data.load()[1].description, 'изменена')
+        self.assertEqual(data.rollup('day', None, None)[1],
+                         (parse_date('02.01.2024'), 100, 0))
+
+    def test_gaps_in_ids_fall_back_to_load(self) -> None:
+        storage = SqliteStorage(self.path)
+        self.addCleanup(storage.close)
+        storage.connection.execute('DELETE FROM transactions WHERE id = 2')
+        self.assertEqual(
+            storage.positions('category', Category.INCOME, Category.INCOME),
+            [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
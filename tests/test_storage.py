@@ -0,0 +1,101 @@
+"""Хранилище csv: записи с описанием в несколько строк и их проверка"""
+import os
+import tempfile
+import unittest
+
+from ledger import Category, Transaction, parse_date
+from storage import CsvStorage
+
+
+def row(amount: int, description: str) -> Transaction:
+    return Transaction(0, parse_date('01.01.2024'), Category.EXPENSE,
+                       amount, description, 0)
+
+
+class MultilineDescriptionTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'database.csv')
+        self.storage = CsvStorage(self.path)
+        self.storage.extend([
+            row(100, 'a'), row(500, 'две\n"строки"'), row(300, 'c')])
+
+    def tearDown(self) -> None:
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def reopen(self) -> CsvStorage:
+        """Новое хранилище того же файла, без записей в памяти"""
+        storage = CsvStorage(self.path)
+        self.addCleanup(storage.close)
+        return storage
+
+    def test_patch_after_multiline_description(self) -> None:
+        patched = row(100, 'c2')
+        patched.id = 3
+        self.storage.replace(2, patched)
+
+        data = self.reopen().load()
+        self.assertEqual(
+            [(trans.id, trans.description, trans.balance)
+             for trans in data],
+            [(1, 'a', -100), (2, 'две\n"строки"', -600),
+             (3, 'c2', -700)])
+        self.assertEqual(self.reopen().verify(), [])
+
+    def test_patch_multiline_description(self) -> None:
+        patched = row(50, 'две\n"строки"')
+        patched.id = 2
+        self.storage.replace(1, patched)
+
+        data = self.reopen().load()
+        self.assertEqual([trans.balance for trans in data],
+                         [-100, -150, -450])
+        self.assertEqual(data[2].description, 'c')
+
+    def test_append_after_multiline_last_description(self) -> None:
+        storage = self.reopen()
+        storage.extend([row(1, 'строка\n' + 'x' * 5000)])
+        self.assertEqual(storage.read_last().id, 4)
+        self.reopen().extend([row(2, 'd')])
+
+        data = self.reopen().load()
+        self.assertEqual([trans.id for trans in data], [1, 2, 3, 4, 5])
+        self.assertEqual(data[-1].balance, -903)
+        self.assertEqual(self.reopen().verify(), [])
+
+
+class CsvVerifyTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'database.csv')
+        storage = CsvStorage(self.path)
+        # Строка внутри описания похожа на начало записи
+        storage.extend([row(100, 'a'), row(200, 'начало\n7,01.01.2024,"'),
+                        row(300, 'c'), row(400, 'д\n8,02.01.2024,x')])
+        storage.close()
+
+    def verify(self, chunk_size: int) -> list:
+        storage = CsvStorage(self.path)
+        self.addCleanup(storage.close)
+        storage.VERIFY_CHUNK_SIZE = chunk_size
+        return storage.verify()
+
+    def test_chunk_boundary_inside_description(self) -> None:
+        for chunk_size in (1, 16, 40, 2**20):
+            self.assertEqual(self.verify(chunk_size), [], chunk_size)
+
+    def test_broken_balance_is_reported(self) -> None:
+        with open(self.path, 'rb') as file:
+            text = file.read()
+        with open(self.path, 'wb') as file:
+            file.write(text.replace(b',-6.00\r\n', b',-7.00\r\n'))
+        for chunk_size in (1, 2**20):
+            self.assertEqual(len(self.verify(chunk_size)), 2, chunk_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Индекс описаний: поиск подстроки и файл индекса"""
+import json
+import os
+import tempfile
+import unittest
+
+from ledger import Category, Transaction, parse_date
+from storage import CsvStorage
+
+
+def row(description: str) -> Transaction:
+    return Transaction(0, parse_date('01.01.2024'), Category.EXPENSE, 100,
+                       description, 0)
+
+
+class TextIndexTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'database.csv')
+        self.storage = self.reopen()
+        self.storage.extend([row('Кофе'), row('две\n"строки"'), row('кафе'),
+                             row('такси')])
+
+    def reopen(self) -> CsvStorage:
+        storage = CsvStorage(self.path)
+        self.addCleanup(storage.close)
+        return storage
+
+    def test_search_ignores_case(self) -> None:
+        self.assertEqual(list(self.storage.text_positions('КОФ')), [0])
+        self.assertEqual(list(self.storage.text_positions('фе')), [0, 2])
+        self.assertEqual(list(self.storage.text_positions('метро')), [])
+
+    def test_index_follows_changes(self) -> None:
+        self.storage.text_positions('коф')
+        self.storage.extend([row('кофейня')])
+        patched = row('метро')
+        patched.id = 1
+        self.storage.replace(0, patched)
+        self.assertEqual(list(self.storage.text_positions('коф')), [4])
+        self.assertEqual(list(self.storage.text_positions('метро')), [0])
+
+    def test_index_file_is_json(self) -> None:
+        self.assertEqual(list(self.storage.text_positions('строк')), [1])
+        self.storage.extend([row('ещё "строки"')])
+
+        storage = self.reopen()
+        storage.load()
+        self.assertIsNotNone(storage._read_text_index())
+        self.assertEqual(list(storage.text_positions('строк')), [1, 4])
+        with open(self.path + '.fts', encoding='UTF-8') as file:
+            for line in file:
+                json.loads(line)
+
+    def test_stale_or_foreign_file_is_rebuilt(self) -> None:
+        self.storage.text_positions('такси')
+        with open(self.path + '.fts', 'wb') as file:
+            file.write(b'\x80\x04\x95 not json')
+        storage = self.reopen()
+        storage.load()
+        self.assertIsNone(storage._read_text_index())
+        self.assertEqual(list(storage.text_positions('такси')), [3])
+
+
+if __name__ == '__main__':
+    unittest.main()
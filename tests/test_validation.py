@@ -0,0 +1,70 @@
+"""Проверка значений полей: по одному значению и по столбцу"""
+import unittest
+
+from ledger import Category, parse_cents, parse_date
+from validation import (
+    check_amount, check_amounts, check_categories, check_category,
+    check_date, check_dates, check_month, check_year)
+
+
+class SingleValueTest(unittest.TestCase):
+
+    def test_date(self) -> None:
+        self.assertEqual(check_date('29.02.2024'), parse_date('29.02.2024'))
+        for value in ('30.02.2024', '1.1.2024', '01.13.2024', '01.01.24',
+                      ' 01.01.2024', ''):
+            self.assertIsNone(check_date(value), value)
+
+    def test_amount(self) -> None:
+        for value in ('0', '5', '5.5', '5.05', '1234.56', '0.125'):
+            self.assertEqual(check_amount(value), parse_cents(value), value)
+        for value in ('-1', '1,5', '.5', '5.', 'abc', ''):
+            self.assertIsNone(check_amount(value), value)
+
+    def test_category(self) -> None:
+        self.assertEqual(check_category('доход'), Category.INCOME)
+        self.assertEqual(check_category('расход'), Category.EXPENSE)
+        self.assertIsNone(check_category('Доход'))
+
+    def test_month_and_year(self) -> None:
+        self.assertEqual(check_month('01.2024'), 2024 * 12)
+        self.assertEqual(check_month('12.2023'), 2023 * 12 + 11)
+        for value in ('13.2024', '00.2024', '1.2024', '01.24'):
+            self.assertIsNone(check_month(value), value)
+        self.assertEqual(check_year('2024'), 2024)
+        for value in ('24', '20x4', '02024'):
+            self.assertIsNone(check_year(value), value)
+
+
+class ColumnTest(unittest.TestCase):
+
+    def test_column_matches_single_values(self) -> None:
+        dates = ['01.01.2024', '31.02.2024', '01.01.2024', 'x']
+        amounts = ['1.00', '2.5', '-3', '4.00']
+        categories = ['доход', 'расход', 'зарплата', 'доход']
+        for check, column, values in (
+                (check_date, check_dates, dates),
+                (check_amount, check_amounts, amounts),
+                (check_category, check_categories, categories)):
+            parsed, errors = column(values)
+            self.assertEqual(parsed, [check(value) for value in values])
+            self.assertEqual(
+                [index for index, _ in errors],
+                [index for index, value in enumerate(values)
+                 if check(value) is None])
+
+    def test_amount_column_fast_path(self) -> None:
+        parsed, errors = check_amounts(['1.00', '0.05', '123.45'])
+        self.assertEqual((parsed, errors), ([100, 5, 12345], []))
+        # Перевод строки внутри значения не склеивает две суммы
+        parsed, errors = check_amounts(['1.00\n2.00', '3.00'])
+        self.assertEqual(parsed, [None, 300])
+        self.assertEqual([index for index, _ in errors], [0])
+
+    def test_errors_name_the_value(self) -> None:
+        _, errors = check_dates(['01.01.2024', '32.01.2024'])
+        self.assertEqual(errors, [(1, 'некорректная дата "32.01.2024"')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Проверка и разбор значений полей записи: дат дд.мм.гггг, сумм и
+категорий, а также границ сводок - месяцев мм.гггг и лет гггг. Шаблоны
+компилируются один раз при импорте модуля.
+check_date, check_month, check_year, check_amount и check_category
+разбирают одно значение и возвращают None, если оно некорректно.
+check_dates, check_amounts и check_categories разбирают сразу столбец
+значений и возвращают разобранные значения вместе с ошибками по
+строкам, поэтому значение разбирается один раз - и для проверки, и для
+загрузки
+"""
+from typing import Dict, List, Sequence, Tuple
+import datetime
+import re
+
+from ledger import Category, parse_cents
+
+
+DATE_PATTERN = re.compile(
+    r'(0[1-9]|[12][0-9]|3[01])\.(0[1-9]|1[012])\.(\d{4})')
+MONTH_PATTERN = re.compile(r'(0[1-9]|1[012])\.(\d{4})')
+YEAR_PATTERN = re.compile(r'\d{4}')
+# Неотрицательное число, дробная часть - через точку
+AMOUNT_PATTERN = re.compile(r'(\d+)(?:\.(\d+))?')
+# Столбец сумм в формате файла (ровно два знака после точки), по одной
+# на строку: проверяется одним вызовом
+AMOUNT_COLUMN_PATTERN = re.compile(r'(?:[0-9]+\.[0-9]{2}\n)*')
+
+CATEGORIES: Dict[str, Category] = {
+    category.label: category for category in Category}
+
+# Ошибки столбца: (номер значения в столбце, описание)
+Errors = List[Tuple[int, str]]
+
+
+def check_date(value: str) -> int | None:
+    """Порядковый номер дня для даты дд.мм.гггг или None"""
+    match = DATE_PATTERN.fullmatch(value)
+    if match is None:
+        return None
+    day, month, year = match.groups()
+    # Шаблон пропускает, например, 30 февраля
+    try:
+        return datetime.date(int(year), int(month), int(day)).toordinal()
+    except ValueError:
+        return None
+
+
+def check_month(value: str) -> int | None:
+    """Номер месяца для мм.гггг (см. ledger.month_of) или None"""
+    match = MONTH_PATTERN.fullmatch(value)
+    if match is None:
+        return None
+    month, year = match.groups()
+    return int(year) * 12 + int(month) - 1
+
+
+def check_year(value: str) -> int | None:
+    """Год гггг или None"""
+    return int(value) if YEAR_PATTERN.fullmatch(value) else None
+
+
+def check_amount(value: str) -> int | None:
+    """Сумма в копейках или None"""
+    match = AMOUNT_PATTERN.fullmatch(value)
+    if match is None:
+        return None
+    whole, fraction = match.groups()
+    if fraction is None:
+        return int(whole) * 100
+    if len(fraction) <= 2:
+        return int(whole) * 100 + int(fraction.ljust(2, '0'))
+    # Больше двух знаков после точки - округление, как в parse_cents
+    return parse_cents(value)
+
+
+def check_category(value: str) -> Category | None:
+    """Категория по названию доход/расход или None"""
+    return CATEGORIES.get(value)
+
+
+def _errors(values: Sequence[str], parsed: List, message: str) -> Errors:
+    """Ошибки столбца: значения, для которых разбор дал None"""
+    # Обычно ошибок нет, и поиск None быстрее перебора по номерам
+    if None not in parsed:
+        return []
+    return [(index, f'{message} "{values[index]}"')
+            for index, value in enumerate(parsed) if value is None]
+
+
+def check_dates(values: Sequence[str]) -> Tuple[List[int | None], Errors]:
+    """
+    Номера дней для столбца дат (None для некорректных) и ошибки.
+    Одинаковые даты разбираются один раз
+    """
+    dates: Dict[str, int | None] = {
+        value: check_date(value) for value in set(values)}
+    parsed: List[int | None] = list(map(dates.__getitem__, values))
+    return parsed, _errors(values, parsed, 'некорректная дата')
+
+
+def check_amounts(values: Sequence[str]) -> Tuple[List[int | None], Errors]:
+    """
+    Суммы в копейках для столбца сумм (None для некорректных) и ошибки.
+    Столбец в формате файла проверяется одним шаблоном и разбирается
+    целиком, остальные - по значению
+    """
+    text: str = '\n'.join(values) + '\n'
+    # Перевод строки внутри значения склеил бы из него две суммы
+    if values and text.count('\n') == len(values) \
+            and AMOUNT_COLUMN_PATTERN.fullmatch(text):
+        return list(map(int, text.replace('.', '').split())), []
+    parsed: List[int | None] = list(map(check_amount, values))
+    return parsed, _errors(values, parsed, 'некорректная сумма')
+
+
+def check_categories(values: Sequence[str]
+                     ) -> Tuple[List[Category | None], Errors]:
+    """Категории для столбца названий (None для некорректных) и ошибки"""
+    parsed: List[Category | None] = list(map(CATEGORIES.get, values))
+    return parsed, _errors(values, parsed, 'некорректная категория')